@@ -13,6 +13,14 @@ pip install --upgrade markupsafe==1.1.1
 pip install --upgrade itsdangerous==1.1.0
 pip install --upgrade werkzeug==1.0.1
 
+# Async app for the I/O-bound endpoints
+pip install --upgrade starlette==0.27.0
+pip install --upgrade httpx==0.24.1
+pip install --upgrade uvicorn==0.22.0
+
+# Metrics
+pip install --upgrade prometheus-client==0.17.1
+
 # Testing
 pip install --upgrade flask-testing==0.8.1
 
@@ -27,3 +35,4 @@ pip install --upgrade pyjwt==2.1.0
 
 # Analysis
 pip install --upgrade pandas==1.4.1
+pip install --upgrade pyarrow==14.0.2
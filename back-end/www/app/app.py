@@ -2,6 +2,12 @@ from flask import Flask
 from flask_cors import CORS
 from models.model import db
 from models.schema import ma
+from util.rate_limit import init_rate_limit
+from util.metrics import init_metrics
+from util.query_counter import init_query_counter
+from util.profiler import init_profiler
+from util.error_log import init_error_log
+from models.answer_journal import init_answer_journal
 
 
 # Initialize the Web Server Gateway Interface
@@ -19,3 +25,21 @@ db.init_app(app)
 
 # Initialize app with schema
 ma.init_app(app)
+
+# Write the log records (e.g., the tracebacks of unexpected errors) in a background thread
+init_error_log(app, max_size=app.config["LOG_QUEUE_SIZE"])
+
+# Reject the requests over the rate limits or the concurrency limits (before the other request hooks)
+init_rate_limit(app)
+
+# Record the request metrics (see the /metrics endpoint)
+init_metrics(app)
+
+# Count the SQL queries of each request (and warn about possible N+1 queries)
+init_query_counter(app)
+
+# Profile the sampled requests and the requests with the admin X-Profile-Token header (see merge_profiles.py)
+init_profiler(app)
+
+# Write the answers to a local journal and flush them to the database in batches (if ANSWER_WRITE_BEHIND is on)
+init_answer_journal(app)
@@ -1,6 +1,7 @@
-from flask_migrate import Migrate
+import os
 from app.app import app
 from models.model import db
+from models.replica import dispose_engines
 from controllers import root
 from controllers import template_controller
 from controllers import photos_controller
@@ -12,6 +13,10 @@ from controllers import vision_controller
 from controllers import mood_controller
 from controllers import answer_controller
 from controllers import game_controller
+from controllers import status_controller
+from controllers import metrics_controller
+from controllers import purge_controller
+from controllers import experiment_controller
 
 
 # Register all routes to the blueprint
@@ -26,6 +31,20 @@ app.register_blueprint(vision_controller.bp, url_prefix="/vision")
 app.register_blueprint(mood_controller.bp, url_prefix="/mood")
 app.register_blueprint(answer_controller.bp, url_prefix="/answer")
 app.register_blueprint(game_controller.bp, url_prefix="/game")
+app.register_blueprint(status_controller.bp, url_prefix="/status")
+app.register_blueprint(purge_controller.bp, url_prefix="/purge")
+app.register_blueprint(experiment_controller.bp, url_prefix="/experiment")
+app.register_blueprint(metrics_controller.bp)
 
-# Set database migration
-migrate = Migrate(app, db)
+# Set database migration (only for the "flask" command, since importing alembic slows down the uwsgi workers)
+if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
+
+# The uwsgi master loads this app and then forks the workers (with all the modules already imported),
+# so each worker needs its own database connection pools
+try:
+    from uwsgidecorators import postfork
+    postfork(lambda: dispose_engines(app))
+except ImportError:
+    pass
@@ -0,0 +1,276 @@
+"""
+The asynchronous (ASGI) entry point for the I/O-bound endpoints.
+
+The /photos/random (Unsplash API) and /login/ (Google Sign-In API) endpoints spend most of their time
+waiting for the upstream servers, which blocks a whole uwsgi process in the synchronous app.
+This app serves the same endpoints on an event loop with an async HTTP client,
+so that one process can wait for many upstream requests at the same time.
+The database queries of the login endpoint run in a thread pool (with the Flask app context).
+
+The endpoints handle the errors in the same way as the try_wrap_response decorator of the sync app
+(the unexpected errors are logged with an error ID by the logger of the Flask app),
+and they have the same RATE_LIMITS as their blueprints in the sync app (see the limit_rate decorator).
+
+Usage:
+    COCTEAU_ENV=production COCTEAU_RATE_LIMIT_TRUST_PROXY=1 uvicorn application_async:app --host 127.0.0.1 --port 8082
+Then let the reverse proxy send the /photos/ and /login/ paths to this app (and the other paths to uwsgi).
+See load_test_async.py for comparing the throughput of the two apps when the upstream is slow.
+"""
+
+import time
+import math
+import asyncio
+import functools
+import contextlib
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.responses import JSONResponse
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from google.auth import jwt as google_jwt
+from app.app import app as flask_app
+from config.config import config
+from util.util import InvalidUsage
+from util.util import decode_jwt
+from util.util import log_unexpected_error
+from util.rate_limit import LocalStore
+from controllers.login_controller import get_user_token_by_client_id
+
+
+# The Google certificates (in the PEM format) for verifying the Google ID tokens
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
+# The valid issuers of the Google ID tokens
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+
+
+class GoogleCerts(object):
+    """
+    Cache of the Google certificates.
+
+    The certificates are fetched again after they expire (based on the Cache-Control header),
+    and concurrent requests wait for the same fetch.
+    """
+    def __init__(self):
+        self.certs = None
+        self.expires_at = 0
+        self.lock = asyncio.Lock()
+
+    async def get(self, client):
+        async with self.lock:
+            if self.certs is None or time.monotonic() >= self.expires_at:
+                r = await client.get(GOOGLE_CERTS_URL)
+                r.raise_for_status()
+                self.certs = r.json()
+                self.expires_at = time.monotonic() + get_max_age(r.headers.get("cache-control", ""))
+            return self.certs
+
+
+def get_max_age(cache_control):
+    """Get the max-age (in seconds) of a Cache-Control header (zero if there is none)."""
+    for directive in cache_control.split(","):
+        k, _, v = directive.strip().partition("=")
+        if k.lower() == "max-age" and v.isdigit():
+            return int(v)
+    return 0
+
+
+def error_response(error):
+    """Return the error message of an InvalidUsage object (like the handle_invalid_usage function)."""
+    return JSONResponse(error.to_dict(), status_code=error.status_code)
+
+
+def unexpected_error_response(request, ex, where, message="Unexpected error", status_code=400):
+    """Log an unexpected exception and return the message with the error ID (like the handle_unexpected_error function)."""
+    error_id = log_unexpected_error(ex, where, logger=request.app.state.flask_app.logger)
+    return error_response(InvalidUsage("%s (error ID: %s)." % (message, error_id), status_code=status_code))
+
+
+def try_wrap_response(func):
+    """
+    The async version of the try_wrap_response decorator in util/util.py.
+
+    An InvalidUsage is returned to the client with its message and without logging.
+    Other exceptions are logged with the traceback, and the client only gets an error ID.
+    """
+    @functools.wraps(func)
+    async def inner_function(request):
+        try:
+            return await func(request)
+        except InvalidUsage as ex:
+            return error_response(ex)
+        except Exception as ex:
+            return unexpected_error_response(request, ex, func.__name__)
+    return inner_function
+
+
+def limit_rate(blueprint):
+    """
+    A decorator that applies the RATE_LIMITS of a blueprint of the sync app to an endpoint (see util/rate_limit.py).
+
+    The buckets are kept in the memory of each process (the uwsgi cache is only available in uwsgi).
+    MAX_CONCURRENCY is not applied, since it keeps some uwsgi workers for the other endpoints,
+    and a request that waits for the upstream does not hold a worker in this app
+    (the database queries are limited by the size of the thread pool instead).
+
+    Parameters
+    ----------
+    blueprint : str
+        Name of the blueprint of the same endpoint in the sync app (a key in RATE_LIMITS).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def inner_function(request):
+            flask_config = request.app.state.flask_app.config
+            limits = flask_config.get("RATE_LIMITS", {}).get(blueprint, {})
+            limit = limits.get(request.method, limits.get("*"))
+            if flask_config.get("RATE_LIMIT_ENABLED", True) and limit is not None:
+                rate, burst = limit
+                key = "bucket:%s:%s:%s" % (blueprint, request.method, get_client_key(request))
+                allowed, retry_after = request.app.state.rate_limit_store.take(key, rate, burst)
+                if not allowed:
+                    response = error_response(InvalidUsage("Too many requests.", status_code=429))
+                    response.headers["Retry-After"] = str(max(math.ceil(retry_after), 1))
+                    return response
+            return await func(request)
+        return inner_function
+    return decorator
+
+
+def get_client_key(request):
+    """Get the user ID in the user token of the URL query, or the client IP address (like util/rate_limit.py)."""
+    token = request.query_params.get("user_token")
+    if token is not None:
+        try:
+            return "user:%s" % decode_jwt(token, config.JWT_PRIVATE_KEY)["user_id"]
+        except Exception:
+            pass # the endpoint rejects the invalid token
+    forwarded = request.headers.get("x-forwarded-for")
+    if request.app.state.flask_app.config.get("RATE_LIMIT_TRUST_PROXY", False) and forwarded:
+        # The last address is added by our reverse proxy (the others can be faked by the client)
+        return "ip:%s" % forwarded.split(",")[-1].strip()
+    return "ip:%s" % (None if request.client is None else request.client.host)
+
+
+@try_wrap_response
+@limit_rate("photos_controller")
+async def get_random_photos(request):
+    """The async version of photos_controller.get_random_photos."""
+    url = config.UNSPLASH_API_URL + "/photos/random/?client_id=" + config.UNSPLASH_ACCESS_KEY
+    query_str = request.url.query
+    if len(query_str) != 0:
+        url = url + "&" + query_str
+    r = await request.app.state.http_client.get(url)
+    if r.status_code != 200:
+        return error_response(InvalidUsage(r.text, status_code=r.status_code))
+    return JSONResponse(r.json())
+
+
+@try_wrap_response
+@limit_rate("login_controller")
+async def login(request):
+    """The async version of login_controller.login."""
+    try:
+        request_json = await request.json()
+    except ValueError:
+        request_json = None
+    client_id = None
+    if isinstance(request_json, dict):
+        if "google_id_token" in request_json:
+            try:
+                id_info = await verify_google_id_token(request.app, request_json["google_id_token"])
+                client_id = "google.%s" % id_info["sub"]
+            except ValueError:
+                # An expected error of the input (not logged)
+                return error_response(InvalidUsage("Invalid Google ID token.", status_code=401))
+            except Exception as ex:
+                return unexpected_error_response(request, ex, "verify_google_id_token",
+                        message="Cannot verify the Google ID token", status_code=401)
+        elif "client_id" in request_json:
+            client_id = request_json["client_id"]
+
+    # Get user id by client id, and issued an user jwt
+    if client_id is None:
+        e = InvalidUsage("Must have either 'google_id_token' or 'client_id'.", status_code=400)
+        return error_response(e)
+    user_token = await run_in_threadpool(get_user_token_in_app_context, request.app.state.flask_app, client_id)
+    if user_token is None:
+        return error_response(InvalidUsage("Permission denied.", status_code=403))
+    return JSONResponse({"user_token": user_token})
+
+
+async def verify_google_id_token(app, token):
+    """
+    Verify a Google ID token (like the google.oauth2.id_token.verify_oauth2_token function).
+
+    Parameters
+    ----------
+    app : starlette.applications.Starlette
+        The async app (that has the HTTP client and the certificate cache).
+    token : str
+        The token obtained from the Google Sign-In API.
+
+    Returns
+    -------
+    dict
+        The decoded token.
+
+    Raises
+    ------
+    ValueError
+        If the token is invalid.
+    """
+    certs = await app.state.google_certs.get(app.state.http_client)
+    id_info = google_jwt.decode(token, certs=certs, audience=config.GOOGLE_SIGNIN_CLIENT_ID)
+    if id_info["iss"] not in GOOGLE_ISSUERS:
+        raise ValueError("Wrong issuer: %s" % id_info["iss"])
+    return id_info
+
+
+def get_user_token_in_app_context(app, client_id):
+    """Get the user token in a Flask app context (for the database session)."""
+    with app.app_context():
+        return get_user_token_by_client_id(client_id)
+
+
+def create_app(flask_app, transport=None):
+    """
+    Create the async app.
+
+    Parameters
+    ----------
+    flask_app : flask.Flask
+        The Flask app (for the database settings).
+    transport : httpx.AsyncBaseTransport
+        The transport of the HTTP client (None means the default network transport).
+
+    Returns
+    -------
+    starlette.applications.Starlette
+        The ASGI app.
+    """
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        limits = httpx.Limits(max_connections=config.UPSTREAM_MAX_CONNECTIONS)
+        async with httpx.AsyncClient(timeout=config.UPSTREAM_TIMEOUT, limits=limits, transport=transport) as client:
+            app.state.http_client = client
+            # Create the cache in the event loop of the server
+            app.state.google_certs = GoogleCerts()
+            yield
+
+    middleware = []
+    if flask_app.config["ENV"] == "development":
+        # Setup CORS for development (so that localhost works)
+        middleware.append(Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]))
+    routes = [
+        Route("/photos/random", get_random_photos, methods=["GET"]),
+        Route("/login/", login, methods=["POST"])]
+    app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+    app.state.flask_app = flask_app
+    app.state.rate_limit_store = LocalStore()
+    return app
+
+
+app = create_app(flask_app)
@@ -1,42 +1,245 @@
+"""
+The settings of the application.
+
+The environment is selected by the COCTEAU_ENV environment variable
+("staging" by default, "production", "development", or "testing").
+The secrets are read from the files in the "back-end/secret/" directory when they are first used
+(only the ones of the selected environment), and each file is read only once.
+The performance settings can be changed by the environment variables with the "COCTEAU_" prefix,
+for example, COCTEAU_DB_POOL_SIZE=10 (see the Config class for the available settings).
+"""
+
+import os
+import functools
 from pathlib import Path
 from os.path import abspath, join, dirname
+from models.pool import engine_options
 
 
 secret_dir = abspath(join(dirname( __file__ ), "..", "..", "secret"))
 
+# The prefix of the environment variables for the settings
+ENV_PREFIX = "COCTEAU_"
+
+
+@functools.lru_cache(maxsize=None)
+def read_secret(file_name, optional=False):
+    """
+    Read a secret file (only once).
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file in the secret directory.
+    optional : bool
+        Return None if the file does not exist (instead of raising an exception).
+
+    Returns
+    -------
+    str or None
+        The content of the file without the leading and trailing whitespace.
+
+    Raises
+    ------
+    exception : Exception
+        When the file does not exist and is not optional.
+    """
+    p = Path(join(secret_dir, file_name))
+    if not p.exists():
+        if optional:
+            return None
+        raise Exception("Secret file '%s' is missing in %s." % (file_name, secret_dir))
+    return p.read_text().strip()
+
+
+def env(name, default):
+    """
+    Get a setting from the environment variable (ENV_PREFIX + name).
+
+    The value is converted to the type of the default value.
+    For booleans, "1", "true", "yes", and "on" mean True.
+    """
+    value = os.environ.get(ENV_PREFIX + name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if default is None:
+        return value
+    return type(default)(value)
+
+
+class setting(object):
+    """
+    A config class attribute that is computed when it is first read (once for each config class).
+
+    Examples
+    --------
+    class MyConfig(Config):
+        @setting
+        def SOME_KEY(cls):
+            return read_secret("some_key")
+    """
+    def __init__(self, func):
+        self.func = func
+        self.values = {}
+
+    def __get__(self, obj, owner):
+        if owner not in self.values:
+            self.values[owner] = self.func(owner)
+        return self.values[owner]
+
+
+def secret(file_name, optional=False):
+    """A config class attribute that is read from a secret file when it is first used."""
+    return setting(lambda cls: read_secret(file_name, optional=optional))
+
+
+def replica_binds(file_name):
+    """A config class attribute for the SQLALCHEMY_BINDS of the optional read replica (empty without its url file)."""
+    def get_binds(cls):
+        url = read_secret(file_name, optional=True)
+        return {} if url is None else {"replica": url}
+    return setting(get_binds)
+
 
 class Config(object):
     DEBUG = False
     TESTING = False
     CSRF_ENABLED = True
-    SQLALCHEMY_DATABASE_URI = Path(join(secret_dir, "db_url_staging")).read_text().strip()
+    SQLALCHEMY_DATABASE_URI = secret("db_url_staging")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UNSPLASH_ACCESS_KEY = Path(join(secret_dir, "unsplash_access_key_staging")).read_text().strip()
-    GOOGLE_SIGNIN_CLIENT_ID = Path(join(secret_dir, "google_signin_client_id_staging")).read_text().strip()
-    JWT_PRIVATE_KEY = Path(join(secret_dir, "private_key")).read_text().strip()
+    SQLALCHEMY_BINDS = replica_binds("db_url_staging_replica")
+    UNSPLASH_ACCESS_KEY = secret("unsplash_access_key_staging")
+    GOOGLE_SIGNIN_CLIENT_ID = secret("google_signin_client_id_staging")
+    JWT_PRIVATE_KEY = secret("private_key")
+
+    # Database connection pool of each process (see the engine_options function in models/pool.py)
+    # Each uwsgi process has its own pool, so the server needs [processes] * (pool_size + max_overflow) connections
+    DB_POOL_SIZE = env("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW = env("DB_MAX_OVERFLOW", 10)
+    DB_POOL_TIMEOUT = env("DB_POOL_TIMEOUT", 30.0) # seconds
+    DB_POOL_RECYCLE = env("DB_POOL_RECYCLE", 1800) # seconds
+    DB_POOL_PRE_PING = env("DB_POOL_PRE_PING", True)
+    DB_STATEMENT_TIMEOUT = env("DB_STATEMENT_TIMEOUT", 30000) # milliseconds
+    DB_PGBOUNCER = env("DB_PGBOUNCER", False)
+
+    @setting
+    def SQLALCHEMY_ENGINE_OPTIONS(cls):
+        return engine_options(cls.SQLALCHEMY_DATABASE_URI, pool_size=cls.DB_POOL_SIZE,
+                max_overflow=cls.DB_MAX_OVERFLOW, pool_timeout=cls.DB_POOL_TIMEOUT,
+                pool_recycle=cls.DB_POOL_RECYCLE, pool_pre_ping=cls.DB_POOL_PRE_PING,
+                statement_timeout=cls.DB_STATEMENT_TIMEOUT, pgbouncer=cls.DB_PGBOUNCER)
+
+    REPLICA_MAX_LAG = env("REPLICA_MAX_LAG", 10.0) # seconds of replication lag before the read-only queries go to the primary
+    REPLICA_CHECK_INTERVAL = env("REPLICA_CHECK_INTERVAL", 5.0) # seconds between two health checks of the replica
+    GAME_IN_PROGRESS_TTL = env("GAME_IN_PROGRESS_TTL", 86400) # seconds before an unfinished game is set to the Error state
+    GAME_REAPER_BATCH_SIZE = env("GAME_REAPER_BATCH_SIZE", 500) # max number of games updated in one transaction
+    GAME_REAPER_INTERVAL = env("GAME_REAPER_INTERVAL", 600) # seconds between two runs when the reaper runs in a loop
+    UNSPLASH_API_URL = "https://api.unsplash.com"
+    UPSTREAM_TIMEOUT = env("UPSTREAM_TIMEOUT", 10.0) # seconds to wait for the Unsplash and Google APIs in the async app
+    UPSTREAM_MAX_CONNECTIONS = env("UPSTREAM_MAX_CONNECTIONS", 100) # max number of open connections to the upstream APIs
+    EXPORT_WORKERS = env("EXPORT_WORKERS", 1) # default number of processes for get_prolific_data.py
+    EXPORT_OVERLAP = env("EXPORT_OVERLAP", 3600.0) # seconds before the last marks to export again in export_parquet.py --incremental
+    SQL_DEBUG_HEADERS = env("SQL_DEBUG_HEADERS", False) # add the X-DB-Query-Count and X-DB-Time-Ms response headers
+    SQL_QUERY_WARN_COUNT = env("SQL_QUERY_WARN_COUNT", 30) # warn when a request sends more SQL queries than this
+    SQL_REPEAT_WARN_COUNT = env("SQL_REPEAT_WARN_COUNT", 5) # warn when a request repeats a SQL statement this many times
+    READYZ_TIMEOUT = env("READYZ_TIMEOUT", 2.0) # seconds for the "SELECT 1" of the /readyz endpoint
+    READYZ_CACHE_TTL = env("READYZ_CACHE_TTL", 2.0) # seconds to reuse the result of the /readyz check
+    LOG_QUEUE_SIZE = env("LOG_QUEUE_SIZE", 10000) # max number of log records waiting to be written (see util/error_log.py)
+    PROFILER_SAMPLE_RATE = env("PROFILER_SAMPLE_RATE", 0) # profile one in every N requests of each process (0 means only with the admin header)
+    PROFILER_DIR = env("PROFILER_DIR", abspath(join(dirname(__file__), "..", "..", "log", "profiles"))) # see merge_profiles.py
+    PROFILER_MAX_FILES = env("PROFILER_MAX_FILES", 100) # number of the newest profiles to keep for each endpoint
+
+    # Write-behind mode of POST /answer/ for launch bursts (see models/answer_journal.py)
+    # The answers are appended to a local journal, acknowledged with 202, and flushed to the database in batches
+    ANSWER_WRITE_BEHIND = env("ANSWER_WRITE_BEHIND", False)
+    ANSWER_JOURNAL_PATH = env("ANSWER_JOURNAL_PATH", abspath(join(dirname(__file__), "..", "..", "log", "answer_journal.db")))
+    ANSWER_FLUSH_INTERVAL = env("ANSWER_FLUSH_INTERVAL", 1.0) # seconds between two flushes when the journal is drained
+    ANSWER_FLUSH_BATCH_SIZE = env("ANSWER_FLUSH_BATCH_SIZE", 500) # max number of answers written in one transaction
+    ANSWER_FLUSH_LEASE = env("ANSWER_FLUSH_LEASE", 60.0) # seconds before the batch of a crashed process is flushed again
+    ANSWER_QUESTION_CACHE_TTL = env("ANSWER_QUESTION_CACHE_TTL", 60.0) # seconds to reuse a question for validating the answers
+
+    # Rate limiting and load shedding of the write endpoints (see util/rate_limit.py)
+    RATE_LIMIT_ENABLED = env("RATE_LIMIT_ENABLED", True)
+    RATE_LIMIT_TRUST_PROXY = env("RATE_LIMIT_TRUST_PROXY", False) # use the client IP address from the reverse proxy (set in uwsgi.ini)
+    RATE_LIMIT_UWSGI_CACHE = "ratelimit" # the "cache2" name in uwsgi.ini (for sharing the buckets across the workers)
+    # The token buckets of each user (or IP address) as {blueprint: {method: (requests per second, burst size)}}
+    # (the method "*" means all the other methods)
+    RATE_LIMITS = {
+        "answer_controller": {"POST": (2.0, 60)},
+        "vision_controller": {"POST": (0.5, 20)},
+        "game_controller": {"POST": (0.5, 20)},
+        "login_controller": {"POST": (1.0, 30)}}
+    # Max number of requests that each blueprint can handle at the same time across the uwsgi workers
+    # as {blueprint: {method: number of requests}} (so that some workers are always left for the other endpoints)
+    MAX_CONCURRENCY = {
+        "answer_controller": {"POST": 2},
+        "vision_controller": {"POST": 2},
+        "game_controller": {"POST": 2},
+        "login_controller": {"POST": 2}}
 
 
 class ProductionConfig(Config):
     DEBUG = False
-    SQLALCHEMY_DATABASE_URI = Path(join(secret_dir, "db_url_production")).read_text().strip()
-    UNSPLASH_ACCESS_KEY = Path(join(secret_dir, "unsplash_access_key_production")).read_text().strip()
-    GOOGLE_SIGNIN_CLIENT_ID = Path(join(secret_dir, "google_signin_client_id_production")).read_text().strip()
+    SQLALCHEMY_DATABASE_URI = secret("db_url_production")
+    SQLALCHEMY_BINDS = replica_binds("db_url_production_replica")
+    UNSPLASH_ACCESS_KEY = secret("unsplash_access_key_production")
+    GOOGLE_SIGNIN_CLIENT_ID = secret("google_signin_client_id_production")
+    DB_MAX_OVERFLOW = env("DB_MAX_OVERFLOW", 5)
 
 
 class StagingConfig(Config):
     DEVELOPMENT = True
     DEBUG = True
+    SQL_DEBUG_HEADERS = env("SQL_DEBUG_HEADERS", True)
 
 
 class DevelopmentConfig(Config):
     DEVELOPMENT = True
     DEBUG = True
+    SQL_DEBUG_HEADERS = env("SQL_DEBUG_HEADERS", True)
 
 
 class TestingConfig(Config):
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = Path(join(secret_dir, "db_url_testing")).read_text().strip()
+    SQLALCHEMY_DATABASE_URI = secret("db_url_testing")
+    SQLALCHEMY_BINDS = {}
+
+
+# The config classes that can be selected by the COCTEAU_ENV environment variable
+CONFIGS = {
+    "staging": StagingConfig,
+    "production": ProductionConfig,
+    "development": DevelopmentConfig,
+    "testing": TestingConfig}
+
+
+def get_config(name=None):
+    """
+    Get the config of an environment.
+
+    Parameters
+    ----------
+    name : str
+        Name of the environment (a key in CONFIGS).
+        None means the COCTEAU_ENV environment variable (or "staging" if it is not set).
+
+    Returns
+    -------
+    Config
+        The config object.
+
+    Raises
+    ------
+    exception : Exception
+        When the environment name is unknown.
+    """
+    if name is None:
+        name = os.environ.get(ENV_PREFIX + "ENV", "staging")
+    if name not in CONFIGS:
+        raise Exception("Unknown environment '%s' (must be one of %s)." % (name, ", ".join(CONFIGS)))
+    return CONFIGS[name]()
 
 
-config = StagingConfig() # for staging
-#config = ProductionConfig() # for production
+config = get_config()
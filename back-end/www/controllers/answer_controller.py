@@ -18,6 +18,10 @@ from models.model_operations.answer_operations import get_answers_by_question
 from models.model_operations.answer_operations import get_answers_by_user
 from models.model_operations.answer_operations import create_free_text_answer
 from models.model_operations.answer_operations import create_choice_answer
+from models.model_operations.answer_operations import get_choice_stats
+from models.model_operations.answer_operations import get_answer_journal
+from models.model_operations.answer_operations import journal_free_text_answer
+from models.model_operations.answer_operations import journal_choice_answer
 from models.schema import answer_schema
 from models.schema import answers_schema
 from models.schema import answer_admin_schema
@@ -70,6 +74,8 @@ def answer():
     Answer or list of Answer
         The retrieved answer object.
         Or a list of retrieved answer objects.
+        In the write-behind mode (the ANSWER_WRITE_BEHIND setting), POST returns the status code 202
+        and the answer without the id, since the answer is written to the database later.
     """
     rj = request.json
 
@@ -150,14 +156,59 @@ def answer():
         return handle_invalid_usage(e)
 
 
+@bp.route("/stats", methods=["GET"])
+def answer_stats():
+    """
+    The function for getting the number of answers for each choice (the histogram).
+
+    Parameters
+    ----------
+    question_id : int
+        ID of the question.
+        (optional in the URL query parameters for GET)
+    scenario_id : int
+        Scenario ID of the questions.
+        (optional in the URL query parameters for GET)
+    topic_id : int
+        Topic ID of the questions.
+        (optional in the URL query parameters for GET)
+
+    Returns
+    -------
+    list of dict
+        The histogram of each choice question.
+        See the docstring of get_choice_stats in answer_operations.py file.
+    """
+    question_id = request.args.get("question_id")
+    scenario_id = request.args.get("scenario_id")
+    topic_id = request.args.get("topic_id")
+    if [question_id, scenario_id, topic_id].count(None) != 2:
+        e = InvalidUsage("Must have only one of 'question_id', 'scenario_id', or 'topic_id'.", status_code=400)
+        return handle_invalid_usage(e)
+    else:
+        return try_get_choice_stats(question_id=question_id, scenario_id=scenario_id, topic_id=topic_id)
+
+
+@try_wrap_response
+def try_get_choice_stats(question_id=None, scenario_id=None, topic_id=None):
+    data = get_choice_stats(question_id=question_id, scenario_id=scenario_id, topic_id=topic_id)
+    return jsonify({"data": data})
+
+
 @try_wrap_response
 def try_create_choice_answer(choices, user_id, question_id, text=None, secret=None):
+    if get_answer_journal() is not None:
+        data = journal_choice_answer(choices, user_id, question_id, text=text, secret=secret)
+        return make_response(jsonify({"data": answer_schema.dump(data)}), 202)
     data = create_choice_answer(choices, user_id, question_id, text=text, secret=secret)
     return jsonify({"data": answer_schema.dump(data)})
 
 
 @try_wrap_response
 def try_create_free_text_answer(text, user_id, question_id, secret=None):
+    if get_answer_journal() is not None:
+        data = journal_free_text_answer(text, user_id, question_id, secret=secret)
+        return make_response(jsonify({"data": answer_schema.dump(data)}), 202)
     data = create_free_text_answer(text, user_id, question_id, secret=secret)
     return jsonify({"data": answer_schema.dump(data)})
 
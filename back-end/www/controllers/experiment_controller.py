@@ -0,0 +1,60 @@
+"""The controller for https://[PATH]/experiment/"""
+
+from flask import Blueprint
+from flask import request
+from flask import jsonify
+from util.util import InvalidUsage
+from util.util import handle_invalid_usage
+from util.util import decode_user_token
+from util.util import try_wrap_response
+from config.config import config
+from models.model_operations.experiment_operations import import_experiment
+
+
+bp = Blueprint("experiment_controller", __name__)
+
+
+@bp.route("/", methods=["POST"])
+def experiment():
+    """
+    The function for importing an experiment bundle (admin only).
+
+    All the topics, scenarios, and questions in the bundle are created in one transaction.
+    Use the import_experiment.py script to build the bundle from the experiment files
+    (e.g., front-end/file/experiment/) or to import it directly.
+
+    Use the following command to test:
+    $ python import_experiment.py --output bundle.json
+    $ curl -X POST -H "Content-Type: application/json" -d '{"user_token":"ADMIN_TOKEN","data":'"$(cat bundle.json)"'}' localhost:5000/experiment/
+
+    Parameters
+    ----------
+    user_token : str
+        The encoded user JWT, issued by the back-end.
+    data : dict
+        The experiment bundle (see the import_experiment function in models/model_operations/experiment_operations.py).
+
+    Returns
+    -------
+    dict
+        IDs of the created topics and scenarios, and the number of created questions.
+    """
+    rj = request.json
+
+    # Sanity and permission check (for administrators only)
+    error, _ = decode_user_token(rj, config.JWT_PRIVATE_KEY, check_if_admin=True)
+    if error is not None: return error
+
+    # Process the request
+    bundle = rj.get("data")
+    if bundle is None:
+        e = InvalidUsage("Must have 'data'.", status_code=400)
+        return handle_invalid_usage(e)
+    else:
+        return try_import_experiment(bundle)
+
+
+@try_wrap_response
+def try_import_experiment(bundle):
+    data = import_experiment(bundle)
+    return jsonify({"data": data})
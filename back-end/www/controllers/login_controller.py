@@ -5,17 +5,15 @@ from flask import request
 from flask import jsonify
 from util.util import InvalidUsage
 from util.util import handle_invalid_usage
+from util.util import handle_unexpected_error
 from util.util import encode_jwt
 from util.util import decode_jwt
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from config.config import config
 from models.model_operations.user_operations import get_user_by_client_id
 from models.model_operations.user_operations import create_user
 import jwt
 import time
 import uuid
-import traceback
 
 
 bp = Blueprint("login_controller", __name__)
@@ -48,19 +46,19 @@ def login():
             # google_id_token is obtained from the Google Sign-In API
             google_id_token = request_json["google_id_token"]
             # Verify the google_id_token using Google Sign-In API
+            # (google-auth is imported here because it is slow to import and only needed for Google users)
+            from google.oauth2 import id_token
+            from google.auth.transport import requests
             try:
                 id_info = id_token.verify_oauth2_token(google_id_token,
                         requests.Request(), config.GOOGLE_SIGNIN_CLIENT_ID)
                 # Token is valid
                 client_id = "google.%s" % id_info["sub"]
             except ValueError:
-                traceback.print_exc()
                 e = InvalidUsage("Invalid Google ID token.", status_code=401)
                 return handle_invalid_usage(e)
-            except:
-                traceback.print_exc()
-                e = InvalidUsage(traceback.format_exc(), status_code=401)
-                return handle_invalid_usage(e)
+            except Exception as ex:
+                return handle_unexpected_error(ex, "login", status_code=401)
         else:
             if "client_id" in request_json:
                 # obtained from the Google Analytics tracker or created by the front-end client
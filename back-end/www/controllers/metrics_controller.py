@@ -0,0 +1,28 @@
+"""The controller for https://[PATH]/metrics"""
+
+from flask import Blueprint
+from flask import make_response
+from util.metrics import get_metrics
+
+
+bp = Blueprint("metrics_controller", __name__)
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Get the request metrics in the Prometheus text format.
+
+    Use the following command to test:
+    $ curl localhost:5000/metrics
+
+    Returns
+    -------
+    str
+        The request counts, latency histograms, and response size histograms
+        for each blueprint and method (aggregated across the uwsgi workers).
+    """
+    data, content_type = get_metrics()
+    response = make_response(data)
+    response.headers["Content-Type"] = content_type
+    return response
@@ -10,9 +10,9 @@ import urllib
 from urllib.request import urlopen
 from urllib.error import URLError
 from urllib.error import HTTPError
-import traceback
 from util.util import InvalidUsage
 from util.util import handle_invalid_usage
+from util.util import handle_unexpected_error
 from config.config import config
 
 
@@ -22,22 +22,19 @@ bp = Blueprint("photos_controller", __name__)
 @bp.route("/random")
 def get_random_photos():
     """The wrapper of the Unsplash API (for hiding the private keys)."""
-    url = "https://api.unsplash.com//photos/random/?client_id=" + config.UNSPLASH_ACCESS_KEY
+    url = config.UNSPLASH_API_URL + "/photos/random/?client_id=" + config.UNSPLASH_ACCESS_KEY
     query_str = request.query_string.decode("utf-8")
     if len(query_str) != 0:
         url = url + "&" + query_str
     try:
         with urlopen(url) as response:
             return jsonify(json.load(response))
-    except URLError as ex:
-        traceback.print_exc()
-        e = InvalidUsage(ex.reason, status_code=400)
-        return handle_invalid_usage(e)
     except HTTPError as ex:
-        traceback.print_exc()
-        e = InvalidUsage(ex.read(), status_code=e.code)
+        # HTTPError is a subclass of URLError, so it must be handled first
+        e = InvalidUsage(ex.read().decode("utf-8", "replace"), status_code=ex.code)
         return handle_invalid_usage(e)
-    except:
-        traceback.print_exc()
-        e = InvalidUsage(traceback.format_exc(), status_code=400)
+    except URLError as ex:
+        e = InvalidUsage(str(ex.reason), status_code=400)
         return handle_invalid_usage(e)
+    except Exception as ex:
+        return handle_unexpected_error(ex, "get_random_photos")
@@ -0,0 +1,72 @@
+"""The controller for https://[PATH]/purge/"""
+
+from flask import Blueprint
+from flask import request
+from flask import jsonify
+from util.util import InvalidUsage
+from util.util import handle_invalid_usage
+from util.util import decode_user_token
+from util.util import try_wrap_response
+from config.config import config
+from models.model_operations.purge_operations import purge_scenario
+from models.model_operations.purge_operations import purge_topic
+
+
+bp = Blueprint("purge_controller", __name__)
+
+
+@bp.route("/", methods=["DELETE"])
+def purge():
+    """
+    The function for deleting a whole scenario or topic (admin only).
+
+    All the rows that depend on the scenario or topic (questions, choices, answers,
+    visions, medias, games, and guesses) are deleted in one transaction.
+
+    Use the following command to test:
+    $ curl -X DELETE -H "Content-Type: application/json" -d '{"user_token":"ADMIN_TOKEN","scenario_id":1}' localhost:5000/purge/
+
+    Parameters
+    ----------
+    user_token : str
+        The encoded user JWT, issued by the back-end.
+    scenario_id : int
+        The ID of the scenario to delete.
+        (either scenario_id or topic_id is required)
+    topic_id : int
+        The ID of the topic to delete.
+        (either scenario_id or topic_id is required)
+
+    Returns
+    -------
+    dict
+        Number of the deleted rows of each table.
+    """
+    rj = request.json
+
+    # Sanity and permission check (for administrators only)
+    error, _ = decode_user_token(rj, config.JWT_PRIVATE_KEY, check_if_admin=True)
+    if error is not None: return error
+
+    # Process the request
+    scenario_id = rj.get("scenario_id")
+    topic_id = rj.get("topic_id")
+    if (scenario_id is None) == (topic_id is None):
+        e = InvalidUsage("Must have either 'scenario_id' or 'topic_id'.", status_code=400)
+        return handle_invalid_usage(e)
+    elif scenario_id is not None:
+        return try_purge_scenario(scenario_id)
+    else:
+        return try_purge_topic(topic_id)
+
+
+@try_wrap_response
+def try_purge_scenario(scenario_id):
+    data = purge_scenario(scenario_id)
+    return jsonify({"data": data})
+
+
+@try_wrap_response
+def try_purge_topic(topic_id):
+    data = purge_topic(topic_id)
+    return jsonify({"data": data})
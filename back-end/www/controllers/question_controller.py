@@ -9,7 +9,7 @@ from util.util import handle_invalid_usage
 from util.util import decode_user_token
 from util.util import try_wrap_response
 from config.config import config
-from models.model_operations.question_operations import create_question_list
+from models.model_operations.question_operations import create_question_list_bulk
 from models.model_operations.question_operations import get_question_by_id
 from models.model_operations.question_operations import get_questions_by_topic
 from models.model_operations.question_operations import get_questions_by_scenario
@@ -164,7 +164,7 @@ def try_get_questions_by_topic(topic_id, page=None):
 
 @try_wrap_response
 def try_create_question_list(questions):
-    data = create_question_list(questions)
+    data = create_question_list_bulk(questions)
     return jsonify({"data": questions_schema.dump(data)})
 
 
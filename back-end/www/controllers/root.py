@@ -1,13 +1,73 @@
-"""The controller for https://[PATH]/"""
+"""The controller for https://[PATH]/ and the health checks of the load balancer"""
 
-from models.model import User
+import time
 from flask import Blueprint
+from flask import jsonify
+from flask import current_app
+from models.model import db
+from models.pool import check_database
 
 
 bp = Blueprint("root", __name__)
 
+# The last readiness check of each database engine, as {engine: (checked_at, result)}
+_readiness = {}
+
 
 @bp.route("/")
 def hello_world():
-    print(User.query.all())
     return "Hello, World!"
+
+
+@bp.route("/healthz")
+def healthz():
+    """
+    Check if the process is alive (liveness probe).
+
+    This endpoint does not touch the database, so a slow database does not restart the workers.
+
+    Use the following command to test:
+    $ curl localhost:5000/healthz
+
+    Returns
+    -------
+    str
+        "ok" with the status code 200.
+    """
+    return "ok"
+
+
+@bp.route("/readyz")
+def readyz():
+    """
+    Check if the process can serve requests (readiness probe).
+
+    The database must answer "SELECT 1" within READYZ_TIMEOUT seconds,
+    and the connection pool must not be exhausted.
+    The result is cached for READYZ_CACHE_TTL seconds in each process,
+    so that frequent probes do not add load to the database.
+    The pool statistics are only returned by the /status/pool endpoint (for admins).
+
+    Use the following command to test:
+    $ curl localhost:5000/readyz
+
+    Returns
+    -------
+    dict
+        If the database check (see check_database in models/pool.py) is ok,
+        with the status code 200 if ready or 503 if not ready.
+    """
+    result = get_readiness(db.engine)
+    return_json = {"ready": result["ok"], "database": {"ok": result["ok"]}}
+    return jsonify(return_json), 200 if result["ok"] else 503
+
+
+def get_readiness(engine):
+    """Get the cached result of check_database (checked again after READYZ_CACHE_TTL seconds)."""
+    config = current_app.config
+    checked_at, result = _readiness.get(engine, (None, None))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= config.get("READYZ_CACHE_TTL", 2.0):
+        result = check_database(engine, config.get("READYZ_TIMEOUT", 2.0))
+        _readiness[engine] = (now, result)
+    return result
@@ -0,0 +1,46 @@
+"""The controller for https://[PATH]/status/"""
+
+from flask import Blueprint
+from flask import request
+from flask import jsonify
+from flask import current_app
+from util.util import decode_user_token
+from config.config import config
+from models.model import db
+from models.pool import get_pool_stats
+from models.replica import REPLICA_BIND_KEY
+
+
+bp = Blueprint("status_controller", __name__)
+
+
+@bp.route("/pool", methods=["GET"])
+def pool():
+    """
+    Get the connection pool statistics of the process that handles the request (admin only).
+
+    Each uwsgi process has its own pools, so call this endpoint several times to see all processes.
+
+    Use the following command to test:
+    $ curl "localhost:5000/status/pool?user_token=ADMIN_TOKEN"
+
+    Parameters
+    ----------
+    user_token : str
+        The encoded user JWT of an administrator, issued by the back-end.
+        (required in the URL query parameters)
+
+    Returns
+    -------
+    dict
+        The statistics of the primary database pool (and the read replica pool if it is configured).
+        See the get_pool_stats function in models/pool.py for the fields.
+    """
+    # Permission check (for administrators only)
+    error, _ = decode_user_token(request.args, config.JWT_PRIVATE_KEY, check_if_admin=True)
+    if error is not None: return error
+
+    return_json = {"primary": get_pool_stats(db.engine)}
+    if REPLICA_BIND_KEY in (current_app.config.get("SQLALCHEMY_BINDS") or {}):
+        return_json["replica"] = get_pool_stats(db.get_engine(current_app, bind=REPLICA_BIND_KEY))
+    return jsonify(return_json)
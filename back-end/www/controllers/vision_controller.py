@@ -16,6 +16,7 @@ from models.model_operations.vision_operations import get_visions_by_user
 from models.model_operations.vision_operations import get_visions_by_scenario
 from models.model_operations.vision_operations import get_vision_by_id
 from models.model_operations.vision_operations import create_vision
+from models.model_operations.vision_operations import update_vision
 from models.model_operations.vision_operations import remove_vision
 from models.schema import visions_schema
 from models.schema import vision_schema
@@ -67,6 +68,11 @@ def vision():
         The method for sorting the returned vision objects.
         See the docstring of get_all_visions in vision_operations.py file.
         (optional for GET)
+    idempotency_key : str
+        A key (at most 64 characters) chosen by the client for the new vision, e.g., a random UUID.
+        Retrying the request with the same key returns the vision that was created the first time.
+        It can also be sent as the "Idempotency-Key" header.
+        (optional for POST)
 
     Returns
     -------
@@ -128,7 +134,11 @@ def vision():
             error, user_json = decode_user_token(rj, config.JWT_PRIVATE_KEY, check_if_admin=False)
             if error is not None: return error
             user_id = user_json["user_id"]
-            return try_create_vision(mood_id, medias, user_id, scenario_id)
+            idempotency_key = rj.get("idempotency_key", request.headers.get("Idempotency-Key"))
+            if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > 64):
+                e = InvalidUsage("'idempotency_key' must be a string with at most 64 characters.", status_code=400)
+                return handle_invalid_usage(e)
+            return try_create_vision(mood_id, medias, user_id, scenario_id, idempotency_key=idempotency_key)
     elif request.method == "PATCH":
         # Update a vision (admin only)
         vision_id = rj.get("vision_id")
@@ -200,8 +210,8 @@ def try_get_vision_by_id(vision_id):
 
 
 @try_wrap_response
-def try_create_vision(mood_id, medias, user_id, scenario_id):
-    data = create_vision(mood_id, medias, user_id, scenario_id)
+def try_create_vision(mood_id, medias, user_id, scenario_id, idempotency_key=None):
+    data = create_vision(mood_id, medias, user_id, scenario_id, idempotency_key=idempotency_key)
     return jsonify({"data": vision_schema.dump(data)})
 
 
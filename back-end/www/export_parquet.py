@@ -0,0 +1,283 @@
+"""
+This script exports the research tables into typed Parquet datasets.
+
+Each table is streamed from the database in chunks and written to
+[OUTPUT_DIR]/[TABLE_NAME]/ as Parquet files (one or more files per chunk).
+The answer, vision, and game tables are partitioned by month (Hive-style directories),
+and the enum columns are dictionary-encoded.
+
+Usage:
+    python export_parquet.py [--output DIR] [--chunk-size N] [--tables TABLE [TABLE ...]]
+    python export_parquet.py --incremental [--output DIR] [--chunk-size N] [--overlap SECONDS]
+
+The incremental mode stores the high-water marks (the latest Answer.updated_at, Vision.updated_at,
+Game.updated_at, and Tombstone.deleted_at) in [OUTPUT_DIR]/watermarks.json.
+The first run exports everything, and the next runs only append the new or changed rows
+(and all the rows of their child tables) as files named "delta-[TIME]-*.parquet".
+The database sets the times when the transactions start, so a transaction that commits late can have
+a time before the last mark. Each run therefore also exports again the rows within the overlap window
+(EXPORT_OVERLAP seconds) before the last mark, which must be longer than the longest write transaction.
+A row can appear in many delta files (e.g., a game that is submitted, or a vision whose medias are changed),
+so readers should keep the row from the latest file for each ID,
+and the answer choices (or the medias and guesses) from the latest file of their answer (or vision and game).
+Deleted answers, visions, games, and medias are recorded in the tombstone table.
+
+The tables are read from the read replica if it is configured (see models/replica.py).
+
+The exported data can be read (memory-mapped) by using, for example:
+    import pyarrow.dataset as ds
+    answers = ds.dataset("parquet-data/answer", format="parquet", partitioning="hive").to_table()
+"""
+
+import sys
+import json
+import enum
+import shutil
+import datetime
+import argparse
+from os.path import join
+from os.path import exists
+from os import makedirs
+import pyarrow as pa
+import pyarrow.dataset as ds
+import sqlalchemy as sa
+from app.app import app
+from config.config import config
+from models.model import db
+from models.replica import read_only
+
+
+# The tables to export (in this order)
+TABLES = ["question", "choice", "answer", "answers_choice_table", "vision", "media", "game", "guess", "tombstone"]
+
+# The timestamp columns for partitioning the tables by month
+PARTITION_COLUMNS = {"answer": "created_at", "vision": "created_at", "game": "start_time"}
+
+# The columns of the high-water marks of the incremental export
+WATERMARK_COLUMNS = ["answer.updated_at", "vision.updated_at", "game.updated_at", "tombstone.deleted_at"]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Export the research tables to Parquet files.")
+    parser.add_argument("--output", default="parquet-data",
+            help="the directory to write the Parquet datasets")
+    parser.add_argument("--chunk-size", type=int, default=50000,
+            help="number of rows to read from the database and write at a time")
+    parser.add_argument("--tables", nargs="+", default=TABLES, choices=TABLES,
+            help="the tables to export")
+    parser.add_argument("--incremental", action="store_true",
+            help="only export the rows that are new or changed since the last incremental run")
+    parser.add_argument("--overlap", type=float, default=config.EXPORT_OVERLAP,
+            help="seconds before the last high-water marks to export again in the incremental mode")
+    return parser.parse_args(argv[1:])
+
+
+def main(argv):
+    args = parse_args(argv)
+    with app.app_context():
+        if args.incremental:
+            counts = export_incremental(args.output, chunk_size=args.chunk_size, overlap=args.overlap)
+        else:
+            counts = {}
+            for table_name in args.tables:
+                counts[table_name] = export_table(table_name, args.output, chunk_size=args.chunk_size)
+    for table_name, num_rows in counts.items():
+        print("Exported %d rows from table '%s'" % (num_rows, table_name), flush=True)
+
+
+@read_only
+def export_incremental(output_dir, chunk_size=50000, overlap=None):
+    """
+    Export the rows that are new or changed since the last incremental export.
+
+    Parameters
+    ----------
+    output_dir : str
+        The root directory of the Parquet datasets.
+    chunk_size : int
+        Number of rows to read from the database and write at a time.
+    overlap : float
+        Seconds before the last high-water marks to export again, for the transactions that commit late
+        (None means EXPORT_OVERLAP in the config).
+
+    Returns
+    -------
+    counts : dict
+        Number of the exported rows for each table.
+    """
+    if overlap is None:
+        overlap = config.EXPORT_OVERLAP
+    t = {name: db.Model.metadata.tables[name] for name in TABLES}
+    old_marks = load_watermarks(output_dir)
+    is_first_run = old_marks is None
+    old_marks = {} if is_first_run else old_marks
+
+    # Get the new high-water marks before exporting, so that parent and child tables are consistent
+    new_marks = {}
+    for key in WATERMARK_COLUMNS:
+        table_name, column_name = key.split(".")
+        value = db.session.query(sa.func.max(t[table_name].c[column_name])).scalar()
+        new_marks[key] = old_marks.get(key) if value is None else value
+
+    def changed(key):
+        """Get the condition for selecting the rows between the old (minus the overlap) and new high-water marks."""
+        table_name, column_name = key.split(".")
+        c = t[table_name].c[column_name]
+        if new_marks[key] is None:
+            return sa.false()
+        if old_marks.get(key) is None:
+            return c <= new_marks[key]
+        return sa.and_(c > old_marks[key] - datetime.timedelta(seconds=overlap), c <= new_marks[key])
+
+    # The child rows of a changed parent are all exported again (e.g., the medias of an updated vision)
+    conditions = {
+        "answer": changed("answer.updated_at"),
+        "answers_choice_table": t["answers_choice_table"].c.answer_id.in_(
+            sa.select(t["answer"].c.id).where(changed("answer.updated_at"))),
+        "vision": changed("vision.updated_at"),
+        "media": t["media"].c.vision_id.in_(sa.select(t["vision"].c.id).where(changed("vision.updated_at"))),
+        "game": changed("game.updated_at"),
+        "guess": t["guess"].c.game_id.in_(sa.select(t["game"].c.id).where(changed("game.updated_at"))),
+        "tombstone": changed("tombstone.deleted_at")}
+
+    basename = datetime.datetime.now().strftime("delta-%Y%m%dT%H%M%S%f")
+    counts = {}
+    for table_name in TABLES:
+        if table_name in conditions and not is_first_run:
+            # Append the rows as new files
+            counts[table_name] = export_table(table_name, output_dir, chunk_size=chunk_size,
+                    where=conditions[table_name], basename=basename, append=True)
+        else:
+            # The other tables are small and can change at any time, so export them as a whole
+            # (and the first run replaces all the files)
+            counts[table_name] = export_table(table_name, output_dir, chunk_size=chunk_size)
+    save_watermarks(output_dir, new_marks)
+    return counts
+
+
+def load_watermarks(output_dir):
+    """Load the high-water marks of the last incremental export (None if there is no such export)."""
+    path = join(output_dir, "watermarks.json")
+    if not exists(path):
+        return None
+    with open(path) as f:
+        marks = json.load(f)
+    for k, v in marks.items():
+        if isinstance(v, str):
+            marks[k] = datetime.datetime.fromisoformat(v)
+    return marks
+
+
+def save_watermarks(output_dir, marks):
+    """Save the high-water marks of the incremental export."""
+    makedirs(output_dir, exist_ok=True)
+    marks = {k: v.isoformat() if isinstance(v, datetime.datetime) else v for k, v in marks.items()}
+    path = join(output_dir, "watermarks.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(marks, f, indent=2)
+    shutil.move(path + ".tmp", path)
+
+
+@read_only
+def export_table(table_name, output_dir, chunk_size=50000, where=None, basename="part", append=False):
+    """
+    Export a table to a Parquet dataset.
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table.
+    output_dir : str
+        The root directory of the Parquet datasets.
+        The table is written to the [output_dir]/[table_name] directory.
+    chunk_size : int
+        Number of rows to read from the database and write at a time.
+    where : sqlalchemy.sql.ClauseElement
+        Only export the rows that match the condition (None means all rows).
+    basename : str
+        The prefix of the file names.
+    append : bool
+        Keep the existing files of the table and add new files.
+        If False, the existing files are removed.
+
+    Returns
+    -------
+    num_rows : int
+        Number of the exported rows.
+    """
+    table = db.Model.metadata.tables[table_name]
+    table_dir = join(output_dir, table_name)
+    if not append:
+        shutil.rmtree(table_dir, ignore_errors=True)
+    schema = get_arrow_schema(table)
+    partition_column = PARTITION_COLUMNS.get(table_name)
+    partitioning = None
+    if partition_column is not None:
+        schema = schema.append(pa.field("month", pa.string()))
+        partitioning = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+
+    # Stream the rows by using a server-side cursor (when the database supports it)
+    q = sa.select(table)
+    if where is not None:
+        q = q.where(where)
+    q = q.order_by(*(table.primary_key.columns or table.columns))
+    conn = db.session.connection().execution_options(stream_results=True)
+    result = conn.execute(q)
+    num_rows = 0
+    for i, rows in enumerate(iter(lambda: result.fetchmany(chunk_size), [])):
+        data = {c.name: [convert_value(r[c.name]) for r in rows] for c in table.columns}
+        if partition_column is not None:
+            data["month"] = [None if t is None else t.strftime("%Y-%m") for t in data[partition_column]]
+        chunk = pa.Table.from_pydict(data, schema=schema)
+        ds.write_dataset(chunk, table_dir, format="parquet", partitioning=partitioning,
+                basename_template="%s-%05d-{i}.parquet" % (basename, i),
+                existing_data_behavior="overwrite_or_ignore")
+        num_rows += len(rows)
+    result.close()
+    db.session.commit()
+    return num_rows
+
+
+def get_arrow_schema(table):
+    """
+    Get the Arrow schema of a table.
+
+    Parameters
+    ----------
+    table : sqlalchemy.Table
+        The table.
+
+    Returns
+    -------
+    pyarrow.Schema
+        The schema, where enum columns are dictionary-encoded strings.
+    """
+    fields = []
+    for c in table.columns:
+        if isinstance(c.type, sa.Enum):
+            t = pa.dictionary(pa.int8(), pa.string())
+        elif isinstance(c.type, sa.Boolean):
+            t = pa.bool_()
+        elif isinstance(c.type, sa.Integer):
+            t = pa.int64()
+        elif isinstance(c.type, sa.DateTime):
+            t = pa.timestamp("us")
+        else:
+            t = pa.string()
+        fields.append(pa.field(c.name, t, nullable=c.nullable))
+    return pa.schema(fields)
+
+
+def convert_value(value):
+    """Convert a database value into a value that Arrow understands."""
+    if isinstance(value, enum.Enum):
+        # Enum members are stored by their names in the database
+        return value.name
+    if isinstance(value, (dict, list)):
+        # JSON columns are exported as JSON strings
+        return json.dumps(value)
+    return value
+
+
+if __name__ == "__main__":
+    main(sys.argv)
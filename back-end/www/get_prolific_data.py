@@ -1,116 +1,334 @@
 """
 This script gets data from Prolific users and outputs them into a csv file.
+
+The data of each experiment topic is retrieved by using a few bulk queries,
+which are then joined and pivoted in pandas (one row per Prolific user).
+
+Usage:
+    python get_prolific_data.py [--workers N]
+With N > 1, the experiment topics are exported in parallel by N processes.
+The data is read from the read replica if it is configured (see models/replica.py).
 """
 
 import sys
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from flask import current_app
 from app.app import app
+from config.config import config
+from sqlalchemy import desc
+from models.model import db
+from models.replica import read_only
+from models.replica import dispose_engines
+from models.model import Answer
+from models.model import Question
+from models.model import Choice
+from models.model import Vision
+from models.model import Media
+from models.model import answer_choice_table
+from models.model import json_text
 from models.model_operations.topic_operations import get_all_topics
+from models.model_operations.topic_operations import get_topic_by_id
 from models.model_operations.question_operations import get_questions_by_scenario
-from models.model_operations.question_operations import get_question_by_id
-from models.model_operations.answer_operations import get_answers_by_topic
-from models.model_operations.answer_operations import get_answers_by_scenario
 from models.model_operations.scenario_operations import get_scenarios_by_topic
-from models.model_operations.vision_operations import get_visions_by_user
-import json
 import pandas as pd
-from collections import defaultdict
 from models.model import QuestionTypeEnum
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Export the data of Prolific users to prolific-data.csv.")
+    parser.add_argument("--workers", type=int, default=config.EXPORT_WORKERS,
+            help="number of processes for exporting the experiment topics in parallel")
+    return parser.parse_args(argv[1:])
+
+
 def main(argv):
+    args = parse_args(argv)
     print("Get experiment data...")
-    df_list = []
     with app.app_context():
-        # Build tables with index
-        # The first level is mode, and the second level is view
-        for t in get_all_topics():
-            # We only want to get the experiment data
-            if "Crowdsourcing Experiment" not in t.title: continue
-            scenarios = get_scenarios_by_topic(t.id)
-            if len(scenarios) != 1:
-                print("ERROR: each experiment topic can have only one scenario")
-                print("Skip this topic ID: %d" % t.id)
-                continue
-            s = scenarios[0]
-            sq_list = get_questions_by_scenario(s.id)
-            want_q_types = [QuestionTypeEnum.FREE_TEXT, QuestionTypeEnum.SINGLE_CHOICE, QuestionTypeEnum.MULTI_CHOICE]
-            sq_list = [q for q in sq_list if q.question_type in want_q_types]
-            sq_list = sorted(sq_list, key=lambda x: (x.page, x.order))
-            columns = ["user_id", "prolific_id", "mode", "view"] + [sq.text for sq in sq_list]
-            df = pd.Series(index=columns, dtype=object)
-            df.name = "mode_%d_view_%d" % (s.mode, s.view)
-            num_of_q = len(sq_list)
-            has_data = False
-            print("\n" + "="*90)
-            print("Create dataframe:", df.name)
-            print("Total number of questions:", num_of_q)
-            print("Scenario ID:", s.id)
-            # Get all answers for this topic and collect the user IDs
-            for ta in get_answers_by_topic(t.id):
-                # We only wants to get the scenario answers from prolific users
-                if ta.secret is None: continue
-                secret = json.loads(ta.secret)
-                prolific_id = secret["user_platform_id"]
-                scenario_id = int(secret["scenario_id"])
-                print("-"*50)
-                print("Prolific ID:", prolific_id)
-                print("User ID:", ta.user_id)
-                # Get all answers for the scenario from this user
-                user_answers = get_answers_by_scenario(scenario_id, user_id=ta.user_id)
-                if scenario_id != s.id:
-                    print("ERROR: scenario ID does not match")
-                    print("Skip this user")
-                    continue
-                # If multiple answers for one question, use only the one with the latest timestamp
-                user_answers_array = [[u.question_id, u.created_at, u] for u in user_answers]
-                df_user_answers = pd.DataFrame(user_answers_array, columns=["qid", "t", "a"])
-                idx = df_user_answers.groupby(["qid"])["t"].transform(max) == df_user_answers["t"]
-                df_user_answers = df_user_answers[idx]
-                user_answers = list(df_user_answers["a"])
-                if len(user_answers) > num_of_q:
-                    print("ERROR: # of answers cannot be larger than # of questions")
-                    print("Skip this user")
-                    continue
-                # Get and flatten all visions from the user
-                user_visions = get_visions_by_user(ta.user_id, paginate=False, scenario_id=scenario_id)
-                user_motivations = []
-                for v in user_visions:
-                    for m in v.medias:
-                        user_motivations.append(m)
-                # Fill the data to the dataframe
-                row = {}
-                row["user_id"] = ta.user_id
-                row["prolific_id"] = prolific_id
-                row["mode"] = s.mode
-                row["view"] = s.view
-                for a in user_answers:
-                    q = get_question_by_id(a.question_id)
-                    if q.question_type == QuestionTypeEnum.FREE_TEXT:
-                        row[q.text] = a.text
-                    elif q.question_type == QuestionTypeEnum.SINGLE_CHOICE:
-                        row[q.text] = a.choices[0].value
-                    elif q.question_type == QuestionTypeEnum.MULTI_CHOICE:
-                        row[q.text] = [c.value for c in a.choices]
-                    else:
-                        print("Skip this answer")
-                        continue
-                for i in range(len(user_motivations)):
-                    m = user_motivations[i]
-                    row["motivation_url_%d"%i] = m.url
-                    row["motivation_description_%d"%i] = m.description
-                df = pd.concat([df, pd.Series(row)], axis=1, ignore_index=True)
-                has_data = True
-            if has_data:
-                # Remove the first empty data initially
-                df = df.drop(columns=[0])
-                print(df)
-                df_list.append(df)
-    # Merge all dataframes and save data
-    df_all = pd.concat(df_list, axis=1, ignore_index=True).T
+        df_all = get_experiment_data(workers=args.workers)
+    if df_all is None:
+        print("No experiment data found.")
+        return
+    # Save data
     print("\n" + "="*90)
     print(df_all)
     df_all.to_csv("prolific-data.csv", index=False)
 
 
+@read_only
+def get_experiment_data(workers=1):
+    """
+    Get the data of all experiment topics.
+
+    Parameters
+    ----------
+    workers : int
+        Number of processes for getting the topic data in parallel.
+        Each process has its own database connections.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        One row for each answer (with the secret) to a topic question.
+        None if there is no data.
+    """
+    # We only want to get the experiment data
+    topic_ids = [t.id for t in get_all_topics() if "Crowdsourcing Experiment" in t.title]
+    topic_ids = sorted(topic_ids)
+    df_dict = {}
+    if workers > 1 and len(topic_ids) > 1:
+        # Do not let the worker processes inherit an open transaction
+        db.session.close()
+        # Forking allows the workers to reuse the Flask app of the current context
+        mp_context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                initializer=init_worker, initargs=(current_app._get_current_object(),)) as executor:
+            futures = [executor.submit(get_topic_data_in_worker, tid) for tid in topic_ids]
+            for i, future in enumerate(as_completed(futures)):
+                tid, df = future.result()
+                df_dict[tid] = df
+                print_progress(i + 1, len(topic_ids), tid, df)
+    else:
+        for i, tid in enumerate(topic_ids):
+            _, df = get_topic_data_by_id(tid)
+            df_dict[tid] = df
+            print_progress(i + 1, len(topic_ids), tid, df)
+    # Merge all dataframes in the order of topic IDs (so that the columns are always in the same order)
+    df_list = [df_dict[tid] for tid in topic_ids if df_dict[tid] is not None]
+    if len(df_list) == 0:
+        return None
+    return pd.concat(df_list, ignore_index=True)
+
+
+def init_worker(flask_app):
+    """Initialize a worker process for getting the topic data."""
+    flask_app.app_context().push()
+    # Each worker needs its own connection pools (without closing the connections of the parent)
+    dispose_engines(flask_app)
+
+
+def get_topic_data_by_id(topic_id):
+    """Get the data of an experiment topic by its ID and return (topic_id, data)."""
+    return (topic_id, get_topic_data(get_topic_by_id(topic_id)))
+
+
+@read_only
+def get_topic_data_in_worker(topic_id):
+    """Get the data of an experiment topic in a worker process and release the connection."""
+    try:
+        return get_topic_data_by_id(topic_id)
+    finally:
+        db.session.remove()
+
+
+def print_progress(num_done, num_total, topic_id, df):
+    num_rows = 0 if df is None else len(df)
+    print("[%d/%d] Topic ID %d is done (%d rows)" % (num_done, num_total, topic_id, num_rows), flush=True)
+
+
+def get_topic_data(topic):
+    """
+    Get the data of an experiment topic.
+
+    Parameters
+    ----------
+    topic : Topic
+        The experiment topic, which must have only one scenario.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        One row for each answer (with the secret) to a topic question.
+        None if there is no data.
+    """
+    scenarios = get_scenarios_by_topic(topic.id)
+    if len(scenarios) != 1:
+        print("ERROR: each experiment topic can have only one scenario")
+        print("Skip this topic ID: %d" % topic.id)
+        return None
+    s = scenarios[0]
+    sq_list = get_questions_by_scenario(s.id)
+    want_q_types = [QuestionTypeEnum.FREE_TEXT, QuestionTypeEnum.SINGLE_CHOICE, QuestionTypeEnum.MULTI_CHOICE]
+    sq_list = [q for q in sq_list if q.question_type in want_q_types]
+    sq_list = sorted(sq_list, key=lambda x: (x.page, x.order))
+    num_of_q = len(sq_list)
+    name = "mode_%d_view_%d" % (s.mode, s.view)
+    print("\n" + "="*90)
+    print("Create dataframe:", name)
+    print("Total number of questions:", num_of_q)
+    print("Scenario ID:", s.id)
+
+    # Get the Prolific users from the topic answers (that have the secret)
+    df_users = get_topic_users(topic.id)
+    # We only want the users that answered the scenario of this topic
+    is_matched = df_users["scenario_id"] == s.id
+    if (~is_matched).any():
+        print("ERROR: scenario ID does not match for %d answer(s)" % (~is_matched).sum())
+    df_users = df_users[is_matched]
+    if len(df_users) == 0:
+        return None
+
+    # Get all answers for the scenario
+    # If multiple answers for one question, use only the one with the latest timestamp
+    df_answers = get_scenario_answers(s.id)
+    df_answers = df_answers[df_answers["user_id"].isin(df_users["user_id"])]
+    idx = df_answers.groupby(["user_id", "question_id"])["created_at"].transform(max) == df_answers["created_at"]
+    df_answers = df_answers[idx]
+    # Skip the users that have more answers than questions
+    num_of_a = df_answers.groupby("user_id").size()
+    bad_users = num_of_a.index[num_of_a > num_of_q]
+    if len(bad_users) > 0:
+        print("ERROR: # of answers cannot be larger than # of questions")
+        print("Skip these users:", list(bad_users))
+        df_users = df_users[~df_users["user_id"].isin(bad_users)]
+        df_answers = df_answers[~df_answers["user_id"].isin(bad_users)]
+    if len(df_users) == 0:
+        return None
+
+    # Convert answers into values and pivot them (one column for each question)
+    df_values = get_answer_values(df_answers, sq_list)
+    df_values = df_values.set_index(["user_id", "question"])["value"].unstack()
+
+    # Get and flatten all visions (i.e., motivations) from the users
+    df_motivations = get_motivations(s.id)
+    df_motivations = df_motivations[df_motivations["user_id"].isin(df_users["user_id"])]
+    df_motivations = df_motivations.set_index(["user_id", "i"])[["url", "description"]].unstack()
+    motivation_columns = []
+    for i in sorted(set(df_motivations.columns.get_level_values("i"))):
+        motivation_columns += [("url", i), ("description", i)]
+    df_motivations = df_motivations[motivation_columns]
+    df_motivations.columns = ["motivation_%s_%d" % c for c in motivation_columns]
+
+    # Fill the data to the dataframe
+    df = df_users[["user_id", "prolific_id"]].copy()
+    df["mode"] = s.mode
+    df["view"] = s.view
+    df = df.merge(df_values, how="left", left_on="user_id", right_index=True)
+    df = df.merge(df_motivations, how="left", left_on="user_id", right_index=True)
+    columns = ["user_id", "prolific_id", "mode", "view"] + [sq.text for sq in sq_list]
+    columns += list(df_motivations.columns)
+    df = df.reindex(columns=columns).astype(object).reset_index(drop=True)
+    print(df)
+    return df
+
+
+def get_topic_users(topic_id):
+    """
+    Get the Prolific users from the answers (that have the secret) to the topic questions.
+
+    Parameters
+    ----------
+    topic_id : int
+        ID of the topic.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The "user_id", "prolific_id", and "scenario_id" of each answer.
+    """
+    prolific_id = json_text(Answer.secret, "user_platform_id")
+    scenario_id = json_text(Answer.secret, "scenario_id")
+    q = db.session.query(Answer.user_id, prolific_id, scenario_id)
+    q = q.join(Question, Answer.question_id==Question.id)
+    q = q.filter(Question.topic_id==topic_id, prolific_id.isnot(None))
+    q = q.order_by(Question.id, Answer.id)
+    df = pd.DataFrame(q.all(), columns=["user_id", "prolific_id", "scenario_id"])
+    df["scenario_id"] = df["scenario_id"].astype(int)
+    return df
+
+
+def get_scenario_answers(scenario_id):
+    """
+    Get all answers to the scenario questions.
+
+    Parameters
+    ----------
+    scenario_id : int
+        ID of the scenario.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The "id", "user_id", "question_id", "created_at", and "text" of each answer.
+    """
+    q = db.session.query(Answer.id, Answer.user_id, Answer.question_id, Answer.created_at, Answer.text)
+    q = q.join(Question, Answer.question_id==Question.id)
+    q = q.filter(Question.scenario_id==scenario_id)
+    q = q.order_by(Answer.id)
+    return pd.DataFrame(q.all(), columns=["id", "user_id", "question_id", "created_at", "text"])
+
+
+def get_answer_values(df_answers, sq_list):
+    """
+    Get the value of each answer (free text, the choice value, or the list of choice values).
+
+    Parameters
+    ----------
+    df_answers : pandas.DataFrame
+        The answers returned by the get_scenario_answers function.
+    sq_list : list of Question
+        The scenario questions that we want to get the values.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The "user_id", "question" (the question text), and "value" of each answer.
+    """
+    q_dict = {sq.id: sq for sq in sq_list}
+    answer_ids = set(df_answers["id"])
+    # Get all the choice values of the answers in one query
+    q = db.session.query(answer_choice_table.c.answer_id, Choice.value)
+    q = q.join(Choice, answer_choice_table.c.choice_id==Choice.id)
+    q = q.join(Answer, answer_choice_table.c.answer_id==Answer.id)
+    q = q.filter(Answer.question_id.in_(list(q_dict.keys())))
+    q = q.order_by(answer_choice_table.c.answer_id, Choice.id)
+    choice_values = {}
+    for answer_id, value in q:
+        if answer_id in answer_ids:
+            choice_values.setdefault(answer_id, []).append(value)
+    # Convert each answer into a value based on the question type
+    rows = []
+    for a in df_answers.sort_values(["created_at", "id"]).itertuples():
+        sq = q_dict.get(a.question_id)
+        if sq is None: continue
+        if sq.question_type == QuestionTypeEnum.FREE_TEXT:
+            value = a.text
+        elif sq.question_type == QuestionTypeEnum.SINGLE_CHOICE:
+            value = choice_values.get(a.id, [None])[0]
+        else:
+            value = choice_values.get(a.id, [])
+        rows.append([a.user_id, sq.text, value])
+    df = pd.DataFrame(rows, columns=["user_id", "question", "value"])
+    df["value"] = df["value"].astype(object)
+    # If multiple answers have the same timestamp, use the last one
+    return df.drop_duplicates(["user_id", "question"], keep="last")
+
+
+def get_motivations(scenario_id):
+    """
+    Get all the medias (i.e., motivations) in the visions of a scenario.
+
+    Parameters
+    ----------
+    scenario_id : int
+        ID of the scenario.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The "user_id", "i" (position of the media for the user), "url", and "description" of each media.
+    """
+    q = db.session.query(Vision.user_id, Media.url, Media.description)
+    q = q.join(Media, Media.vision_id==Vision.id)
+    q = q.filter(Vision.scenario_id==scenario_id)
+    q = q.order_by(Vision.user_id, desc(Vision.created_at), desc(Vision.id), Media.id)
+    df = pd.DataFrame(q.all(), columns=["user_id", "url", "description"])
+    df["i"] = df.groupby("user_id").cumcount()
+    return df
+
+
 if __name__ == "__main__":
     main(sys.argv)
@@ -0,0 +1,105 @@
+"""
+This script imports the experiment files (created by front-end/file/experiment/create_scenario_question_2_1.py)
+in one transaction, instead of posting them one by one from the admin page.
+
+For each condition (mode M and view V) of a study S, the following files are read from the folder:
+    - topic_S_mode_M_view_V.json: the topic
+    - topic_S_question.json: the topic questions (the same for all conditions)
+    - scenario_S_mode_M_view_V.json: the scenario of the topic
+    - scenario_S_question_mode_M_view_V.json: the scenario questions
+Each condition becomes a topic with one scenario (the same as the setInitialData function in front-end/js/admin.js).
+
+Usage:
+    python import_experiment.py [--dir DIR] [--study S]
+Or save the bundle to post it to the /experiment/ endpoint of a server:
+    python import_experiment.py --output bundle.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+
+# The default folder of the experiment files
+experiment_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "front-end", "file", "experiment"))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Import the experiment files in one transaction.")
+    parser.add_argument("--dir", default=experiment_dir,
+            help="folder of the experiment files")
+    parser.add_argument("--study", type=int, default=4,
+            help="the study number in the file names (e.g., 4 for topic_4_mode_1_view_1.json)")
+    parser.add_argument("--output", default=None,
+            help="save the bundle to this JSON file instead of importing it")
+    return parser.parse_args(argv[1:])
+
+
+def load_json(path, default=None):
+    if default is not None and not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_bundle(directory, study):
+    """
+    Build the experiment bundle from the files in a folder.
+
+    Parameters
+    ----------
+    directory : str
+        Folder of the experiment files.
+    study : int
+        The study number in the file names.
+
+    Returns
+    -------
+    dict
+        The bundle (see the import_experiment function in models/model_operations/experiment_operations.py).
+    """
+    pattern = re.compile(r"^topic_%d_mode_(\d+)_view_(\d+)\.json$" % study)
+    conditions = []
+    for name in os.listdir(directory):
+        m = pattern.match(name)
+        if m is not None:
+            conditions.append((int(m.group(1)), int(m.group(2))))
+    if len(conditions) == 0:
+        raise ValueError("No topic_%d_mode_*_view_*.json file in %s" % (study, directory))
+    topic_questions = load_json(os.path.join(directory, "topic_%d_question.json" % study), default=[])
+    topics = []
+    for mode, view in sorted(conditions):
+        suffix = "_mode_%d_view_%d.json" % (mode, view)
+        topic = load_json(os.path.join(directory, "topic_%d%s" % (study, suffix)))
+        scenario = load_json(os.path.join(directory, "scenario_%d%s" % (study, suffix)))
+        scenario["questions"] = load_json(os.path.join(directory, "scenario_%d_question%s" % (study, suffix)))
+        topic["questions"] = topic_questions
+        topic["scenarios"] = [scenario]
+        topics.append(topic)
+    return {"topics": topics}
+
+
+def main(argv):
+    args = parse_args(argv)
+    bundle = load_bundle(args.dir, args.study)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(bundle, f)
+        print("Saved %d topic(s) to %s" % (len(bundle["topics"]), args.output))
+        return
+    from app.app import app
+    from models.model_operations.experiment_operations import import_experiment
+    t = time.perf_counter()
+    with app.app_context():
+        result = import_experiment(bundle)
+    for topic in result["topics"]:
+        print("Topic %d: scenario(s) %s" % (topic["id"], topic["scenario_ids"]))
+    print("Imported %d topic(s) and %d question(s) in %.2f seconds" % (
+        len(result["topics"]), result["question_count"], time.perf_counter() - t))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
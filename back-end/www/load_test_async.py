@@ -0,0 +1,144 @@
+"""
+This script compares the throughput of the synchronous and asynchronous apps when the upstream is slow.
+
+A fake Unsplash API that responds after a delay is started locally. Then, the same number of concurrent
+/photos/random requests are sent to:
+    - the synchronous Flask app (application.py) served by 3 processes (like the uwsgi.ini setting)
+    - the asynchronous app (application_async.py) served by one uvicorn process
+
+Usage:
+    python load_test_async.py [--requests N] [--concurrency C] [--delay SECONDS] [--processes P]
+"""
+
+import sys
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+import httpx
+import uvicorn
+from werkzeug.serving import make_server
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.responses import JSONResponse
+from config.config import config
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load test the sync and async apps with a slow upstream.")
+    parser.add_argument("--requests", type=int, default=120,
+            help="number of requests to send to each app")
+    parser.add_argument("--concurrency", type=int, default=30,
+            help="number of requests that are sent at the same time")
+    parser.add_argument("--delay", type=float, default=0.2,
+            help="seconds that the fake upstream waits before responding")
+    parser.add_argument("--processes", type=int, default=3,
+            help="number of processes of the synchronous app")
+    return parser.parse_args(argv[1:])
+
+
+def main(argv):
+    args = parse_args(argv)
+    upstream_port, sync_port, async_port = [get_free_port() for _ in range(3)]
+    config.UNSPLASH_API_URL = "http://127.0.0.1:%d" % upstream_port
+
+    # Fork the synchronous server before starting any threads
+    sync_process = multiprocessing.get_context("fork").Process(
+            target=run_sync_server, args=(sync_port, args.processes), daemon=True)
+    sync_process.start()
+    start_uvicorn(create_upstream_app(args.delay), upstream_port)
+    import application_async
+    start_uvicorn(application_async.app, async_port)
+    wait_for_port(sync_port)
+
+    print("Upstream delay: %.3f s, %d requests, concurrency %d" % (args.delay, args.requests, args.concurrency))
+    results = [
+        ("sync (%d processes)" % args.processes, sync_port),
+        ("async (1 process)", async_port)]
+    for name, port in results:
+        url = "http://127.0.0.1:%d/photos/random?count=1" % port
+        stats = asyncio.run(run_load(url, args.requests, args.concurrency))
+        print("%-20s %8.1f req/s   p50 %6.3f s   p95 %6.3f s   errors %d" % ((name,) + stats), flush=True)
+    sync_process.terminate()
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    t = time.monotonic()
+    while time.monotonic() - t < timeout:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise Exception("The server at port %d did not start." % port)
+
+
+def create_upstream_app(delay):
+    """Create the fake Unsplash API that responds after the delay."""
+    async def random_photos(request):
+        await asyncio.sleep(delay)
+        return JSONResponse([{"id": "photo", "urls": {"small": "http://photo"}}])
+    return Starlette(routes=[Route("/photos/random/", random_photos)])
+
+
+def start_uvicorn(app, port):
+    """Start a uvicorn server in a background thread."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+
+def run_sync_server(port, processes):
+    """Run the synchronous Flask app with a fixed number of processes (like uwsgi)."""
+    from application import app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", port, app, processes=processes).serve_forever()
+
+
+async def run_load(url, num_requests, concurrency):
+    """
+    Send the requests and measure the throughput.
+
+    Returns
+    -------
+    tuple
+        The throughput (requests per second), the 50th and 95th percentile latency (seconds),
+        and the number of failed requests.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        async def send():
+            nonlocal errors
+            async with semaphore:
+                t = time.monotonic()
+                try:
+                    r = await client.get(url)
+                    if r.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.monotonic() - t)
+        t0 = time.monotonic()
+        await asyncio.gather(*[send() for _ in range(num_requests)])
+        total = time.monotonic() - t0
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return (num_requests / total, p50, p95, errors)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,118 @@
+"""
+This script measures the cost of the error responses under a flood of bad (4xx) requests.
+
+A small Flask app with the same hooks as the real app (metrics and query counting) is flooded with requests
+that fail in the wrapped controller functions. Three error paths are compared:
+    - legacy: the previous try_wrap_response (print the traceback and send it to the client)
+    - validation: a ValidationError (the message is sent to the client and nothing is logged)
+    - exception: an unexpected exception (the traceback is logged in the background, see util/error_log.py)
+The tracebacks are written to a temporary log file (like the uwsgi log).
+
+Usage:
+    python load_test_errors.py [--requests N] [--depth D]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import traceback
+import contextlib
+from flask import Flask
+from util.util import InvalidUsage
+from util.util import ValidationError
+from util.util import handle_invalid_usage
+from util.util import try_wrap_response
+from util.metrics import init_metrics
+from util.error_log import init_error_log
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Measure the throughput of the error responses.")
+    parser.add_argument("--requests", type=int, default=5000,
+            help="number of requests to send for each error path")
+    parser.add_argument("--depth", type=int, default=10,
+            help="number of nested calls before the error is raised (a deeper stack has a longer traceback)")
+    return parser.parse_args(argv[1:])
+
+
+def legacy_try_wrap_response(func, status_code=400):
+    """The previous version of try_wrap_response (for comparison)."""
+    def inner_function(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as ex:
+            traceback.print_exc()
+            if len(list(ex.args)) > 1:
+                e = InvalidUsage(ex.args[0], status_code=status_code)
+            else:
+                e = InvalidUsage(traceback.format_exc(), status_code=status_code)
+            return handle_invalid_usage(e)
+    return inner_function
+
+
+def fail(depth, error):
+    if depth > 0:
+        return fail(depth - 1, error)
+    raise error
+
+
+def create_app(depth, log_file):
+    app = Flask(__name__)
+    app.logger.handlers = [logging.FileHandler(log_file)]
+    init_error_log(app)
+    init_metrics(app)
+
+    @legacy_try_wrap_response
+    def legacy():
+        fail(depth, Exception("No topic found in the database to update."))
+
+    @try_wrap_response
+    def validation():
+        fail(depth, ValidationError("No topic found in the database to update."))
+
+    @try_wrap_response
+    def exception():
+        fail(depth, KeyError("topic_id"))
+
+    for name, func in [("legacy", legacy), ("validation", validation), ("exception", exception)]:
+        app.add_url_rule("/" + name, name, func)
+    return app
+
+
+def run_flood(client, url, num_requests):
+    """
+    Send the requests one by one and measure the throughput.
+
+    Returns
+    -------
+    tuple
+        The throughput (requests per second) and the average size of the response body (bytes).
+    """
+    size = 0
+    t = time.perf_counter()
+    for _ in range(num_requests):
+        r = client.get(url)
+        assert r.status_code == 400
+        size += len(r.data)
+    return (num_requests / (time.perf_counter() - t), size / num_requests)
+
+
+def main(argv):
+    args = parse_args(argv)
+    fd, log_file = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    app = create_app(args.depth, log_file)
+    client = app.test_client()
+    print("%d requests for each error path, stack depth %d" % (args.requests, args.depth))
+    for name in ["legacy", "validation", "exception"]:
+        with open(log_file, "a") as f, contextlib.redirect_stderr(f):
+            rate, size = run_flood(client, "/" + name, args.requests)
+        print("%-12s %10.1f req/s   %8.0f bytes per response" % (name, rate, size), flush=True)
+    os.remove(log_file)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
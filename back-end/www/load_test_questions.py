@@ -0,0 +1,109 @@
+"""
+This script compares the two ways of creating questions with the experiment surveys.
+
+The survey files (front-end/file/experiment/scenario_4_question_mode_*_view_*.json) are loaded
+into a new database, one scenario for each file, by:
+    - orm: create_question_list (the ORM flushes the questions and choices one row at a time)
+    - bulk: create_question_list_bulk (one INSERT for the questions and one executemany for the choices)
+The number of SQL statements and the time are printed for each path.
+The default database is a temporary SQLite file. Use --db-url to test on PostgreSQL (e.g., a local copy),
+where each statement is a network round trip and the difference is larger.
+Note that the script creates and drops all the tables in that database.
+
+Usage:
+    python load_test_questions.py [--db-url URL] [--repeat N]
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+from flask import Flask
+from models.model import db
+from models.model_operations.topic_operations import create_topic
+from models.model_operations.scenario_operations import create_scenario
+from models.model_operations.question_operations import create_question_list
+from models.model_operations.question_operations import create_question_list_bulk
+from util.query_counter import count_queries
+
+
+# The folder of the experiment files
+experiment_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "front-end", "file", "experiment"))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Compare the ORM and bulk paths of creating questions.")
+    parser.add_argument("--db-url", default=None,
+            help="database to test on (all its tables are dropped, default a temporary SQLite file)")
+    parser.add_argument("--repeat", type=int, default=3,
+            help="number of times to load all the surveys with each path")
+    return parser.parse_args(argv[1:])
+
+
+def load_surveys():
+    """Load the survey questions of all the experiment conditions, as {file_name: list of dict}."""
+    surveys = {}
+    for path in sorted(glob.glob(os.path.join(experiment_dir, "scenario_4_question_mode_*_view_*.json"))):
+        with open(path) as f:
+            surveys[os.path.basename(path)] = json.load(f)
+    return surveys
+
+
+def create_app(db_url):
+    app = Flask(__name__)
+    app.config.from_object("config.config.TestingConfig")
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
+    db.init_app(app)
+    return app
+
+
+def run(create, surveys):
+    """
+    Create a scenario for each survey and add the questions by the create function.
+
+    Returns
+    -------
+    tuple
+        Seconds, number of SQL statements, and number of created questions.
+    """
+    db.drop_all()
+    db.create_all()
+    topic = create_topic("load test", "load test")
+    scenario_ids = [create_scenario(name, name, "", topic.id).id for name in surveys]
+    n = 0
+    t = time.perf_counter()
+    with count_queries() as stats:
+        for scenario_id, questions in zip(scenario_ids, surveys.values()):
+            questions = [dict(q, scenario_id=scenario_id) for q in questions]
+            n += len(create(questions))
+            db.session.expunge_all()
+    return (time.perf_counter() - t, stats.count, n)
+
+
+def main(argv):
+    args = parse_args(argv)
+    surveys = load_surveys()
+    db_file = None
+    db_url = args.db_url
+    if db_url is None:
+        fd, db_file = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        db_url = "sqlite:///" + db_file
+    app = create_app(db_url)
+    num_choices = sum(len(q.get("choices") or []) for qs in surveys.values() for q in qs)
+    print("%d surveys, %d choices in total, %s" % (len(surveys), num_choices, db_url.split(":")[0]))
+    with app.app_context():
+        for name, create in [("orm", create_question_list), ("bulk", create_question_list_bulk)]:
+            results = [run(create, surveys) for _ in range(args.repeat)]
+            seconds, statements, n = min(results)
+            print("%-6s %8.3f s   %6d statements   %5d questions" % (name, seconds, statements, n), flush=True)
+        db.drop_all()
+    if db_file is not None:
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
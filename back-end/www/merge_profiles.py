@@ -0,0 +1,167 @@
+"""
+This script merges the request profiles (see util/profiler.py) into a flame-graph-ready format.
+
+The pstats files of the selected endpoints are merged and written as collapsed stacks
+("frame;frame;frame weight" on each line, with the weight in microseconds),
+which can be read by flamegraph.pl, speedscope, or inferno.
+The pstats files only keep the caller-callee pairs (not the full stacks),
+so the time of a function that is called from several places is split in proportion to the time of each call.
+
+Usage:
+    python merge_profiles.py [--dir DIR] [--endpoints ENDPOINT [ENDPOINT ...]] [--output FILE] [--pstats FILE]
+For example, to draw the flame graph of the vision endpoint:
+    python merge_profiles.py --endpoints vision_controller.vision --output vision.folded
+    flamegraph.pl vision.folded > vision.svg
+"""
+
+import sys
+import glob
+import pstats
+import argparse
+import collections
+from os.path import join
+from os.path import basename
+from config.config import config
+
+
+# Stop following the calls deeper than this
+MAX_DEPTH = 200
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Merge the request profiles into collapsed stacks.")
+    parser.add_argument("--dir", default=config.PROFILER_DIR,
+            help="the directory of the profiles (PROFILER_DIR in the config)")
+    parser.add_argument("--endpoints", nargs="+", default=None,
+            help="the endpoints to merge (e.g., vision_controller.vision), all endpoints by default")
+    parser.add_argument("--output", default=None,
+            help="the file to write the collapsed stacks (standard output by default)")
+    parser.add_argument("--pstats", default=None,
+            help="also write the merged profile to this pstats file")
+    return parser.parse_args(argv[1:])
+
+
+def get_profile_files(profile_dir, endpoints=None):
+    """
+    Get the paths to the profiles of the endpoints.
+
+    Parameters
+    ----------
+    profile_dir : str
+        The root directory of the profiles.
+    endpoints : list of str
+        Names of the endpoints (None means all endpoints).
+
+    Returns
+    -------
+    list of str
+        Paths to the pstats files.
+    """
+    if endpoints is None:
+        return sorted(glob.glob(join(profile_dir, "*", "*.pstats")))
+    files = []
+    for e in endpoints:
+        files += sorted(glob.glob(join(profile_dir, e, "*.pstats")))
+    return files
+
+
+def merge_profiles(files):
+    """
+    Merge the pstats files.
+
+    Parameters
+    ----------
+    files : list of str
+        Paths to the pstats files.
+
+    Returns
+    -------
+    pstats.Stats or None
+        The merged profile (None if there are no files).
+    """
+    if len(files) == 0:
+        return None
+    stats = pstats.Stats(files[0])
+    for f in files[1:]:
+        stats.add(f)
+    return stats
+
+
+def get_frame_name(func):
+    """Get the name of a frame from a pstats function key (file name, line number, function name)."""
+    file_name, line, name = func
+    if file_name == "~":
+        frame = name
+    else:
+        frame = "%s (%s:%d)" % (name, basename(file_name), line)
+    return frame.replace(";", ",")
+
+
+def get_collapsed_stacks(stats):
+    """
+    Convert a profile to collapsed stacks.
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        The profile.
+
+    Returns
+    -------
+    collections.Counter
+        The time in microseconds of each stack (frame names joined by ";").
+    """
+    callees = collections.defaultdict(dict)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if len(callers) == 0:
+            roots.append(func)
+        for caller, edge in callers.items():
+            # The edge is (cc, nc, tt, ct) for the calls of func from the caller
+            callees[caller][func] = edge[3]
+    stacks = collections.Counter()
+
+    def walk(func, seconds, path, funcs):
+        tt, ct = stats.stats[func][2], stats.stats[func][3]
+        path = path + [get_frame_name(func)]
+        funcs = funcs | {func}
+        scale = seconds / ct if ct > 0 else 0
+        stacks[";".join(path)] += tt * scale * 1000000
+        if len(path) >= MAX_DEPTH:
+            return
+        for callee, callee_ct in callees[func].items():
+            if callee not in funcs:
+                walk(callee, callee_ct * scale, path, funcs)
+
+    for func in roots:
+        walk(func, stats.stats[func][3], [], frozenset())
+    return stacks
+
+
+def write_collapsed_stacks(stacks, f):
+    """Write the collapsed stacks to a file object (skipping the stacks that took less than a microsecond)."""
+    for stack, us in sorted(stacks.items()):
+        if us >= 1:
+            f.write("%s %d\n" % (stack, round(us)))
+
+
+def main(argv):
+    args = parse_args(argv)
+    files = get_profile_files(args.dir, args.endpoints)
+    stats = merge_profiles(files)
+    if stats is None:
+        print("No profiles found in %s." % args.dir, file=sys.stderr)
+        return
+    print("Merged %d profiles." % len(files), file=sys.stderr)
+    if args.pstats is not None:
+        stats.dump_stats(args.pstats)
+    stacks = get_collapsed_stacks(stats)
+    if args.output is None:
+        write_collapsed_stacks(stacks, sys.stdout)
+    else:
+        with open(args.output, "w") as f:
+            write_collapsed_stacks(stacks, f)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,26 @@
+"""add partial index on in-progress games
+
+Revision ID: 3b7d1e9c4a52
+Revises: fc9e28ea6036
+Create Date: 2026-10-19 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7d1e9c4a52'
+down_revision = 'fc9e28ea6036'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_game_in_progress_start_time', 'game', ['start_time'], unique=False,
+            postgresql_where=sa.text("status = 'IN_PROGRESS'"),
+            sqlite_where=sa.text("status = 'IN_PROGRESS'"))
+
+
+def downgrade():
+    op.drop_index('ix_game_in_progress_start_time', table_name='game')
@@ -0,0 +1,26 @@
+"""add indexes for counting answers by choice and question
+
+Revision ID: 5c1a9d3e7b20
+Revises: 8e2f4c6a1d37
+Create Date: 2026-10-19 15:02:44.530871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1a9d3e7b20'
+down_revision = '8e2f4c6a1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_answers_choice_table_choice_id'), 'answers_choice_table', ['choice_id'], unique=False)
+    op.create_index(op.f('ix_answer_question_id'), 'answer', ['question_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_answer_question_id'), table_name='answer')
+    op.drop_index(op.f('ix_answers_choice_table_choice_id'), table_name='answers_choice_table')
@@ -0,0 +1,30 @@
+"""add tombstone table
+
+Revision ID: 8e2f4c6a1d37
+Revises: 3b7d1e9c4a52
+Create Date: 2026-10-19 13:40:05.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f4c6a1d37'
+down_revision = '3b7d1e9c4a52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tombstone',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_tombstone'))
+    )
+
+
+def downgrade():
+    op.drop_table('tombstone')
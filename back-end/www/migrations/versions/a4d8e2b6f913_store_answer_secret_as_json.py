@@ -0,0 +1,45 @@
+"""store answer secret as json with expression indexes
+
+Revision ID: a4d8e2b6f913
+Revises: 5c1a9d3e7b20
+Create Date: 2026-10-19 16:21:37.864205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8e2b6f913'
+down_revision = '5c1a9d3e7b20'
+branch_labels = None
+depends_on = None
+
+
+# The secret keys that are commonly queried (e.g., by get_prolific_data.py)
+indexed_keys = ['user_platform_id', 'scenario_id']
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Strings that are not JSON objects or arrays are kept as JSON strings
+        op.alter_column('answer', 'secret', type_=postgresql.JSONB(), existing_nullable=True,
+                postgresql_using="CASE WHEN secret ~ '^\\s*[\\{\\[]' THEN secret::jsonb ELSE to_jsonb(secret) END")
+        for k in indexed_keys:
+            op.create_index('ix_answer_secret_%s' % k, 'answer', [sa.text("(secret ->> '%s')" % k)], unique=False)
+    else:
+        # Other databases (e.g., SQLite) store the JSON as text
+        op.execute("UPDATE answer SET secret = json_quote(secret) WHERE secret IS NOT NULL AND json_valid(secret) = 0")
+        for k in indexed_keys:
+            op.create_index('ix_answer_secret_%s' % k, 'answer', [sa.text("json_extract(secret, '$.%s')" % k)], unique=False)
+
+
+def downgrade():
+    for k in indexed_keys:
+        op.drop_index('ix_answer_secret_%s' % k, table_name='answer')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('answer', 'secret', type_=sa.String(), existing_nullable=True,
+                postgresql_using="CASE WHEN jsonb_typeof(secret) = 'string' THEN secret #>> '{}' ELSE secret::text END")
+    else:
+        op.execute("UPDATE answer SET secret = json_extract(secret, '$') WHERE json_type(secret) = 'text'")
@@ -0,0 +1,27 @@
+"""add idempotency key to vision
+
+Revision ID: b7c3f1d95e28
+Revises: a4d8e2b6f913
+Create Date: 2026-10-19 18:42:10.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c3f1d95e28'
+down_revision = 'a4d8e2b6f913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('vision', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    # The existing visions have no key (NULL values do not conflict in a unique index)
+    op.create_index('ix_vision_user_id_idempotency_key', 'vision', ['user_id', 'idempotency_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_vision_user_id_idempotency_key', table_name='vision')
+    op.drop_column('vision', 'idempotency_key')
@@ -0,0 +1,40 @@
+"""add on delete cascade to the foreign keys of dependent rows
+
+Revision ID: c2e5a8f0b3d6
+Revises: b7c3f1d95e28
+Create Date: 2026-10-19 20:11:36.204719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e5a8f0b3d6'
+down_revision = 'b7c3f1d95e28'
+branch_labels = None
+depends_on = None
+
+
+# The foreign keys as (source_table, local_column, referent_table)
+foreign_keys = [
+    ('media', 'vision_id', 'vision'),
+    ('guess', 'game_id', 'game'),
+    ('choice', 'question_id', 'question'),
+    ('answers_choice_table', 'choice_id', 'choice'),
+    ('answers_choice_table', 'answer_id', 'answer')]
+
+
+def replace_foreign_keys(ondelete):
+    for source, column, referent in foreign_keys:
+        name = 'fk_%s_%s_%s' % (source, column, referent)
+        op.drop_constraint(op.f(name), source, type_='foreignkey')
+        op.create_foreign_key(op.f(name), source, referent, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
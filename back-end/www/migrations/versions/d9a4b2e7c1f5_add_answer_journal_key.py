@@ -0,0 +1,27 @@
+"""add journal key to answer
+
+Revision ID: d9a4b2e7c1f5
+Revises: c2e5a8f0b3d6
+Create Date: 2026-10-19 21:37:52.804116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4b2e7c1f5'
+down_revision = 'c2e5a8f0b3d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('answer', sa.Column('journal_key', sa.String(length=32), nullable=True))
+    # The answers that are not written by the write-behind journal have no key (NULL values do not conflict)
+    op.create_index(op.f('ix_answer_journal_key'), 'answer', ['journal_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_answer_journal_key'), table_name='answer')
+    op.drop_column('answer', 'journal_key')
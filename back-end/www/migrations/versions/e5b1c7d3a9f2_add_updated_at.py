@@ -0,0 +1,38 @@
+"""add updated_at to answer, vision, and game
+
+Revision ID: e5b1c7d3a9f2
+Revises: d9a4b2e7c1f5
+Create Date: 2026-10-19 23:12:40.518362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1c7d3a9f2'
+down_revision = 'd9a4b2e7c1f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('answer', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+    op.add_column('vision', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+    op.add_column('game', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+    # The existing rows were last changed when they were created (or when the game ended)
+    op.execute("UPDATE answer SET updated_at = created_at")
+    op.execute("UPDATE vision SET updated_at = created_at")
+    op.execute("UPDATE game SET updated_at = COALESCE(end_time, start_time)")
+    op.create_index(op.f('ix_answer_updated_at'), 'answer', ['updated_at'], unique=False)
+    op.create_index(op.f('ix_vision_updated_at'), 'vision', ['updated_at'], unique=False)
+    op.create_index(op.f('ix_game_updated_at'), 'game', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_game_updated_at'), table_name='game')
+    op.drop_index(op.f('ix_vision_updated_at'), table_name='vision')
+    op.drop_index(op.f('ix_answer_updated_at'), table_name='answer')
+    op.drop_column('game', 'updated_at')
+    op.drop_column('vision', 'updated_at')
+    op.drop_column('answer', 'updated_at')
@@ -0,0 +1,334 @@
+"""
+The write-behind journal of the answers (for the launch bursts of the studies).
+
+When ANSWER_WRITE_BEHIND is on, POST /answer/ validates the answer, appends it to a local SQLite file
+(in WAL mode and synced to the disk before returning), and acknowledges it with the status code 202.
+A background thread of each process takes the answers from the journal in batches
+and writes each batch to the database in one transaction (see flush_journal_answers in answer_operations.py).
+
+Crash recovery:
+    - An answer is removed from the journal only after its batch is committed to the database.
+    - A batch is claimed by a flusher for ANSWER_FLUSH_LEASE seconds, so the batch of a process that crashed
+      is claimed again by another process (or by the same process after the restart).
+    - Each answer has a unique journal_key in the database, so an answer that was committed but not yet removed
+      from the journal is skipped (instead of inserted twice) when its batch is flushed again.
+    - An answer that the database rejects (e.g., its question was deleted) is kept in the journal with the error,
+      so that it does not block the other answers, and can be checked later.
+
+Read-your-writes:
+    The answers of a user that are still in the journal are added to the answers of the user
+    (see get_answers_by_user, get_answers_by_scenario, and get_answers_by_topic in answer_operations.py).
+    The other queries (e.g., the answers of a question or the choice stats) see the answers after they are flushed.
+
+All the uwsgi workers of a server share the journal file.
+Threads do not survive the fork of the uwsgi workers (lazy-apps = false in uwsgi.ini),
+so the flusher thread is started by the first request in each process.
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import datetime
+import threading
+from contextlib import contextmanager
+from sqlalchemy.exc import DataError
+from sqlalchemy.exc import IntegrityError
+from prometheus_client import Counter
+from models.model_operations.answer_operations import flush_journal_answers
+
+
+ANSWERS_FLUSHED = Counter("answer_journal_flushed_total",
+        "Number of answers that were written from the journal to the database.")
+ANSWERS_FAILED = Counter("answer_journal_failed_total",
+        "Number of answers in the journal that were rejected by the database.")
+
+
+class AnswerJournal(object):
+    """
+    The journal of the answers that are not written to the database yet (a SQLite file).
+
+    Each entry is a dictionary in the form:
+        {"key": "..", "user_id": .., "question_id": .., "text": "..",
+         "choices": [{"id": .., "text": "..", "value": ..}] or None, "secret": .., "created_at": datetime}
+
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite file (created if it does not exist).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory != "" and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self.connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS answer_journal ("
+                "key TEXT PRIMARY KEY, user_id INTEGER, question_id INTEGER, text TEXT, choices TEXT, "
+                "secret TEXT, created_at TEXT, claimed_by TEXT, claimed_at REAL, error TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_answer_journal_user_id ON answer_journal (user_id)")
+
+    def connect(self):
+        """Get the connection of this thread (a connection cannot be shared by threads or forked processes)."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            # The transactions are started explicitly (see the transaction function)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Sync the file at each commit, so that an acknowledged answer survives a power failure
+            conn.execute("PRAGMA synchronous=FULL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run the statements in a write transaction (so that two flushers never claim the same answers)."""
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def append(self, user_id, question_id, text=None, choices=None, secret=None):
+        """
+        Append an answer to the journal.
+
+        Parameters
+        ----------
+        user_id : int
+            ID of the user providing the answer.
+        question_id : int
+            ID of the question.
+        text : str
+            The free text answer.
+        choices : list of dict
+            The selected choices, as [{"id": .., "text": "..", "value": ..}].
+        secret : str or dict
+            The secret information of the answer.
+
+        Returns
+        -------
+        dict
+            The journal entry (see the class docstring).
+        """
+        # The time is in UTC with the time zone, so that the database converts it in the same way as
+        # the server default of the created_at column (the session time zone of PostgreSQL, and UTC for SQLite)
+        entry = {"key": uuid.uuid4().hex, "user_id": user_id, "question_id": question_id, "text": text,
+                "choices": choices, "secret": secret, "created_at": datetime.datetime.now(datetime.timezone.utc)}
+        self.connect().execute("INSERT INTO answer_journal "
+                "(key, user_id, question_id, text, choices, secret, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry["key"], user_id, question_id, text, None if choices is None else json.dumps(choices),
+                    None if secret is None else json.dumps(secret), entry["created_at"].isoformat()))
+        return entry
+
+    def claim(self, owner, batch_size, lease):
+        """
+        Claim the oldest answers that are not claimed (or whose claim is older than the lease).
+
+        Parameters
+        ----------
+        owner : str
+            ID of the flusher.
+        batch_size : int
+            Max number of answers to claim.
+        lease : float
+            Seconds before the claim of another flusher expires.
+
+        Returns
+        -------
+        list of dict
+            The claimed entries (in the order they were appended).
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("UPDATE answer_journal SET claimed_by = ?, claimed_at = ? WHERE rowid IN ("
+                    "SELECT rowid FROM answer_journal WHERE error IS NULL AND (claimed_by IS NULL OR claimed_at < ?) "
+                    "ORDER BY rowid LIMIT ?)", (owner, now, now - lease, batch_size))
+            rows = conn.execute("SELECT key, user_id, question_id, text, choices, secret, created_at "
+                    "FROM answer_journal WHERE claimed_by = ? AND claimed_at = ? ORDER BY rowid", (owner, now))
+            return [to_entry(row) for row in rows]
+
+    def release(self, keys):
+        """Give up the claim of the answers (so that they can be flushed again)."""
+        self.__update_keys("UPDATE answer_journal SET claimed_by = NULL, claimed_at = NULL WHERE key IN (%s)", keys)
+
+    def remove(self, keys):
+        """Remove the answers that are committed to the database."""
+        self.__update_keys("DELETE FROM answer_journal WHERE key IN (%s)", keys)
+
+    def fail(self, key, error):
+        """Keep an answer that the database rejected, with the error message (it is not flushed again)."""
+        self.connect().execute("UPDATE answer_journal SET claimed_by = NULL, claimed_at = NULL, error = ? "
+                "WHERE key = ?", (error, key))
+
+    def get_entries_by_user(self, user_id):
+        """Get the answers of a user that are not written to the database yet (in the order they were appended)."""
+        rows = self.connect().execute("SELECT key, user_id, question_id, text, choices, secret, created_at "
+                "FROM answer_journal WHERE user_id = ? AND error IS NULL ORDER BY rowid", (user_id,))
+        return [to_entry(row) for row in rows]
+
+    def count(self, failed=False):
+        """Count the answers that are waiting to be flushed (or the failed ones)."""
+        condition = "error IS NOT NULL" if failed else "error IS NULL"
+        return self.connect().execute("SELECT COUNT(*) FROM answer_journal WHERE " + condition).fetchone()[0]
+
+    def __update_keys(self, statement, keys):
+        if len(keys) > 0:
+            self.connect().execute(statement % ", ".join("?" * len(keys)), list(keys))
+
+
+def to_entry(row):
+    """Convert a row of the journal table to an entry dictionary."""
+    key, user_id, question_id, text, choices, secret, created_at = row
+    return {"key": key, "user_id": user_id, "question_id": question_id, "text": text,
+            "choices": None if choices is None else json.loads(choices),
+            "secret": None if secret is None else json.loads(secret),
+            "created_at": datetime.datetime.fromisoformat(created_at)}
+
+
+class AnswerFlusher(object):
+    """
+    The background thread that writes the answers in the journal to the database.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application (for the database session).
+    journal : AnswerJournal
+        The journal.
+    interval : float
+        Seconds to wait when the journal is drained (or when the database is unavailable).
+    batch_size : int
+        Max number of answers written in one transaction.
+    lease : float
+        Seconds before a claimed batch can be claimed again by another flusher.
+    """
+    def __init__(self, app, journal, interval=1.0, batch_size=500, lease=60.0):
+        self.app = app
+        self.journal = journal
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lease = lease
+        self.owner = None
+        self.thread = None
+        self.pid = None
+        self.stop_event = None
+        self.start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the thread of this process if it is not running (called before each request)."""
+        if self.pid != os.getpid():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self.start()
+
+    def start(self):
+        self.owner = uuid.uuid4().hex
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="answer-flusher", daemon=True)
+        self.thread.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        """Stop the thread and flush the remaining answers (when the process exits)."""
+        if self.thread is not None and self.pid == os.getpid():
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            self.pid = None
+            try:
+                while self.flush() > 0:
+                    pass
+            except Exception:
+                # The answers stay in the journal for the next process
+                pass
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                count = self.flush()
+            except Exception:
+                self.app.logger.exception("Failed to flush the answer journal.")
+                count = 0
+            if count < self.batch_size:
+                self.stop_event.wait(self.interval)
+
+    def flush(self):
+        """
+        Write one batch of answers to the database.
+
+        Returns
+        -------
+        int
+            Number of answers that were claimed from the journal.
+
+        Raises
+        ------
+        exception : Exception
+            When the database is unavailable (the answers are released for the next try).
+        """
+        if self.owner is None:
+            self.owner = uuid.uuid4().hex
+        entries = self.journal.claim(self.owner, self.batch_size, self.lease)
+        if len(entries) == 0:
+            return 0
+        with self.app.app_context():
+            try:
+                ANSWERS_FLUSHED.inc(flush_journal_answers(entries))
+                self.journal.remove([e["key"] for e in entries])
+            except (IntegrityError, DataError):
+                # Find the answers that the database rejects, and write the others
+                self.flush_one_by_one(entries)
+            except Exception:
+                self.journal.release([e["key"] for e in entries])
+                raise
+        return len(entries)
+
+    def flush_one_by_one(self, entries):
+        for i, e in enumerate(entries):
+            try:
+                ANSWERS_FLUSHED.inc(flush_journal_answers([e]))
+                self.journal.remove([e["key"]])
+            except (IntegrityError, DataError) as ex:
+                ANSWERS_FAILED.inc()
+                self.journal.fail(e["key"], str(ex.orig))
+                self.app.logger.error("Answer %s in the journal is rejected by the database: %s", e["key"], ex.orig)
+            except Exception:
+                self.journal.release([x["key"] for x in entries[i:]])
+                raise
+
+
+def init_answer_journal(app, journal=None):
+    """
+    Enable the write-behind mode of the answers if ANSWER_WRITE_BEHIND is on.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    journal : AnswerJournal
+        The journal (for testing), or None to open the ANSWER_JOURNAL_PATH file.
+
+    Returns
+    -------
+    AnswerFlusher or None
+        The flusher of the journal, or None if the write-behind mode is off.
+    """
+    if not app.config.get("ANSWER_WRITE_BEHIND", False):
+        return None
+    if journal is None:
+        journal = AnswerJournal(app.config["ANSWER_JOURNAL_PATH"])
+    flusher = AnswerFlusher(app, journal, interval=app.config.get("ANSWER_FLUSH_INTERVAL", 1.0),
+            batch_size=app.config.get("ANSWER_FLUSH_BATCH_SIZE", 500), lease=app.config.get("ANSWER_FLUSH_LEASE", 60.0))
+    app.extensions["answer_journal"] = journal
+    app.extensions["answer_flusher"] = flusher
+    app.before_request(flusher.ensure_started)
+    atexit.register(flusher.stop)
+    return flusher
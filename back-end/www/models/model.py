@@ -1,10 +1,16 @@
 """Database model for the application."""
 
+import re
 import enum
-from flask_sqlalchemy import SQLAlchemy
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql import func
 from sqlalchemy import MetaData
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import expression
+from models.replica import RoutingSQLAlchemy
 
 
 # Set the naming convention for database columns
@@ -16,8 +22,51 @@ convention = {
     "pk": "pk_%(table_name)s"
 }
 
-# Initalize app with database
-db = SQLAlchemy(metadata=MetaData(naming_convention=convention))
+# Initalize app with database (the read-only queries can be routed to a read replica)
+db = RoutingSQLAlchemy(metadata=MetaData(naming_convention=convention))
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """
+    Make SQLite check the foreign keys and run their ON DELETE rules, like PostgreSQL does.
+
+    SQLite ignores the foreign keys unless this is turned on for each connection
+    (e.g., the testing database and the temporary databases of the load test scripts).
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+class json_text(expression.FunctionElement):
+    """
+    The text value of a key in a JSON column, e.g., json_text(Answer.secret, "user_platform_id").
+
+    It is compiled to the same expression as the indexes in the migrations, so that the queries can use them:
+    (secret ->> 'user_platform_id') on PostgreSQL and json_extract(secret, '$.user_platform_id') on other databases.
+    """
+    type = db.String()
+    name = "json_text"
+    inherit_cache = True
+
+    def __init__(self, column, key):
+        if re.match(r"^\w+$", key) is None:
+            raise ValueError("Invalid JSON key %r." % key)
+        super().__init__(column, expression.literal_column("'%s'" % key))
+
+
+@compiles(json_text, "postgresql")
+def compile_json_text_postgresql(element, compiler, **kw):
+    column, key = element.clauses
+    return "(%s ->> %s)" % (compiler.process(column, **kw), compiler.process(key, **kw))
+
+
+@compiles(json_text)
+def compile_json_text(element, compiler, **kw):
+    column, key = element.clauses
+    return "json_extract(%s, '$.%s')" % (compiler.process(column, **kw), key.name.strip("'"))
 
 
 class User(db.Model):
@@ -175,7 +224,8 @@ class Question(db.Model):
     shuffle_choices = db.Column(db.Boolean, server_default=expression.false())
     scenario_id = db.Column(db.Integer, db.ForeignKey("scenario.id"))
     topic_id = db.Column(db.Integer, db.ForeignKey("topic.id"))
-    choices = db.relationship("Choice", backref=db.backref("question", lazy=True), lazy=True)
+    choices = db.relationship("Choice", backref=db.backref("question", lazy=True), lazy=True,
+            cascade="all, delete", passive_deletes=True)
     answers = db.relationship("Answer", backref=db.backref("question", lazy=True), lazy=True)
 
     def __repr__(self):
@@ -184,8 +234,8 @@ class Question(db.Model):
 
 
 answer_choice_table = db.Table("answers_choice_table", db.Model.metadata,
-        db.Column("choice_id", db.Integer, db.ForeignKey("choice.id")),
-        db.Column("answer_id", db.Integer, db.ForeignKey("answer.id")))
+        db.Column("choice_id", db.Integer, db.ForeignKey("choice.id", ondelete="CASCADE"), index=True),
+        db.Column("answer_id", db.Integer, db.ForeignKey("answer.id", ondelete="CASCADE")))
 
 
 class Choice(db.Model):
@@ -208,9 +258,9 @@ class Choice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String, nullable=False)
     value = db.Column(db.Integer, nullable=True)
-    question_id = db.Column(db.Integer, db.ForeignKey("question.id"))
+    question_id = db.Column(db.Integer, db.ForeignKey("question.id", ondelete="CASCADE"))
     answers = db.relationship("Answer",
-            secondary=answer_choice_table, lazy=True, back_populates="choices")
+            secondary=answer_choice_table, lazy=True, back_populates="choices", passive_deletes=True)
 
     def __repr__(self):
         return "<Choice id=%r text=%r value=%r question_id=%r>" % (
@@ -227,8 +277,10 @@ class Answer(db.Model):
         Unique identifier.
     text : str
         The text of the Answer, only available for FREE_TEXT questions.
-    secret : str
-        Any secret information related to the answer for admin users.
+    secret : dict
+        Any secret information related to the answer for admin users,
+        such as {"user_platform_id": "..", "scenario_id": ..} in the experiments.
+        Stored as JSONB on PostgreSQL (as JSON text on other databases).
     created_at : datetime
         Timestamp of when the answer was submitted.
     user_id : int
@@ -238,15 +290,29 @@ class Answer(db.Model):
     choices : relationship
         The choices a user choose as Answer.
         Only available for SINGLE_CHOICE and MULTI_CHOICE answer.
+    journal_key : str
+        Key of the answer in the write-behind journal (see models/answer_journal.py),
+        so that an answer is not inserted twice when the journal is flushed again after a crash.
+        None for the answers that are written directly.
+    updated_at : datetime
+        Timestamp of the last change (for the incremental export, see export_parquet.py).
     """
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String, nullable=True)
     created_at = db.Column(db.DateTime, server_default=func.now())
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    question_id = db.Column(db.Integer, db.ForeignKey("question.id"))
-    secret = db.Column(db.String, nullable=True)
+    question_id = db.Column(db.Integer, db.ForeignKey("question.id"), index=True)
+    secret = db.Column(db.JSON().with_variant(JSONB(), "postgresql"), nullable=True)
     choices = db.relationship("Choice",
-            secondary=answer_choice_table, lazy="subquery", back_populates="answers")
+            secondary=answer_choice_table, lazy="subquery", back_populates="answers", passive_deletes=True)
+    journal_key = db.Column(db.String(32), nullable=True, unique=True, index=True)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+    # The expression indexes of the secret keys that are commonly queried (see get_answers_by_platform_id)
+    __table_args__ = (
+        db.Index("ix_answer_secret_user_platform_id", json_text(secret, "user_platform_id")),
+        db.Index("ix_answer_secret_scenario_id", json_text(secret, "scenario_id")),
+    )
 
     def __repr__(self):
         return "<Answer id=%r text=%r created_at=%r user_id=%r question_id=%r>" % (
@@ -270,14 +336,26 @@ class Vision(db.Model):
     mood_id : int
         ID of the mood selected by the user to describe the vision.
     medias : relationship
-        List of media objects selected by the user to describe the vision.
+        List of media objects selected by the user to describe the vision (sorted by their order).
+    idempotency_key : str
+        The key sent by the client when creating the vision (unique for each user),
+        so that a retried request returns the same vision instead of creating a new one.
+    updated_at : datetime
+        Timestamp of the last change of the vision or its medias (for the incremental export, see export_parquet.py).
     """
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, server_default=func.now())
     scenario_id = db.Column(db.Integer, db.ForeignKey("scenario.id"))
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     mood_id = db.Column(db.Integer, db.ForeignKey("mood.id"))
-    medias = db.relationship("Media", backref=db.backref("vision", lazy=True), lazy=True)
+    medias = db.relationship("Media", backref=db.backref("vision", lazy=True), lazy=True, order_by="Media.order",
+            cascade="all, delete", passive_deletes=True)
+    idempotency_key = db.Column(db.String(64), nullable=True)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+    __table_args__ = (
+        db.Index("ix_vision_user_id_idempotency_key", user_id, idempotency_key, unique=True),
+    )
 
     def __repr__(self):
         return "<Vision id=%r created_at=%r scenario_id=%r user_id=%r mood_id=%r>" % (
@@ -351,7 +429,7 @@ class Media(db.Model):
     description = db.Column(db.String, nullable=False)
     order = db.Column(db.Integer, nullable=False)
     media_type = db.Column(db.Enum(MediaTypeEnum))
-    vision_id = db.Column(db.Integer, db.ForeignKey("vision.id"))
+    vision_id = db.Column(db.Integer, db.ForeignKey("vision.id", ondelete="CASCADE"))
 
     def __repr__(self):
         return "<Media id=%r url=%r description=%r order=%r media_type=%r vision_id=%r>" % (
@@ -389,6 +467,8 @@ class Game(db.Model):
         ID of the User playing the game.
     guesses : relationship
         List of guesses the user made on the vision.
+    updated_at : datetime
+        Timestamp of the last change (for the incremental export, see export_parquet.py).
     """
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, server_default=func.now())
@@ -397,7 +477,16 @@ class Game(db.Model):
     feedback = db.Column(db.String, nullable=True)
     vision_id = db.Column(db.Integer, db.ForeignKey("vision.id"))
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    guesses = db.relationship("Guess", backref=db.backref("game", lazy=True), lazy=True)
+    guesses = db.relationship("Guess", backref=db.backref("game", lazy=True), lazy=True,
+            cascade="all, delete", passive_deletes=True)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+    # Partial index for finding abandoned game sessions (see set_expired_games_as_error)
+    __table_args__ = (
+        db.Index("ix_game_in_progress_start_time", start_time,
+            postgresql_where=(status == GameStatusEnum.IN_PROGRESS),
+            sqlite_where=(status == GameStatusEnum.IN_PROGRESS)),
+    )
 
     def __repr__(self):
         return "<Game id=%r start_time=%r end_time=%r status=%r vision_id=%r user_id=%r>" % (
@@ -421,9 +510,37 @@ class Guess(db.Model):
         ID of the mood choosen by the user.
     """
     id = db.Column(db.Integer, primary_key=True)
-    game_id = db.Column(db.Integer, db.ForeignKey("game.id"))
+    game_id = db.Column(db.Integer, db.ForeignKey("game.id", ondelete="CASCADE"))
     mood_id = db.Column(db.Integer, db.ForeignKey("mood.id"))
 
     def __repr__(self):
         return "<Guess id=%r game_id=%r mood_id=%r>" % (
                 self.id, self.game_id, self.mood_id)
+
+
+class Tombstone(db.Model):
+    """
+    Class representing the concept of Tombstone (a record of a deleted row).
+
+    Tombstones allow the incremental export (see export_parquet.py)
+    to know which rows are deleted after they were exported.
+
+    Attributes
+    ----------
+    id : int
+        Unique identifier.
+    table_name : str
+        Name of the table that the deleted row belonged to.
+    row_id : int
+        ID of the deleted row.
+    deleted_at : datetime
+        Timestamp of the deletion.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String, nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return "<Tombstone id=%r table_name=%r row_id=%r deleted_at=%r>" % (
+                self.id, self.table_name, self.row_id, self.deleted_at)
@@ -1,6 +1,10 @@
 """Functions to operate the answer table."""
 
+import json
 import itertools
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import func
 from sqlalchemy.orm import lazyload
 from sqlalchemy.orm import load_only
 from models.model import db
@@ -8,9 +12,15 @@ from models.model import Answer
 from models.model import QuestionTypeEnum
 from models.model import Scenario
 from models.model import Question
+from models.model import Choice
+from models.model import answer_choice_table
+from models.model import json_text
+from models.replica import read_only
 from models.model_operations import question_operations
 from models.model_operations import scenario_operations
 from models.model_operations import topic_operations
+from models.model_operations.tombstone_operations import add_tombstone
+from util.util import ValidationError
 
 
 def create_free_text_answer(text, user_id, question_id, secret=None):
@@ -25,8 +35,9 @@ def create_free_text_answer(text, user_id, question_id, secret=None):
         ID of the user providing the answer.
     question_id : int
         ID of the question the user wants to answer.
-    secret : str
+    secret : str or dict
         Any secret information related to the answer for admin users.
+        A JSON object or array string is parsed (see parse_secret).
 
     Returns
     -------
@@ -35,21 +46,16 @@ def create_free_text_answer(text, user_id, question_id, secret=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case that no question is found.
-    exception : Exception
+    exception : ValidationError
         In case the questions is not of type FREE_TEXT.
     """
     question = question_operations.get_question_by_id(question_id)
 
-    if question is None:
-        raise Exception("No question found in the database to create a free text answer.")
+    __check_free_text_question(question)
 
-    # The free text answer is supported only by FREE_TEXT question
-    if question.question_type != QuestionTypeEnum.FREE_TEXT:
-        raise Exception(question.question_type, " question does not support textual answer.")
-
-    answer = Answer(text=text, user_id=user_id, question_id=question_id, secret=secret)
+    answer = Answer(text=text, user_id=user_id, question_id=question_id, secret=parse_secret(secret))
 
     db.session.add(answer)
     db.session.commit()
@@ -72,8 +78,9 @@ def create_choice_answer(choices, user_id, question_id, text=None, secret=None):
     text : str
         String containing the free text answer with the choice answer.
         (for example, an optional textbox for user feedback)
-    secret : str
+    secret : str or dict
         Any secret information related to the answer for admin users.
+        A JSON object or array string is parsed (see parse_secret).
 
     Returns
     -------
@@ -82,38 +89,264 @@ def create_choice_answer(choices, user_id, question_id, text=None, secret=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case that no question is found.
-    exception : Exception
+    exception : ValidationError
         In case the number of choice is more than one and the question type is SINGLE_CHOICE.
     """
+    question = question_operations.get_question_by_id(question_id)
+
+    selected_choices = __select_choices(question, choices)
+
+    answer = Answer(user_id=user_id, choices=selected_choices, question_id=question_id,
+            text=text, secret=parse_secret(secret))
+
+    db.session.add(answer)
+    db.session.commit()
+
+    return answer
+
+
+def __check_free_text_question(question):
+    """Check if a question (a Question object or a cached question) accepts a free text answer."""
+    if question is None:
+        raise ValidationError("No question found in the database to create a free text answer.")
+
+    # The free text answer is supported only by FREE_TEXT question
+    if question.question_type != QuestionTypeEnum.FREE_TEXT:
+        raise ValidationError("%s question does not support textual answer." % question.question_type.value)
+
+
+def __select_choices(question, choices):
+    """Get the choices of a question (a Question object or a cached question) that are selected by an answer."""
     # trick to easily handle single and multi-choice answers
     if not isinstance(choices, list):
         choices = [choices]
 
-    question = question_operations.get_question_by_id(question_id)
-
     if question is None:
-        raise Exception("No question found in the database to create a choice answer.")
+        raise ValidationError("No question found in the database to create a choice answer.")
 
     # If the question is SINGLE_CHOICE you can only have one selected choice
     if question.question_type == QuestionTypeEnum.SINGLE_CHOICE and len(choices) > 1:
-        raise Exception(question.question_type, " question supports only one choice.")
+        raise ValidationError("%s question supports only one choice." % question.question_type.value)
 
-    selected_choices = list(filter(lambda x: x.id in choices, question.choices))
+    return list(filter(lambda x: x.id in choices, question.choices))
 
-    answer = Answer(user_id=user_id, choices=selected_choices, question_id=question_id, text=text, secret=secret)
 
-    db.session.add(answer)
-    db.session.commit()
+def get_answer_journal():
+    """
+    Get the write-behind journal of the answers (see models/answer_journal.py).
+
+    Returns
+    -------
+    AnswerJournal or None
+        The journal of the current app, or None if the ANSWER_WRITE_BEHIND setting is off.
+    """
+    return current_app.extensions.get("answer_journal")
 
-    return answer
+
+def journal_free_text_answer(text, user_id, question_id, secret=None):
+    """
+    Validate an answer for a FREE_TEXT question and append it to the write-behind journal.
+
+    The answer is written to the database later by the flusher thread (see models/answer_journal.py).
+    The parameters are the same as the create_free_text_answer function.
+
+    Returns
+    -------
+    answer : SimpleNamespace
+        The pending answer, with the same attributes as an Answer object (its id is None).
+
+    Raises
+    ------
+    exception : ValidationError
+        In case that no question is found or the question is not of type FREE_TEXT.
+    """
+    question = __get_cached_question(question_id)
+
+    __check_free_text_question(question)
+
+    entry = get_answer_journal().append(user_id, question.id, text=text, secret=parse_secret(secret))
+
+    return to_pending_answer(entry)
+
+
+def journal_choice_answer(choices, user_id, question_id, text=None, secret=None):
+    """
+    Validate an answer for a choice question and append it to the write-behind journal.
+
+    The answer is written to the database later by the flusher thread (see models/answer_journal.py).
+    The parameters are the same as the create_choice_answer function.
+
+    Returns
+    -------
+    answer : SimpleNamespace
+        The pending answer, with the same attributes as an Answer object (its id is None).
+
+    Raises
+    ------
+    exception : ValidationError
+        In case that no question is found.
+    exception : ValidationError
+        In case the number of choice is more than one and the question type is SINGLE_CHOICE.
+    """
+    question = __get_cached_question(question_id)
+
+    selected_choices = [vars(c) for c in __select_choices(question, choices)]
+
+    entry = get_answer_journal().append(user_id, question.id, text=text,
+            choices=selected_choices, secret=parse_secret(secret))
+
+    return to_pending_answer(entry)
+
+
+def __get_cached_question(question_id):
+    """Get the cached question for validating an answer (see get_cached_question in question_operations.py)."""
+    try:
+        question_id = int(question_id)
+    except (TypeError, ValueError):
+        raise ValidationError("The question ID must be an integer.")
+
+    return question_operations.get_cached_question(question_id)
+
+
+def to_pending_answer(entry):
+    """
+    Convert an entry of the write-behind journal to an object that can be dumped by the answer schemas.
+
+    Parameters
+    ----------
+    entry : dict
+        The journal entry (see the AnswerJournal class in models/answer_journal.py).
+
+    Returns
+    -------
+    answer : SimpleNamespace
+        The pending answer, with the same attributes as an Answer object (its id is None).
+    """
+    choices = [SimpleNamespace(**c) for c in entry["choices"] or []]
+    return SimpleNamespace(id=None, text=entry["text"], user_id=entry["user_id"], question_id=entry["question_id"],
+            secret=entry["secret"], created_at=entry["created_at"], choices=choices, journal_key=entry["key"])
+
+
+def flush_journal_answers(entries):
+    """
+    Write a batch of answers from the write-behind journal to the database in one transaction.
+
+    The answers whose journal keys are already in the database (i.e., the batch was committed
+    but not removed from the journal before a crash) are skipped.
+
+    Parameters
+    ----------
+    entries : list of dict
+        The journal entries (see the AnswerJournal class in models/answer_journal.py).
+
+    Returns
+    -------
+    int
+        Number of answers that are inserted.
+
+    Raises
+    ------
+    exception : sqlalchemy.exc.IntegrityError
+        When an answer is rejected by the database (e.g., its question or choice was deleted).
+        Nothing in the batch is written.
+    """
+    keys = [e["key"] for e in entries]
+
+    try:
+        q = db.session.query(Answer.journal_key).filter(Answer.journal_key.in_(keys))
+        flushed_keys = set(k for k, in q)
+        entries = [e for e in entries if e["key"] not in flushed_keys]
+        if len(entries) > 0:
+            answer_ids = __insert_answers([{"text": e["text"], "created_at": e["created_at"], "user_id": e["user_id"],
+                "question_id": e["question_id"], "secret": e["secret"], "journal_key": e["key"]} for e in entries])
+            links = [{"answer_id": answer_id, "choice_id": c["id"]}
+                for answer_id, e in zip(answer_ids, entries) for c in e["choices"] or []]
+            if len(links) > 0:
+                db.session.execute(answer_choice_table.insert(), links)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(entries)
+
+
+def __insert_answers(values):
+    """Insert the rows of the answer table and return their IDs (in the same order as the values)."""
+    table = Answer.__table__
+    if db.session.get_bind().dialect.implicit_returning:
+        # The order of the RETURNING rows is not guaranteed, so the IDs are matched by the journal keys
+        result = db.session.execute(table.insert().values(values).returning(table.c.id, table.c.journal_key))
+        answer_ids = {key: answer_id for answer_id, key in result}
+        return [answer_ids[v["journal_key"]] for v in values]
+    return [db.session.execute(table.insert(), v).inserted_primary_key[0] for v in values]
+
+
+def __add_journal_answers(answers, user_id, question_ids=None):
+    """
+    Add the answers of a user that are still in the write-behind journal (for read-your-writes).
+
+    Parameters
+    ----------
+    answers : list of Answer
+        The answers of the user in the database.
+    user_id : int
+        ID of the user.
+    question_ids : set of int
+        Only add the answers to these questions (None means all the questions).
+
+    Returns
+    -------
+    answers : list of Answer or SimpleNamespace
+        The answers in the database and then the pending answers.
+    """
+    journal = get_answer_journal()
+    if journal is None:
+        return answers
+
+    # An answer can be in both places between the commit of its batch and its removal from the journal
+    flushed_keys = set(a.journal_key for a in answers if a.journal_key is not None)
+    for e in journal.get_entries_by_user(int(user_id)):
+        if e["key"] not in flushed_keys and (question_ids is None or e["question_id"] in question_ids):
+            answers.append(to_pending_answer(e))
+
+    return answers
+
+
+def parse_secret(secret):
+    """
+    Parse the secret information of an answer.
+
+    Only the strings that start with "{" or "[" (after whitespace) are parsed,
+    in the same way as the migration that converts the legacy text secrets (a4d8e2b6f913),
+    so that other strings (e.g., "null" or "123") are kept as JSON strings.
+
+    Parameters
+    ----------
+    secret : str or dict
+        The secret information (e.g., a JSON string sent by the front-end client).
+
+    Returns
+    -------
+    dict or list or str or None
+        The parsed JSON object or array, or the original string if it is not one.
+    """
+    if isinstance(secret, str) and secret.lstrip().startswith(("{", "[")):
+        try:
+            return json.loads(secret)
+        except ValueError:
+            return secret
+    return secret
 
 
 def get_answers_by_user(user_id):
     """
     Get all the answers provided by one user.
 
+    In the write-behind mode, the answers of the user that are not written to the database yet are included.
+
     Parameters
     ----------
     user_id : int
@@ -126,6 +359,8 @@ def get_answers_by_user(user_id):
     """
     answers = Answer.query.filter_by(user_id=user_id).all()
 
+    answers = __add_journal_answers(answers, user_id)
+
     return answers
 
 
@@ -158,6 +393,7 @@ def get_answers_by_scenario(scenario_id, user_id=None):
         ID of the scenario.
     user_id : int
         Desired user ID of the answers.
+        (in the write-behind mode, the answers of the user that are not written to the database yet are included)
 
     Returns
     -------
@@ -166,13 +402,13 @@ def get_answers_by_scenario(scenario_id, user_id=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case that no scenario is found.
     """
     scenario = scenario_operations.get_scenario_by_id(scenario_id)
 
     if scenario is None:
-        raise Exception("No scenario found in the database to get answers.")
+        raise ValidationError("No scenario found in the database to get answers.")
 
     questions = scenario.questions
 
@@ -182,6 +418,7 @@ def get_answers_by_scenario(scenario_id, user_id=None):
     if user_id is not None:
         user_id = int(user_id)
         answers = [a for a in answers if a.user_id==user_id]
+        answers = __add_journal_answers(answers, user_id, question_ids=set(q.id for q in questions))
 
     return answers
 
@@ -196,6 +433,7 @@ def get_answers_by_topic(topic_id, user_id=None):
         ID of the topic.
     user_id : int
         Desired user ID of the answers.
+        (in the write-behind mode, the answers of the user that are not written to the database yet are included)
 
     Returns
     -------
@@ -204,13 +442,13 @@ def get_answers_by_topic(topic_id, user_id=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case that no topic is found.
     """
     topic = topic_operations.get_topic_by_id(topic_id)
 
     if topic is None:
-        raise Exception("No topic found in the database to get answers.")
+        raise ValidationError("No topic found in the database to get answers.")
 
     questions = topic.questions
 
@@ -220,10 +458,102 @@ def get_answers_by_topic(topic_id, user_id=None):
     if user_id is not None:
         user_id = int(user_id)
         answers = [a for a in answers if a.user_id==user_id]
+        answers = __add_journal_answers(answers, user_id, question_ids=set(q.id for q in questions))
+
+    return answers
+
+
+def get_choice_stats(question_id=None, scenario_id=None, topic_id=None):
+    """
+    Count the answers of each choice (i.e., the histogram) of the choice questions.
+
+    The counting is done in the database, so the answers are not loaded.
+    Only one of the question_id, scenario_id, or topic_id parameters should be set.
+
+    Parameters
+    ----------
+    question_id : int
+        ID of the question.
+    scenario_id : int
+        ID of the scenario (for all the questions related to the scenario).
+    topic_id : int
+        ID of the topic (for all the questions related to the topic).
+
+    Returns
+    -------
+    stats : list of dict
+        One dictionary for each question, in the form:
+            {"question_id": ..,
+             "total": number of answers to the question,
+             "choices": [{"id": .., "text": "..", "value": .., "count": number of answers}]}
+
+    Raises
+    ------
+    exception : ValidationError
+        In case the number of the ID parameters is not one.
+    """
+    if [question_id, scenario_id, topic_id].count(None) != 2:
+        raise ValidationError("Specify only one of the question ID, scenario ID, or topic ID.")
+
+    def filter_questions(q, question_column):
+        if question_id is not None:
+            return q.filter(question_column==question_id)
+        q = q.join(Question, question_column==Question.id)
+        if scenario_id is not None:
+            return q.filter(Question.scenario_id==scenario_id)
+        return q.filter(Question.topic_id==topic_id)
+
+    # Count the answers for each choice (including the choices that nobody selected)
+    q = db.session.query(Choice.question_id, Choice.id, Choice.text, Choice.value,
+            func.count(answer_choice_table.c.answer_id))
+    q = q.outerjoin(answer_choice_table, answer_choice_table.c.choice_id==Choice.id)
+    q = filter_questions(q, Choice.question_id)
+    q = q.group_by(Choice.id).order_by(Choice.question_id, Choice.id)
+
+    stats = {}
+    for qid, cid, text, value, count in q:
+        if qid not in stats:
+            stats[qid] = {"question_id": qid, "total": 0, "choices": []}
+        stats[qid]["choices"].append({"id": cid, "text": text, "value": value, "count": count})
+
+    # Count the answers for each question (a multi-choice answer can select several choices)
+    if len(stats) > 0:
+        q = db.session.query(Answer.question_id, func.count(Answer.id))
+        q = filter_questions(q, Answer.question_id)
+        q = q.filter(Answer.question_id.in_(list(stats.keys()))).group_by(Answer.question_id)
+        for qid, total in q:
+            stats[qid]["total"] = total
+
+    return list(stats.values())
+
+
+def get_answers_by_platform_id(user_platform_id, topic_id=None):
+    """
+    Get all the answers that have the user platform ID (e.g., the Prolific ID) in the secret.
+
+    Parameters
+    ----------
+    user_platform_id : str
+        The user ID on the crowdsourcing platform.
+    topic_id : int
+        Only get the answers to the questions related to this topic.
+
+    Returns
+    -------
+    answers : list of Answer
+        The list retrieved answers as Answer objects (or an empty list).
+    """
+    q = Answer.query.filter(json_text(Answer.secret, "user_platform_id")==str(user_platform_id))
+
+    if topic_id is not None:
+        q = q.join(Question, Answer.question_id==Question.id).filter(Question.topic_id==topic_id)
+
+    answers = q.order_by(Answer.id).all()
 
     return answers
 
 
+@read_only
 def get_all_answers():
     """
     Get all answers.
@@ -270,13 +600,14 @@ def remove_answer(answer_id):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case that no answer is found.
     """
     answer = get_answer_by_id(answer_id)
 
     if answer is None:
-        raise Exception("No answer found in the database to delete.")
+        raise ValidationError("No answer found in the database to delete.")
 
+    add_tombstone("answer", answer.id)
     db.session.delete(answer)
     db.session.commit()
@@ -0,0 +1,118 @@
+"""Functions to import an experiment (topics, scenarios, and their questions) in one transaction."""
+
+from models.model import db
+from models.model import Topic
+from models.model import Scenario
+from models.model_operations.question_operations import add_question_list
+from util.util import ValidationError
+
+
+def import_experiment(bundle):
+    """
+    Import an experiment bundle in one transaction (either everything is created or nothing).
+
+    The bundle has the following format (the topic and scenario IDs of the questions are set by this function):
+    {
+        "topics": [{
+            "title": "...",
+            "description": "...",
+            "questions": [...], (the topic questions, e.g., the consent form)
+            "scenarios": [{
+                "title": "...",
+                "description": "...",
+                "image": "...",
+                "mode": 1,
+                "view": 1,
+                "questions": [...] (the scenario questions, with the page numbers)
+            }]
+        }]
+    }
+    Each question has the fields specified in the _create_question function in question_operations.py.
+    The topics and scenarios are inserted first (to get their IDs),
+    and then all the questions and choices of the bundle are inserted by a few set-based statements.
+
+    Parameters
+    ----------
+    bundle : dict
+        The experiment bundle.
+
+    Returns
+    -------
+    dict
+        IDs of the created topics and scenarios, and the number of created questions, in the format of
+        {"topics": [{"id": 1, "scenario_ids": [1]}], "question_count": 100}.
+
+    Raises
+    ------
+    exception : ValidationError
+        When the bundle is not in the above format or a question is invalid.
+    """
+    topics = __get_list(bundle, "topics", "bundle")
+    if len(topics) == 0:
+        raise ValidationError("The bundle must have at least one topic.")
+
+    try:
+        # Insert the topics and scenarios
+        topic_list = []
+        scenario_lists = []
+        for i, t in enumerate(topics):
+            where = "topics[%d]" % i
+            topic = Topic(title=__get_field(t, "title", where), description=__get_field(t, "description", where))
+            scenario_list = []
+            for j, s in enumerate(__get_list(t, "scenarios", where)):
+                where_s = "%s.scenarios[%d]" % (where, j)
+                scenario_list.append(Scenario(topic=topic, title=__get_field(s, "title", where_s),
+                    description=__get_field(s, "description", where_s), image=__get_field(s, "image", where_s),
+                    mode=s.get("mode", 0), view=s.get("view", 0)))
+            topic_list.append(topic)
+            scenario_lists.append(scenario_list)
+        db.session.add_all(topic_list)
+        db.session.flush()
+
+        # Resolve the references of the questions and insert them together
+        questions = []
+        for i, (t, topic, scenario_list) in enumerate(zip(topics, topic_list, scenario_lists)):
+            where = "topics[%d]" % i
+            questions += __set_reference(__get_list(t, "questions", where), where, topic_id=topic.id)
+            for j, (s, scenario) in enumerate(zip(__get_list(t, "scenarios", where), scenario_list)):
+                where_s = "%s.scenarios[%d]" % (where, j)
+                questions += __set_reference(__get_list(s, "questions", where_s), where_s, scenario_id=scenario.id)
+        add_question_list(questions)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        "topics": [{"id": topic.id, "scenario_ids": [s.id for s in scenario_list]}
+            for topic, scenario_list in zip(topic_list, scenario_lists)],
+        "question_count": len(questions)}
+
+
+def __get_list(d, key, where):
+    """Get a list field of a dictionary in the bundle (an empty list if it is missing)."""
+    if type(d) is not dict:
+        raise ValidationError("%s must be a dictionary." % where)
+    value = d.get(key, [])
+    if type(value) is not list:
+        raise ValidationError("%s.%s must be a list." % (where, key))
+    return value
+
+
+def __get_field(d, key, where):
+    """Get a required field of a dictionary in the bundle."""
+    if type(d) is not dict:
+        raise ValidationError("%s must be a dictionary." % where)
+    if d.get(key) is None:
+        raise ValidationError("%s must have '%s'." % (where, key))
+    return d[key]
+
+
+def __set_reference(questions, where, topic_id=None, scenario_id=None):
+    """Copy the questions with the topic or scenario ID (the ones in the bundle are ignored)."""
+    question_list = []
+    for k, q in enumerate(questions):
+        if type(q) is not dict:
+            raise ValidationError("%s.questions[%d] must be a dictionary." % (where, k))
+        question_list.append(dict(q, topic_id=topic_id, scenario_id=scenario_id))
+    return question_list
@@ -2,6 +2,7 @@
 
 import datetime
 from sqlalchemy import func
+from sqlalchemy import select
 from sqlalchemy.sql import exists
 from sqlalchemy.orm import load_only
 from models.model import db
@@ -9,6 +10,9 @@ from models.model import Game
 from models.model import GameStatusEnum
 from models.model import Guess
 from models.model import Vision
+from models.replica import read_only
+from models.model_operations.tombstone_operations import add_tombstones
+from util.util import ValidationError
 
 
 def create_random_game(user_id, scenario_id=None):
@@ -99,26 +103,26 @@ def submit_game(game_id, user_id, feedback, moods, end_time=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case no game is found.
-    exception : Exception
+    exception : ValidationError
         In case the status of the game is not IN_PROGRESS.
-    exception : Exception
+    exception : ValidationError
         In case the submitted end_time is before the game start_time.
-    exception : Exception
+    exception : ValidationError
         In case moods is not a list.
     """
     game = Game.query.filter_by(user_id=user_id, id=game_id).first()
 
     if game is None:
-        raise Exception("No game (created by the user) found in the database to submit.")
+        raise ValidationError("No game (created by the user) found in the database to submit.")
 
     # If the Game is already completed or if it is in an error status, raise an exception
     if game.status != GameStatusEnum.IN_PROGRESS:
-        raise Exception("Game session is already closed.")
+        raise ValidationError("Game session is already closed.")
 
     if type(moods) != list:
-        raise Exception("Moods need to be a list.")
+        raise ValidationError("Moods need to be a list.")
 
     guesses = []
 
@@ -138,7 +142,7 @@ def submit_game(game_id, user_id, feedback, moods, end_time=None):
         # If the provided end time comes before the start time, raise an exception
         if end_time < game.start_time:
             db.session.rollback()
-            raise Exception("The end time must come after the start time.")
+            raise ValidationError("The end time must come after the start time.")
         game.end_time = end_time
 
     db.session.commit()
@@ -157,19 +161,67 @@ def set_as_error(game_id):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case no Game is found.
     """
     game = get_game_by_id(game_id)
 
     if game is None:
-        raise Exception("No game found in the database to set to error.")
+        raise ValidationError("No game found in the database to set to error.")
 
     game.status = GameStatusEnum.ERROR
 
     db.session.commit()
 
 
+def set_expired_games_as_error(ttl, batch_size=500, max_batches=None):
+    """
+    Set the abandoned games (IN_PROGRESS for too long) in the Error state.
+
+    Games are updated in small batches, and each batch is committed separately,
+    so that the row locks are only held for a short time.
+    Rows that are locked by other transactions (e.g., a user submitting the game) are skipped.
+
+    Parameters
+    ----------
+    ttl : int
+        Time to live (in seconds) of an IN_PROGRESS game, counted from its start time.
+    batch_size : int
+        Maximum number of games to update in one transaction.
+    max_batches : int
+        Maximum number of batches to run (None means running until no game is left).
+
+    Returns
+    -------
+    count : int
+        The number of games that are set to the Error state.
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=ttl)
+    count = 0
+    num_batches = 0
+
+    while max_batches is None or num_batches < max_batches:
+        # Use the partial index on IN_PROGRESS games to find a batch of expired games
+        q = db.session.query(Game.id).filter(Game.status==GameStatusEnum.IN_PROGRESS, Game.start_time<cutoff)
+        q = q.order_by(Game.start_time).limit(batch_size).with_for_update(skip_locked=True)
+        game_ids = [g.id for g in q]
+
+        if len(game_ids) == 0:
+            db.session.commit()
+            break
+
+        # Double check the status to avoid overwriting games that are submitted in the meantime
+        count += Game.query.filter(Game.id.in_(game_ids), Game.status==GameStatusEnum.IN_PROGRESS).update(
+                {Game.status: GameStatusEnum.ERROR}, synchronize_session=False)
+        db.session.commit()
+        num_batches += 1
+
+        if len(game_ids) < batch_size:
+            break
+
+    return count
+
+
 def get_game_by_id(game_id):
     """
     Retrieve a Game from its ID.
@@ -227,6 +279,7 @@ def get_games_by_vision(vision_id):
     return games
 
 
+@read_only
 def get_all_games():
     """
     Get all games.
@@ -253,18 +306,44 @@ def remove_game(game_id):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case that no game is found.
     """
-    # TODO: need a testing case
-    game = get_game_by_id(game_id)
+    if remove_game_list([game_id]) == 0:
+        raise ValidationError("No game found in the database to delete.")
 
-    if game is None:
-        raise Exception("No game found in the database to delete.")
 
-    # Delete existing guesses
-    for g in game.guesses:
-        db.session.delete(g)
+def remove_game_list(game_id_list):
+    """
+    Remove a list of games and their guesses.
+
+    The tombstones are added by one INSERT ... SELECT statement,
+    and the games are deleted by one set-based statement (DELETE ... WHERE ... IN ...)
+    in the same transaction. The database deletes their guesses (ON DELETE CASCADE).
+
+    Parameters
+    ----------
+    game_id_list : list of int
+        IDs of the games.
+
+    Returns
+    -------
+    int
+        Number of the deleted games.
+
+    Raises
+    ------
+    exception : ValidationError
+        When the input is not a list.
+    """
+    if type(game_id_list) is not list:
+        raise ValidationError("The input must be a list of game IDs.")
 
-    db.session.delete(game)
+    if len(game_id_list) == 0:
+        return 0
+
+    add_tombstones("game", select(Game.id).where(Game.id.in_(game_id_list)))
+    n = Game.query.filter(Game.id.in_(game_id_list)).delete(synchronize_session="fetch")
     db.session.commit()
+
+    return n
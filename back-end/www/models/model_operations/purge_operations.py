@@ -0,0 +1,133 @@
+"""Functions to delete a whole scenario or topic with all the rows that depend on it."""
+
+from sqlalchemy import select
+from sqlalchemy import or_
+from models.model import db
+from models.model import Topic
+from models.model import Scenario
+from models.model import Question
+from models.model import Answer
+from models.model import Vision
+from models.model import Game
+from models.model_operations.tombstone_operations import add_tombstones
+from models.model_operations.question_operations import clear_question_cache
+from util.util import ValidationError
+
+
+def purge_scenario(scenario_id):
+    """
+    Delete a scenario and all the rows that depend on it.
+
+    The deleted rows are the questions of the scenario, their choices and answers,
+    the visions of the scenario, their medias, and the games (with their guesses) that use the visions.
+
+    Parameters
+    ----------
+    scenario_id : int
+        ID of the scenario.
+
+    Returns
+    -------
+    dict
+        Number of the deleted rows of each table (see the __purge function).
+
+    Raises
+    ------
+    exception : ValidationError
+        When no scenario is found.
+    """
+    if Scenario.query.filter_by(id=scenario_id).first() is None:
+        raise ValidationError("No scenario found in the database to delete.")
+
+    scenario_ids = select(Scenario.id).where(Scenario.id == scenario_id)
+    question_ids = select(Question.id).where(Question.scenario_id == scenario_id)
+
+    return __purge(scenario_ids, question_ids)
+
+
+def purge_topic(topic_id):
+    """
+    Delete a topic and all the rows that depend on it.
+
+    The deleted rows are the scenarios of the topic (see the purge_scenario function)
+    and the questions of the topic (with their choices and answers).
+
+    Parameters
+    ----------
+    topic_id : int
+        ID of the topic.
+
+    Returns
+    -------
+    dict
+        Number of the deleted rows of each table (see the __purge function).
+
+    Raises
+    ------
+    exception : ValidationError
+        When no topic is found.
+    """
+    if Topic.query.filter_by(id=topic_id).first() is None:
+        raise ValidationError("No topic found in the database to delete.")
+
+    scenario_ids = select(Scenario.id).where(Scenario.topic_id == topic_id)
+    question_ids = select(Question.id).where(or_(Question.topic_id == topic_id,
+        Question.scenario_id.in_(scenario_ids)))
+
+    return __purge(scenario_ids, question_ids, topic_id=topic_id)
+
+
+def __purge(scenario_ids, question_ids, topic_id=None):
+    """
+    Delete the scenarios, the questions, and the rows that depend on them in one transaction.
+
+    Each table is deleted by one set-based statement (DELETE ... WHERE ... IN (SELECT ...)),
+    from the children to the parents, so that no foreign key is violated in the middle.
+    The database deletes the choices of the answers, the choices of the questions,
+    the guesses of the games, and the medias of the visions (ON DELETE CASCADE).
+    The tombstones of the deleted answers, games, and visions are added by INSERT ... SELECT.
+
+    Parameters
+    ----------
+    scenario_ids : sqlalchemy.sql.Select
+        A query that selects the IDs of the scenarios to delete.
+    question_ids : sqlalchemy.sql.Select
+        A query that selects the IDs of the questions to delete.
+    topic_id : int
+        ID of the topic to delete (None means not deleting a topic).
+
+    Returns
+    -------
+    dict
+        Number of the deleted rows of each table, as {table_name: count}.
+        (the rows that the database deletes by ON DELETE CASCADE are not counted)
+    """
+    answer_ids = select(Answer.id).where(Answer.question_id.in_(question_ids))
+    vision_ids = select(Vision.id).where(Vision.scenario_id.in_(scenario_ids))
+    game_ids = select(Game.id).where(Game.vision_id.in_(vision_ids))
+    counts = {}
+
+    try:
+        add_tombstones("answer", answer_ids)
+        counts["answer"] = __delete(Answer, Answer.id.in_(answer_ids))
+        counts["question"] = __delete(Question, Question.id.in_(question_ids))
+        add_tombstones("game", game_ids)
+        counts["game"] = __delete(Game, Game.id.in_(game_ids))
+        add_tombstones("vision", vision_ids)
+        counts["vision"] = __delete(Vision, Vision.id.in_(vision_ids))
+        counts["scenario"] = __delete(Scenario, Scenario.id.in_(scenario_ids))
+        if topic_id is not None:
+            counts["topic"] = __delete(Topic, Topic.id == topic_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # The IDs of the deleted questions are not loaded, so the whole cache is cleared
+    clear_question_cache()
+
+    return counts
+
+
+def __delete(model, criterion):
+    """Delete the rows of a model by one statement, and remove the deleted objects from the session."""
+    return model.query.filter(criterion).delete(synchronize_session="fetch")
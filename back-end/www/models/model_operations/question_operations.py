@@ -1,9 +1,17 @@
 """Functions to operate the question table."""
 
+import json
+import time
+from types import SimpleNamespace
+from urllib.parse import quote
+from flask import current_app
+from sqlalchemy.orm import selectinload
 from models.model import db
 from models.model import Question
 from models.model import QuestionTypeEnum
 from models.model import Choice
+from models.model import Answer
+from util.util import ValidationError
 
 
 def create_question_list(questions):
@@ -23,11 +31,11 @@ def create_question_list(questions):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When the input is not a list.
     """
     if type(questions) is not list:
-        raise Exception("The input must be a list of questions.")
+        raise ValidationError("The input must be a list of questions.")
 
     question_list = []
     for q in questions:
@@ -39,6 +47,125 @@ def create_question_list(questions):
     return question_list
 
 
+def create_question_list_bulk(questions):
+    """
+    Create a list of questions with set-based statements.
+
+    This is faster than the create_question_list function for large surveys,
+    which flushes the questions and choices one row at a time.
+    On PostgreSQL, the question IDs are taken from the sequence by one query, and the questions are inserted
+    with these IDs by one executemany statement (on other databases, e.g., SQLite, one INSERT per question).
+    Then all the choices are inserted by one executemany statement.
+
+    Parameters
+    ----------
+    questions : list of dict
+        A list of dictionaries.
+        Each dictionary has the fields specified in the _create_question function.
+
+    Returns
+    -------
+    question_list : list of Question
+        The list of created questions as Question objects (in the same order as the input).
+
+    Raises
+    ------
+    exception : ValidationError
+        When the input is not a list.
+    """
+    if type(questions) is not list:
+        raise ValidationError("The input must be a list of questions.")
+
+    if len(questions) == 0:
+        return []
+
+    question_ids = add_question_list(questions)
+    db.session.commit()
+
+    # Load the created questions with their choices by two queries
+    query = Question.query.filter(Question.id.in_(question_ids)).options(selectinload(Question.choices))
+    loaded = {q.id: q for q in query.all()}
+
+    return [loaded[question_id] for question_id in question_ids]
+
+
+def add_question_list(questions):
+    """
+    Insert a list of questions and their choices without committing (see create_question_list_bulk).
+
+    The caller commits or rolls back, so that the questions can be added
+    in the same transaction as other rows (e.g., see experiment_operations.py).
+
+    Parameters
+    ----------
+    questions : list of dict
+        A list of dictionaries.
+        Each dictionary has the fields specified in the _create_question function.
+
+    Returns
+    -------
+    question_ids : list of int
+        IDs of the inserted questions (in the same order as the input).
+
+    Raises
+    ------
+    exception : ValidationError
+        When a question is invalid (nothing is inserted in this case).
+    """
+    if len(questions) == 0:
+        return []
+
+    # Check the input with the same rules as the create_question_list function
+    question_list = [_create_question(**q) for q in questions]
+
+    question_ids = __insert_questions([__get_question_values(q) for q in question_list])
+    choice_values = []
+    for question_id, q in zip(question_ids, question_list):
+        for c in q.choices:
+            choice_values.append({"text": c.text, "value": c.value, "question_id": question_id})
+    if len(choice_values) > 0:
+        db.session.execute(Choice.__table__.insert(), choice_values)
+
+    return question_ids
+
+
+def __get_question_values(question):
+    """Get the column values of a Question object that is not added to the session."""
+    return {
+        "text": question.text,
+        "question_type": question.question_type,
+        "order": question.order,
+        "page": question.page,
+        "shuffle_choices": bool(question.shuffle_choices),
+        "topic_id": question.topic_id,
+        "scenario_id": question.scenario_id}
+
+
+def __insert_questions(values):
+    """Insert the rows of the question table and return their IDs (in the same order as the values)."""
+    table = Question.__table__
+    question_ids = __allocate_question_ids(len(values))
+    if question_ids is None:
+        # Without a sequence (e.g., SQLite), each row is inserted to get its ID
+        return [db.session.execute(table.insert(), v).inserted_primary_key[0] for v in values]
+    # The rows are inserted with the allocated IDs by one executemany statement
+    db.session.execute(table.insert(), [dict(v, id=i) for v, i in zip(values, question_ids)])
+    return question_ids
+
+
+def __allocate_question_ids(n):
+    """
+    Take n IDs from the sequence of the question table (by one query), or return None if there is no sequence.
+
+    The IDs are set explicitly in the INSERT, so that each question is matched to its choices by its position
+    (the order of the rows returned by INSERT ... RETURNING is not guaranteed).
+    """
+    if db.session.get_bind().dialect.name != "postgresql":
+        return None
+    q = db.text("SELECT nextval(pg_get_serial_sequence('question', 'id')) FROM generate_series(1, :n)")
+    return [row[0] for row in db.session.execute(q, {"n": n})]
+
+
 def _create_question(text=None, choices=None, topic_id=None, scenario_id=None, order=0, page=-1,
         shuffle_choices=False, is_just_description=False, is_mulitple_choice=False, is_create_vision=False):
     """
@@ -77,23 +204,23 @@ def _create_question(text=None, choices=None, topic_id=None, scenario_id=None, o
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         In case the text is None.
-    exception : Exception
+    exception : ValidationError
         In case both topic ID and scenario ID are None.
-    exception : Exception
+    exception : ValidationError
         In case both topic ID and scenario ID are passed to the function.
-    exception : Exception
+    exception : ValidationError
         In case that the choices parameter is not None and not a list.
     """
     if text is None:
-        raise Exception("Question body text cannot be None.")
+        raise ValidationError("Question body text cannot be None.")
 
     if topic_id is None and scenario_id is None:
-        raise Exception("Topic ID and Scenario ID cannot be both None.")
+        raise ValidationError("Topic ID and Scenario ID cannot be both None.")
 
     if topic_id is not None and scenario_id is not None:
-        raise Exception("Specify only the Topic ID or the Scenario ID (not both).")
+        raise ValidationError("Specify only the Topic ID or the Scenario ID (not both).")
 
     if is_just_description:
         # Create only the description (but not a question)
@@ -115,7 +242,7 @@ def _create_question(text=None, choices=None, topic_id=None, scenario_id=None, o
                 topic_id=topic_id, scenario_id=scenario_id, order=order, page=page)
     else:
         if type(choices) != list:
-            raise Exception("Choices need to be a list.")
+            raise ValidationError("Choices need to be a list.")
         if is_mulitple_choice:
             # Create a multiple choice question
             question = Question(text=text, question_type=QuestionTypeEnum.MULTI_CHOICE,
@@ -207,6 +334,60 @@ def get_question_by_id(question_id, page=None):
     return question
 
 
+def get_cached_question(question_id):
+    """
+    Get the type and the choices of a question, cached in the current app for ANSWER_QUESTION_CACHE_TTL seconds.
+
+    This is for validating the answers in the write-behind mode (see answer_operations.py),
+    so that a burst of answers does not read the same question from the database again and again.
+    The cache of this process is cleared when a question is updated or removed (see clear_question_cache),
+    and the other processes see the change after the TTL.
+
+    Parameters
+    ----------
+    question_id : int
+        ID of the question.
+
+    Returns
+    -------
+    question : SimpleNamespace or None
+        The question with the id, question_type, and choices (with the id, text, and value) attributes,
+        or None if nothing is found (which is not cached).
+    """
+    cache = current_app.extensions.setdefault("question_cache", {})
+    now = time.monotonic()
+    loaded_at, question = cache.get(question_id, (None, None))
+    if loaded_at is None or now - loaded_at >= current_app.config.get("ANSWER_QUESTION_CACHE_TTL", 60):
+        q = get_question_by_id(question_id)
+        if q is None:
+            cache.pop(question_id, None)
+            return None
+        question = SimpleNamespace(id=q.id, question_type=q.question_type,
+                choices=[SimpleNamespace(id=c.id, text=c.text, value=c.value) for c in q.choices])
+        cache[question_id] = (now, question)
+
+    return question
+
+
+def clear_question_cache(question_ids=None):
+    """
+    Remove questions from the cache of the current app (see get_cached_question).
+
+    Parameters
+    ----------
+    question_ids : list of int
+        IDs of the questions (None means all the questions).
+    """
+    cache = current_app.extensions.get("question_cache")
+    if cache is None:
+        return
+    if question_ids is None:
+        cache.clear()
+    else:
+        for question_id in question_ids:
+            cache.pop(question_id, None)
+
+
 def get_questions_by_topic(topic_id, page=None):
     """
     Get all the questions related to a topic.
@@ -316,33 +497,33 @@ def update_question(question_id, text=None, choices=None, topic_id=None, scenari
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When question ID is None.
-    exception : Exception
+    exception : ValidationError
         When no question is found.
-    exception : Exception
+    exception : ValidationError
        In case you attempt to add Choices to a FREE_TEXT question.
-    exception : Exception
+    exception : ValidationError
        In case you attempt to add Choices to a question with question_type None.
-    exception : Exception
+    exception : ValidationError
         In case that the choices parameter is not a list.
-    exception : Exception
+    exception : ValidationError
         In case that the length of old and new choices are not the same.
-    exception : Exception
+    exception : ValidationError
         In case both topic ID and scenario ID are passed to the function.
-    exception : Exception
+    exception : ValidationError
         In case of updating the topic ID when the original one is None.
-    exception : Exception
+    exception : ValidationError
         In case of updating the scenario ID when the original one is None.
     """
     # TODO: need to improve the testing case
     if question_id is None:
-        raise Exception("Question ID cannot be None.")
+        raise ValidationError("Question ID cannot be None.")
 
     question = get_question_by_id(question_id)
 
     if question is None:
-        raise Exception("No question found in the database to update.")
+        raise ValidationError("No question found in the database to update.")
 
     if text is not None:
         question.text = text
@@ -358,73 +539,87 @@ def update_question(question_id, text=None, choices=None, topic_id=None, scenari
 
     if topic_id is not None:
         if scenario_id is not None:
-            raise Exception("Specify only the Topic ID or the Scenario ID.")
+            raise ValidationError("Specify only the Topic ID or the Scenario ID.")
         else:
             if question.topic_id is None:
-                raise Exception("Cannot update topic ID since the original one is None.")
+                raise ValidationError("Cannot update topic ID since the original one is None.")
             else:
                 question.topic_id = topic_id
     else:
         if scenario_id is not None:
             if question.scenario_id is None:
-                raise Exception("Cannot update scenario ID since the original one is None.")
+                raise ValidationError("Cannot update scenario ID since the original one is None.")
             else:
                 question.scenario_id = scenario_id
 
     if choices is not None:
         if type(choices) != list:
-            raise Exception("Choices need to be a list.")
+            raise ValidationError("Choices need to be a list.")
         if question.question_type is None:
-            raise Exception("Question with type None does not support choices.")
+            raise ValidationError("Question with type None does not support choices.")
         else:
             if question.question_type != QuestionTypeEnum.FREE_TEXT:
                 if len(question.choices) != len(choices):
-                    raise Exception("The length of old and new choices must be the same.")
+                    raise ValidationError("The length of old and new choices must be the same.")
                 else:
                     # Update existing choices
                     for i in range(len(choices)):
                         c = choices[i]
                         if "value" not in c or "text" not in c:
-                            raise Exception("Each choice must have both the 'text' and 'value' fields.")
+                            raise ValidationError("Each choice must have both the 'text' and 'value' fields.")
                         question.choices[i].value = c["value"]
                         question.choices[i].text = c["text"]
             else:
                 # You cannot add choices to a FREE_TEXT answer
-                raise Exception(QuestionTypeEnum.FREE_TEXT, " does not support choices")
+                raise ValidationError("%s question does not support choices." % QuestionTypeEnum.FREE_TEXT.value)
 
     db.session.commit()
+    clear_question_cache([question.id])
 
     return question
 
 
 def remove_question_list(question_id_list):
     """
-    Remove a list of questions.
+    Remove a list of questions and their choices.
+
+    The questions are deleted by one set-based statement (DELETE ... WHERE ... IN ...),
+    and the database deletes their choices (ON DELETE CASCADE) and the links of the answers to the choices.
+    The answers to the questions are kept with a NULL question ID (as the ORM did when deleting a question),
+    in the same transaction.
 
     Parameters
     ----------
-    question_id : int
-        ID of the question.
+    question_id_list : list of int
+        IDs of the questions.
+
+    Returns
+    -------
+    int
+        Number of the deleted questions.
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When the input is not a list.
     """
     if type(question_id_list) is not list:
-        raise Exception("The input must be a list of question IDs.")
+        raise ValidationError("The input must be a list of question IDs.")
 
-    questions = []
-    for qid in question_id_list:
-        q = get_question_by_id(qid)
-        if q is None: continue
-        # Delete existing choices
-        for c in q.choices:
-            db.session.delete(c)
-        # Delete the question
-        db.session.delete(q)
+    if len(question_id_list) == 0:
+        return 0
 
-    db.session.commit()
+    try:
+        Answer.query.filter(Answer.question_id.in_(question_id_list)).update(
+                {"question_id": None}, synchronize_session="fetch")
+        n = Question.query.filter(Question.id.in_(question_id_list)).delete(synchronize_session="fetch")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    clear_question_cache(question_id_list)
+
+    return n
 
 
 def remove_question(question_id):
@@ -449,6 +644,8 @@ def create_choice(c):
     ----------
     c : dict
         The choice dictionary, in the format of {"text:"option label","value":option_value}.
+        The text can also be a dictionary (e.g., an image with its URL and credit),
+        which is encoded in the same way as the front-end does (see the encode_choice_text function).
 
     Returns
     -------
@@ -457,14 +654,36 @@ def create_choice(c):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
        In case the choice dictionary does not have both the "text" and "value" fields.
     """
     if "value" not in c or "text" not in c:
-        raise Exception("Each choice must have both the 'text' and 'value' fields.")
+        raise ValidationError("Each choice must have both the 'text' and 'value' fields.")
 
     value = c["value"]
     text = c["text"]
+    if isinstance(text, dict):
+        text = encode_choice_text(text)
     choice = Choice(text=text,value=value)
 
     return choice
+
+
+def encode_choice_text(text):
+    """
+    Encode a dictionary choice text into a string.
+
+    This is the same as encodeURIComponent(JSON.stringify(text)) in the createQuestionList function
+    of the front-end (front-end/js/environment.js), which decodes the text to show the image choices.
+
+    Parameters
+    ----------
+    text : dict
+        The choice text.
+
+    Returns
+    -------
+    str
+        The encoded text.
+    """
+    return quote(json.dumps(text, separators=(",", ":"), ensure_ascii=False), safe="-_.!~*'()")
@@ -2,6 +2,7 @@
 
 from models.model import db
 from models.model import Scenario
+from util.util import ValidationError
 
 
 def create_scenario(title, description, image, topic_id, mode=0, view=0):
@@ -120,13 +121,13 @@ def update_scenario(scenario_id, title=None, description=None, image=None, topic
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no scenario is found.
     """
     scenario = get_scenario_by_id(scenario_id)
 
     if scenario is None:
-        raise Exception("No scenario found in the database to update.")
+        raise ValidationError("No scenario found in the database to update.")
 
     if title is not None:
         scenario.title = title
@@ -162,13 +163,13 @@ def remove_scenario(scenario_id):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no scenario is found.
     """
     scenario = get_scenario_by_id(scenario_id)
 
     if scenario is None:
-        raise Exception("No scenario found in the database to delete.")
+        raise ValidationError("No scenario found in the database to delete.")
 
     db.session.delete(scenario)
     db.session.commit()
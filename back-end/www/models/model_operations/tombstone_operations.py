@@ -0,0 +1,77 @@
+"""Functions to operate the tombstone table."""
+
+from sqlalchemy import select
+from sqlalchemy import literal
+from models.model import db
+from models.model import Tombstone
+
+
+def add_tombstone(table_name, row_id):
+    """
+    Record that a row is deleted.
+
+    The tombstone is added to the current session but not committed,
+    so that it is committed together with the deletion.
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table that the deleted row belongs to.
+    row_id : int
+        ID of the deleted row.
+
+    Returns
+    -------
+    tombstone : Tombstone
+        The created tombstone object.
+    """
+    tombstone = Tombstone(table_name=table_name, row_id=row_id)
+
+    db.session.add(tombstone)
+
+    return tombstone
+
+
+def add_tombstones(table_name, row_ids):
+    """
+    Record that many rows are deleted, by one INSERT ... SELECT statement.
+
+    This must be called before the rows are deleted, and it is not committed
+    (so that it is committed together with the deletion).
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table that the deleted rows belong to.
+    row_ids : sqlalchemy.sql.Select
+        A query that selects the IDs of the rows that will be deleted.
+
+    Returns
+    -------
+    int
+        Number of the added tombstones.
+    """
+    ids = row_ids.subquery()
+    stmt = Tombstone.__table__.insert().from_select(["table_name", "row_id"],
+            select(literal(table_name), *ids.c))
+
+    return db.session.execute(stmt).rowcount
+
+
+def get_tombstones_by_table(table_name):
+    """
+    Get all the tombstones of a table.
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table.
+
+    Returns
+    -------
+    tombstones : list of Tombstone
+        The list of retrieved tombstone objects.
+    """
+    tombstones = Tombstone.query.filter_by(table_name=table_name).order_by(Tombstone.id).all()
+
+    return tombstones
@@ -2,6 +2,7 @@
 
 from models.model import db
 from models.model import Topic
+from util.util import ValidationError
 
 
 def create_topic(title, description):
@@ -82,13 +83,13 @@ def update_topic(topic_id, title=None, description=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no topic is found.
     """
     topic = get_topic_by_id(topic_id)
 
     if topic is None:
-        raise Exception("No topic found in the database to update.")
+        raise ValidationError("No topic found in the database to update.")
 
     if title is not None:
         topic.title = title
@@ -112,13 +113,13 @@ def remove_topic(topic_id):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no topic is found.
     """
     topic = get_topic_by_id(topic_id)
 
     if topic is None:
-        raise Exception("No topic found in the database to delete.")
+        raise ValidationError("No topic found in the database to delete.")
 
     db.session.delete(topic)
     db.session.commit()
@@ -2,6 +2,7 @@
 
 from models.model import db
 from models.model import User
+from util.util import ValidationError
 
 
 def create_user(client_id):
@@ -92,14 +93,14 @@ def update_client_type_by_user_id(user_id, client_type):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no user is found.
     """
     # TODO: need a testing case
     user = User.query.filter_by(id=user_id).first()
 
     if user is None:
-        raise Exception("No user found in the database to update.")
+        raise ValidationError("No user found in the database to update.")
 
     user.client_type = client_type
 
@@ -119,13 +120,13 @@ def remove_user(user_id):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no user is found.
     """
     user = User.query.filter_by(id=user_id).first()
 
     if user is None:
-        raise Exception("No user found in the database to delete.")
+        raise ValidationError("No user found in the database to delete.")
 
     db.session.delete(user)
     db.session.commit()
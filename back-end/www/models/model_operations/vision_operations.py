@@ -1,12 +1,30 @@
 """Functions to operate the mood, media, and vision tables."""
 
+import time
+import collections
 from sqlalchemy import desc
+from sqlalchemy import select
 from sqlalchemy import func
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
 from models.model import db
 from models.model import Vision
 from models.model import Media
 from models.model import MediaTypeEnum
 from models.model import Mood
+from models.model_operations.tombstone_operations import add_tombstones
+from util.util import ValidationError
+
+
+# Seconds to keep a created vision in the cache of the idempotency keys (see get_vision_by_idempotency_key)
+RECENT_VISIONS_TTL = 600
+
+# Max number of visions in the cache
+RECENT_VISIONS_MAX_SIZE = 10000
+
+# The recently created visions of this process, as {(user_id, idempotency_key): (created_at, vision_id)}
+# (the unique index on the vision table is the real check, and this cache only saves the lookups of retries)
+_recent_visions = collections.OrderedDict()
 
 
 def create_mood(name, image=None, order=None):
@@ -78,7 +96,7 @@ def remove_mood(mood_id):
     mood = get_mood_by_id(mood_id)
 
     if mood is None:
-        raise Exception("No mood found in the database to delete.")
+        raise ValidationError("No mood found in the database to delete.")
 
     db.session.delete(mood)
     db.session.commit()
@@ -106,14 +124,14 @@ def update_mood(mood_id, name=None, image=None, order=None):
 
     Raises
     ------
-    exception : Exception
+    exception : ValidationError
         When no mood is found.
     """
     # TODO: need a testing case
     mood = get_mood_by_id(mood_id)
 
     if mood is None:
-        raise Exception("No mood found in the database to update.")
+        raise ValidationError("No mood found in the database to update.")
 
     if name is not None:
         mood.name = name
@@ -129,14 +147,12 @@ def update_mood(mood_id, name=None, image=None, order=None):
     return mood
 
 
-def __create_media_array(vision_id, medias):
+def __get_media_values(medias):
     """
-    Create a list of Media objects and attach it to a Vision.
+    Get the column values of the Media rows (without the vision ID).
 
     Parameters
     ----------
-    vision_id : int
-        ID of the vision.
     medias : list
         Array of objects in the form:
             [{"description": "..",
@@ -151,47 +167,41 @@ def __create_media_array(vision_id, medias):
 
     Returns
     -------
-    vision_medias : list of Media
-        Array of Media objects.
+    list of dict
+        The column values of each media (all dicts have the same keys, as required by executemany).
     """
-    vision_medias = []
+    values = []
 
     for index, media in enumerate(medias):
+        v = {"description": media["description"],
+                "order": index,
+                "url": None,
+                "unsplash_image_id": None,
+                "unsplash_creator_name": None,
+                "unsplash_creator_url": None}
         if "url" not in media or media["url"] is None:
-            m = Media(description=media["description"],
-                    order=index,
-                    media_type=MediaTypeEnum.TEXT,
-                    url=None,
-                    vision_id=vision_id)
-            db.session.add(m)
-            vision_medias.append(m)
+            v["media_type"] = MediaTypeEnum.TEXT
         elif MediaTypeEnum[media["type"]] == MediaTypeEnum.IMAGE:
-            m = Media(description=media["description"],
-                    order=index,
-                    media_type=MediaTypeEnum[media["type"]],
-                    url=media["url"],
-                    unsplash_image_id=media["unsplash_image_id"],
-                    unsplash_creator_name=media["unsplash_creator_name"],
-                    unsplash_creator_url=media["unsplash_creator_url"],
-                    vision_id=vision_id)
-            db.session.add(m)
-            vision_medias.append(m)
+            v["media_type"] = MediaTypeEnum.IMAGE
+            v["url"] = media["url"]
+            v["unsplash_image_id"] = media["unsplash_image_id"]
+            v["unsplash_creator_name"] = media["unsplash_creator_name"]
+            v["unsplash_creator_url"] = media["unsplash_creator_url"]
         else:
-            m = Media(description=media["description"],
-                    order=index,
-                    media_type=MediaTypeEnum[media["type"]],
-                    url=media["url"],
-                    vision_id=vision_id)
-            db.session.add(m)
-            vision_medias.append(m)
+            v["media_type"] = MediaTypeEnum[media["type"]]
+            v["url"] = media["url"]
+        values.append(v)
 
-    return vision_medias
+    return values
 
 
-def create_vision(mood_id, medias, user_id, scenario_id):
+def create_vision(mood_id, medias, user_id, scenario_id, idempotency_key=None):
     """
     Create a Vision object.
 
+    The vision is inserted first (to get its ID), and then all the medias are inserted
+    by one executemany statement, in the same transaction.
+
     Parameters
     ----------
     mood_id : int
@@ -211,19 +221,88 @@ def create_vision(mood_id, medias, user_id, scenario_id):
         ID of the user creating the vision.
     scenario_id : int
         ID of the scenario relevant to the vision.
+    idempotency_key : str
+        A key chosen by the client for this vision (e.g., a random UUID), which is sent again when retrying.
+        If the user already has a vision with this key, that vision is returned without creating a new one.
 
     Returns
     -------
     vision : Vision
-        The newly created vision object.
+        The newly created vision object (or the existing one with the same idempotency key).
     """
-    vision = Vision(mood_id=mood_id, user_id=user_id, scenario_id=scenario_id)
+    if idempotency_key is not None:
+        vision = get_vision_by_idempotency_key(user_id, idempotency_key)
+        if vision is not None:
+            return vision
+
+    # Get the media values before writing anything (so that an invalid media does not leave a vision)
+    media_values = __get_media_values(medias)
+
+    vision = Vision(mood_id=mood_id, user_id=user_id, scenario_id=scenario_id, idempotency_key=idempotency_key)
 
     db.session.add(vision)
 
-    vision.medias = __create_media_array(vision.id, medias)
+    try:
+        db.session.flush()
+        if len(media_values) > 0:
+            for v in media_values:
+                v["vision_id"] = vision.id
+            db.session.execute(Media.__table__.insert(), media_values)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if idempotency_key is None:
+            raise
+        # Another request with the same key (e.g., a retry that arrived at another worker) created the vision first
+        vision = get_vision_by_idempotency_key(user_id, idempotency_key)
+        if vision is None:
+            raise
+        return vision
+
+    if idempotency_key is not None:
+        __remember_vision(user_id, idempotency_key, vision.id)
 
-    db.session.commit()
+    return vision
+
+
+def __remember_vision(user_id, idempotency_key, vision_id):
+    """Add a vision to the cache of the recently created visions."""
+    _recent_visions[(user_id, idempotency_key)] = (time.monotonic(), vision_id)
+    _recent_visions.move_to_end((user_id, idempotency_key))
+    while len(_recent_visions) > RECENT_VISIONS_MAX_SIZE:
+        _recent_visions.popitem(last=False)
+
+
+def get_vision_by_idempotency_key(user_id, idempotency_key):
+    """
+    Get a vision by the idempotency key that the user sent when creating it.
+
+    The recently created visions of this process are cached for RECENT_VISIONS_TTL seconds,
+    so that a retried request does not need to look up the key in the database.
+
+    Parameters
+    ----------
+    user_id : int
+        ID of the user who created the vision.
+    idempotency_key : str
+        The key sent by the client.
+
+    Returns
+    -------
+    vision : Vision
+        The retrieved vision object (None if not found).
+    """
+    cached = _recent_visions.get((user_id, idempotency_key))
+    if cached is not None and time.monotonic() - cached[0] < RECENT_VISIONS_TTL:
+        vision = get_vision_by_id(cached[1])
+        if vision is not None:
+            return vision
+    _recent_visions.pop((user_id, idempotency_key), None)
+
+    vision = Vision.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+
+    if vision is not None:
+        __remember_vision(user_id, idempotency_key, vision.id)
 
     return vision
 
@@ -232,6 +311,13 @@ def update_vision(vision_id, mood_id=None, medias=None):
     """
     Modify a Vision.
 
+    The new medias are compared with the existing ones, and only the changed medias are written:
+    one executemany UPDATE for the changed medias, one executemany INSERT for the new medias,
+    and one DELETE for the removed medias (in the same transaction).
+    A new media is matched with an existing media by its "id" (if given) or by its position.
+    When the medias change, the updated_at time of the vision is set (so that the incremental export
+    writes the vision and its medias again), and the removed medias are recorded in the tombstone table.
+
     Parameters
     ----------
     vision_id : int
@@ -240,7 +326,8 @@ def update_vision(vision_id, mood_id=None, medias=None):
         New ID of the mood assigned to the vision.
     medias : list
         Array of objects in the form:
-            [{"description": "..",
+            [{"id": ..,
+             "description": "..",
              "type": "..",
              "url": "..",
              "unsplash_image_id": "..",
@@ -248,6 +335,7 @@ def update_vision(vision_id, mood_id=None, medias=None):
              "unsplash_creator_url": ".."}]
         If you do not pass a url, the type is TEXT.
         Type should be either "GIF", "VIDEO" or "IMAGE".
+        The "id" is optional (the ID of an existing media of the vision to update).
         New list of medias assigned to the vision.
         The new list overwrites the old ones.
 
@@ -255,25 +343,97 @@ def update_vision(vision_id, mood_id=None, medias=None):
     -------
     vision : Vision
         The updated vision object.
+
+    Raises
+    ------
+    exception : ValidationError
+        When no vision is found.
     """
     vision = get_vision_by_id(vision_id)
 
     if vision is None:
-        raise Exception("No vision found in the database to update.")
+        raise ValidationError("No vision found in the database to update.")
 
     if mood_id is not None:
         vision.mood_id = mood_id
 
     if medias is not None:
-        for m in vision.medias:
-            db.session.delete(m)
-        vision.medias = __create_media_array(vision_id=vision_id, medias=medias)
+        updates, inserts, removed = __diff_medias(vision.medias, medias)
+        if len(updates) + len(inserts) + len(removed) > 0:
+            # Written by the same UPDATE as the mood (the vision row is not changed by the media statements)
+            vision.updated_at = func.now()
+        db.session.flush()
+        media_table = Media.__table__
+        if len(updates) > 0:
+            # The other keys of the parameters become the SET clause
+            stmt = media_table.update().where(media_table.c.id == bindparam("_id"))
+            db.session.execute(stmt, updates)
+        if len(inserts) > 0:
+            for v in inserts:
+                v["vision_id"] = vision_id
+            db.session.execute(media_table.insert(), inserts)
+        if len(removed) > 0:
+            removed_ids = [m.id for m in removed]
+            add_tombstones("media", select(media_table.c.id).where(media_table.c.id.in_(removed_ids)))
+            db.session.execute(media_table.delete().where(media_table.c.id.in_(removed_ids)))
+            for m in removed:
+                db.session.expunge(m)
+        # The medias are loaded again when they are used
+        db.session.expire(vision, ["medias"])
 
     db.session.commit()
 
     return vision
 
 
+def __diff_medias(old_medias, medias):
+    """
+    Compare the existing medias of a vision with the new ones.
+
+    Parameters
+    ----------
+    old_medias : list of Media
+        The existing medias of the vision.
+    medias : list
+        Array of the new media objects (see the update_vision function).
+
+    Returns
+    -------
+    updates : list of dict
+        The new column values of the changed medias (with the media ID in the "_id" key).
+    inserts : list of dict
+        The column values of the new medias (without the vision ID).
+    removed : list of Media
+        The medias to delete.
+    """
+    new_values = __get_media_values(medias)
+    old_by_id = {m.id: m for m in old_medias}
+    matched = [None] * len(medias)
+
+    # Match by the media ID first, and then by the position
+    for i, media in enumerate(medias):
+        m = old_by_id.pop(media.get("id"), None)
+        if m is not None:
+            matched[i] = m
+    old_by_order = {m.order: m for m in old_by_id.values()}
+    for i in range(len(medias)):
+        if matched[i] is None and medias[i].get("id") is None:
+            m = old_by_order.pop(i, None)
+            if m is not None:
+                old_by_id.pop(m.id)
+                matched[i] = m
+
+    updates = []
+    inserts = []
+    for m, v in zip(matched, new_values):
+        if m is None:
+            inserts.append(v)
+        elif any(getattr(m, c) != v[c] for c in v):
+            updates.append(dict(v, _id=m.id))
+
+    return (updates, inserts, list(old_by_id.values()))
+
+
 def remove_vision(vision_id):
     """
     Delete a vision.
@@ -282,19 +442,51 @@ def remove_vision(vision_id):
     ----------
     vision_id : int
         ID of the vision.
+
+    Raises
+    ------
+    exception : ValidationError
+        In case that no vision is found.
     """
-    vision = get_vision_by_id(vision_id)
+    if remove_vision_list([vision_id]) == 0:
+        raise ValidationError("No vision found in the database to delete.")
 
-    if vision is None:
-        raise Exception("No vision found in the database to delete.")
 
-    # Delete existing medias
-    for m in vision.medias:
-        db.session.delete(m)
+def remove_vision_list(vision_id_list):
+    """
+    Delete a list of visions and their medias.
+
+    The tombstones are added by one INSERT ... SELECT statement,
+    and the visions are deleted by one set-based statement (DELETE ... WHERE ... IN ...)
+    in the same transaction. The database deletes their medias (ON DELETE CASCADE).
+
+    Parameters
+    ----------
+    vision_id_list : list of int
+        IDs of the visions.
 
-    db.session.delete(vision)
+    Returns
+    -------
+    int
+        Number of the deleted visions.
+
+    Raises
+    ------
+    exception : ValidationError
+        When the input is not a list.
+    """
+    if type(vision_id_list) is not list:
+        raise ValidationError("The input must be a list of vision IDs.")
+
+    if len(vision_id_list) == 0:
+        return 0
+
+    add_tombstones("vision", select(Vision.id).where(Vision.id.in_(vision_id_list)))
+    n = Vision.query.filter(Vision.id.in_(vision_id_list)).delete(synchronize_session="fetch")
     db.session.commit()
 
+    return n
+
 
 def get_vision_by_id(vision_id):
     """
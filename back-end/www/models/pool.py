@@ -0,0 +1,181 @@
+"""Connection pool settings and metrics for the database engines."""
+
+import os
+import time
+import threading
+from sqlalchemy import exc
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that counts the checkouts and measures how long they wait for a connection.
+
+    The statistics are per process (each uwsgi worker has its own pool).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        t = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.add_timeout()
+            raise
+        self.stats.add_checkout(time.perf_counter() - t, self.overflow())
+        return conn
+
+    def recreate(self):
+        # Keep the statistics when the engine is disposed (e.g., after forking)
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class PoolStats(object):
+    """The counters of a MeteredQueuePool."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.overflow_max = 0
+
+    def add_checkout(self, wait_time, overflow):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def add_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+
+def engine_options(db_url, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800,
+        pool_pre_ping=True, statement_timeout=None, pgbouncer=False):
+    """
+    Get the SQLALCHEMY_ENGINE_OPTIONS for a database.
+
+    Parameters
+    ----------
+    db_url : str
+        The database url.
+    pool_size : int
+        Number of connections to keep open in each process.
+    max_overflow : int
+        Number of extra connections that can be opened when all the pooled ones are in use.
+    pool_timeout : float
+        Seconds to wait for a connection before giving up.
+    pool_recycle : int
+        Seconds after which a connection is replaced (-1 means never).
+    pool_pre_ping : bool
+        Test each connection before using it (so that the connections closed by the server are replaced).
+    statement_timeout : int
+        Milliseconds after which PostgreSQL cancels a statement (None means no timeout).
+    pgbouncer : bool
+        Connect to PostgreSQL through PgBouncer in the transaction pooling mode.
+        PgBouncer rejects the session settings in the startup packet,
+        so the statement timeout must be set on the database role instead
+        (e.g., ALTER ROLE [USER] SET statement_timeout = 30000).
+        Note that psycopg2 does not use server-side prepared statements, which PgBouncer cannot track.
+
+    Returns
+    -------
+    dict
+        The keyword arguments for sqlalchemy.create_engine.
+    """
+    options = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping}
+    if db_url.startswith("sqlite"):
+        # Pooled SQLite connections can be used by other threads (one at a time)
+        options["connect_args"] = {"check_same_thread": False}
+    elif db_url.startswith("postgresql") and statement_timeout is not None and not pgbouncer:
+        options["connect_args"] = {"options": "-c statement_timeout=%d" % statement_timeout}
+    return options
+
+
+def get_pool_stats(engine):
+    """
+    Get the statistics of the connection pool of an engine.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The database engine.
+
+    Returns
+    -------
+    dict
+        The pool size, the number of checked in and checked out connections, the current overflow,
+        and the counters of the checkouts (if the engine uses MeteredQueuePool).
+        The wait times are in seconds.
+    """
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0)})
+    if isinstance(pool, MeteredQueuePool):
+        s = pool.stats
+        with s.lock:
+            stats.update({
+                "checkouts": s.checkouts,
+                "timeouts": s.timeouts,
+                "wait_time_total": s.wait_time_total,
+                "wait_time_avg": s.wait_time_total / s.checkouts if s.checkouts > 0 else 0.0,
+                "wait_time_max": s.wait_time_max,
+                "overflow_max": s.overflow_max})
+    return stats
+
+
+def is_pool_exhausted(engine):
+    """Check if all the connections of the pool (including the overflow) are checked out."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return False
+    return pool.checkedout() >= pool.size() + pool._max_overflow
+
+
+def check_database(engine, timeout):
+    """
+    Check if the database answers a trivial query in time.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The database engine.
+    timeout : float
+        Seconds after which PostgreSQL cancels the query.
+        The check fails without waiting for a connection if the pool is exhausted.
+
+    Returns
+    -------
+    dict
+        "ok" (bool), "latency" (seconds), and "error" (str, only when the check fails).
+    """
+    if is_pool_exhausted(engine):
+        return {"ok": False, "latency": 0.0, "error": "The connection pool is exhausted."}
+    t = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            with conn.begin():
+                if engine.dialect.name == "postgresql":
+                    conn.execute(text("SET LOCAL statement_timeout = %d" % (timeout * 1000)))
+                conn.execute(text("SELECT 1"))
+    except Exception as ex:
+        return {"ok": False, "latency": time.perf_counter() - t, "error": type(ex).__name__}
+    return {"ok": True, "latency": time.perf_counter() - t}
@@ -0,0 +1,169 @@
+"""Routing of the read-only queries to an optional read replica."""
+
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SignallingSession
+from flask_sqlalchemy import get_state
+from sqlalchemy import orm
+from sqlalchemy import text
+
+
+# The bind key of the read replica in the SQLALCHEMY_BINDS config
+REPLICA_BIND_KEY = "replica"
+
+# The replication lag (in seconds) of PostgreSQL standby servers
+# (zero when the replica has replayed all the data that it received)
+PG_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+# Depth of the nested use_replica() blocks in the current context
+_replica_depth = contextvars.ContextVar("replica_depth", default=0)
+
+# The last health check of each replica engine, as {engine: (checked_at, is_healthy)}
+_replica_status = {}
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session that sends the queries in use_replica() blocks to the read replica.
+
+    Writes (flushes) always go to the primary database.
+    If the replica is not configured, is unreachable, or lags behind,
+    the queries go to the primary database instead.
+    """
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if _replica_depth.get() > 0 and not self._flushing:
+            engine = get_replica_engine(self.app)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """The Flask-SQLAlchemy extension that uses the routing session."""
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def get_replica_engine(app):
+    """
+    Get the engine of the read replica if it can be used.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine or None
+        The engine of the replica.
+        None if the replica is not configured or is not healthy.
+    """
+    if REPLICA_BIND_KEY not in (app.config.get("SQLALCHEMY_BINDS") or {}):
+        return None
+    engine = get_state(app).db.get_engine(app, bind=REPLICA_BIND_KEY)
+    interval = app.config.get("REPLICA_CHECK_INTERVAL", 5)
+    checked_at, is_healthy = _replica_status.get(engine, (None, False))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= interval:
+        is_healthy = is_replica_healthy(engine, app.config.get("REPLICA_MAX_LAG", 10))
+        _replica_status[engine] = (now, is_healthy)
+    return engine if is_healthy else None
+
+
+def is_replica_healthy(engine, max_lag):
+    """
+    Check if the replica is reachable and its replication lag is acceptable.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the replica.
+    max_lag : float
+        The maximum replication lag in seconds.
+
+    Returns
+    -------
+    bool
+        True if the replica can be used.
+    """
+    try:
+        lag = get_replica_lag(engine)
+    except Exception:
+        return False
+    return lag <= max_lag
+
+
+def get_replica_lag(engine):
+    """
+    Get the replication lag of the replica in seconds.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the replica.
+
+    Returns
+    -------
+    float
+        The replication lag (always zero for databases other than PostgreSQL).
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            return float(conn.execute(PG_LAG_QUERY).scalar())
+        conn.execute(text("SELECT 1"))
+        return 0.0
+
+
+def dispose_engines(app):
+    """
+    Replace the connection pools of the primary and replica engines (e.g., in a forked process).
+
+    The connections of the old pools are not closed, since they may be used by the parent process.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    """
+    db = get_state(app).db
+    db.get_engine(app).dispose(close=False)
+    if REPLICA_BIND_KEY in (app.config.get("SQLALCHEMY_BINDS") or {}):
+        db.get_engine(app, bind=REPLICA_BIND_KEY).dispose(close=False)
+
+
+def reset_replica_status():
+    """Forget the health checks of the replicas (so that they are checked again)."""
+    _replica_status.clear()
+
+
+@contextmanager
+def use_replica():
+    """
+    Run the queries in this block on the read replica (if it can be used).
+
+    Examples
+    --------
+    with use_replica():
+        answers = get_all_answers()
+    """
+    token = _replica_depth.set(_replica_depth.get() + 1)
+    try:
+        yield
+    finally:
+        _replica_depth.reset(token)
+
+
+def read_only(f):
+    """Decorate a read-only operation function so that it runs on the read replica."""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return f(*args, **kwargs)
+    return wrapper
@@ -1,5 +1,6 @@
 """Schema for object serialization and deserialization."""
 
+import json
 from flask_marshmallow import Marshmallow
 from marshmallow_enum import EnumField
 from models.model import Topic
@@ -123,6 +124,8 @@ answers_schema = AnswerSchema(many=True)
 class AnswerAdminSchema(ma.Schema):
     """The schema for the Answer table for admin users, used for jsonify."""
     choices = ma.Nested(choices_schema)
+    # Return the secret as a string (as the front-end client sends it)
+    secret = ma.Function(lambda a: a.secret if a.secret is None or isinstance(a.secret, str) else json.dumps(a.secret))
     class Meta:
         model = Answer
         fields = ("id", "text", "user_id", "question_id", "choices", "secret")
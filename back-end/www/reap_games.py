@@ -0,0 +1,60 @@
+"""
+This script sets the abandoned games (IN_PROGRESS for too long) in the Error state.
+
+Run it once (e.g., from cron):
+    python reap_games.py
+Or keep it running in a loop (e.g., as a uwsgi mule, see uwsgi.ini):
+    python reap_games.py --loop 600
+"""
+
+import sys
+import time
+import argparse
+from app.app import app
+from config.config import config
+from models.model_operations.game_operations import set_expired_games_as_error
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Set abandoned games in the Error state.")
+    parser.add_argument("--ttl", type=int, default=config.GAME_IN_PROGRESS_TTL,
+            help="seconds before an IN_PROGRESS game is considered abandoned")
+    parser.add_argument("--batch-size", type=int, default=config.GAME_REAPER_BATCH_SIZE,
+            help="max number of games updated in one transaction")
+    parser.add_argument("--loop", type=int, default=None,
+            help="keep running and wait this number of seconds between runs")
+    return parser.parse_args(argv[1:])
+
+
+def reap(ttl, batch_size):
+    with app.app_context():
+        count = set_expired_games_as_error(ttl, batch_size=batch_size)
+    print("Set %d abandoned game(s) in the Error state (ttl=%ds)" % (count, ttl), flush=True)
+    return count
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.loop is None and is_uwsgi_mule():
+        args.loop = config.GAME_REAPER_INTERVAL
+    while True:
+        try:
+            reap(args.ttl, args.batch_size)
+        except Exception as ex:
+            if args.loop is None: raise
+            print("Failed to set abandoned games in the Error state: %r" % ex, flush=True)
+        if args.loop is None: break
+        time.sleep(args.loop)
+
+
+def is_uwsgi_mule():
+    """Check if the script is running as a uwsgi mule."""
+    try:
+        import uwsgi
+        return uwsgi.mule_id() > 0
+    except (ImportError, AttributeError):
+        return False
+
+
+if __name__ == "__main__":
+    main(sys.argv)
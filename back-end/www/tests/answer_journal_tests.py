@@ -0,0 +1,197 @@
+from basic_tests import BasicTest
+from controllers import answer_controller
+from config.config import config
+from models.answer_journal import AnswerJournal
+from models.answer_journal import init_answer_journal
+from models.model_operations import scenario_operations
+from models.model_operations import topic_operations
+from models.model_operations import question_operations
+from models.model_operations import answer_operations
+from models.model_operations import user_operations
+from models.model import db
+from models.model import Answer
+from models.model import Question
+from util.util import ValidationError
+from util.util import encode_jwt
+import os
+import time
+import tempfile
+import unittest
+
+
+class AnswerJournalTest(BasicTest):
+    """Test case for the write-behind journal of the answers."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(answer_controller.bp, url_prefix="/answer")
+        app.config["ANSWER_WRITE_BEHIND"] = True
+        app.config["ANSWER_FLUSH_BATCH_SIZE"] = 2
+        app.config["ANSWER_FLUSH_LEASE"] = 60.0
+        fd, self.journal_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.journal = AnswerJournal(self.journal_path)
+        self.flusher = init_answer_journal(app, journal=self.journal)
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+        # Keep the IDs (the flusher removes the session of the app context after each batch)
+        topic = topic_operations.create_topic("test", "test")
+        scenario = scenario_operations.create_scenario("t1", "d1", "i1", topic.id)
+        free_question = question_operations.create_free_text_question("text", topic.id)
+        choice_question = question_operations.create_single_choice_question("text",
+                choices=[{"text": "a", "value": 1}, {"text": "b", "value": 2}], scenario_id=scenario.id)
+        self.topic_id = topic.id
+        self.scenario_id = scenario.id
+        self.free_question_id = free_question.id
+        self.choice_question_id = choice_question.id
+        self.choice_ids = [c.id for c in choice_question.choices]
+        self.user_1_id = user_operations.create_user("user1").id
+        self.user_2_id = user_operations.create_user("user2").id
+
+    def tearDown(self):
+        self.flusher.stop()
+        super().tearDown()
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.journal_path + suffix):
+                os.remove(self.journal_path + suffix)
+
+    def test_append_and_flush(self):
+        choice_id = self.choice_ids[1]
+        answer = answer_operations.journal_choice_answer(choice_id, self.user_1_id, self.choice_question_id,
+                secret='{"user_platform_id": "p1"}')
+        assert answer.id is None
+        assert [(c.id, c.text, c.value) for c in answer.choices] == [(choice_id, "b", 2)]
+        answer_operations.journal_free_text_answer("t1", self.user_1_id, self.free_question_id)
+        answer_operations.journal_free_text_answer("t2", self.user_2_id, self.free_question_id)
+        assert self.journal.count() == 3
+        assert Answer.query.count() == 0
+
+        # The answers are written in batches (in the order they were submitted)
+        assert self.flusher.flush() == 2
+        assert self.flusher.flush() == 1
+        assert self.flusher.flush() == 0
+        assert self.journal.count() == 0
+        answers = Answer.query.order_by(Answer.id).all()
+        assert [a.text for a in answers] == [None, "t1", "t2"]
+        assert [c.id for c in answers[0].choices] == [choice_id]
+        assert answers[0].secret == {"user_platform_id": "p1"}
+        # The time of the journal is on the same clock as the server default of the database
+        answer = answer_operations.create_free_text_answer("t3", self.user_1_id, self.free_question_id)
+        assert abs((answer.created_at - answers[0].created_at).total_seconds()) < 60
+
+        # The answers are validated before they are appended
+        with self.assertRaises(ValidationError):
+            answer_operations.journal_free_text_answer("t", self.user_1_id, self.choice_question_id)
+        with self.assertRaises(ValidationError):
+            answer_operations.journal_choice_answer(self.choice_ids, self.user_1_id, self.choice_question_id)
+        with self.assertRaises(ValidationError):
+            answer_operations.journal_free_text_answer("t", self.user_1_id, 9999)
+        assert self.journal.count() == 0
+
+    def test_crash_recovery(self):
+        answer_operations.journal_free_text_answer("t1", self.user_1_id, self.free_question_id)
+        answer_operations.journal_free_text_answer("t2", self.user_1_id, self.free_question_id)
+
+        # A process claims the batch and crashes before writing it
+        assert len(self.journal.claim("crashed", 10, 60.0)) == 2
+        assert self.flusher.flush() == 0
+        # Another flusher takes the batch after the lease expires
+        entries = self.journal.claim("other", 10, -1)
+        assert len(entries) == 2
+
+        # A process writes the batch and crashes before removing it from the journal
+        assert answer_operations.flush_journal_answers(entries) == 2
+        self.journal.release([e["key"] for e in entries])
+        assert self.journal.count() == 2
+        assert self.flusher.flush() == 2
+        assert self.journal.count() == 0
+        # The answers are not inserted twice
+        assert Answer.query.count() == 2
+
+        # A new journal on the same file has the answers that were not flushed
+        answer_operations.journal_free_text_answer("t3", self.user_1_id, self.free_question_id)
+        journal = AnswerJournal(self.journal_path)
+        assert [e["text"] for e in journal.claim("restarted", 10, 60.0)] == ["t3"]
+
+    def test_read_your_writes(self):
+        answer_operations.create_free_text_answer("t0", self.user_1_id, self.free_question_id)
+        choice_id = self.choice_ids[0]
+        answer_operations.journal_choice_answer([choice_id], self.user_1_id, self.choice_question_id)
+        answer_operations.journal_free_text_answer("t1", self.user_1_id, self.free_question_id)
+        answer_operations.journal_free_text_answer("t2", self.user_2_id, self.free_question_id)
+
+        # The pending answers of the user are included (after the ones in the database)
+        answers = answer_operations.get_answers_by_user(self.user_1_id)
+        assert [(a.text, a.question_id) for a in answers] == [
+                ("t0", self.free_question_id), (None, self.choice_question_id), ("t1", self.free_question_id)]
+        answers = answer_operations.get_answers_by_scenario(self.scenario_id, user_id=self.user_1_id)
+        assert [[c.id for c in a.choices] for a in answers] == [[choice_id]]
+        answers = answer_operations.get_answers_by_topic(self.topic_id, user_id=self.user_1_id)
+        assert [a.text for a in answers] == ["t0", "t1"]
+
+        # An answer is returned once while it is both in the database and in the journal
+        entries = self.journal.claim("flusher", 10, 60.0)
+        answer_operations.flush_journal_answers(entries)
+        assert len(answer_operations.get_answers_by_user(self.user_1_id)) == 3
+        self.journal.remove([e["key"] for e in entries])
+        assert len(answer_operations.get_answers_by_user(self.user_1_id)) == 3
+        assert all(a.id is not None for a in answer_operations.get_answers_by_user(self.user_1_id))
+
+    def test_rejected_answer(self):
+        answer_operations.journal_free_text_answer("t1", self.user_1_id, self.free_question_id)
+        answer_operations.journal_choice_answer(self.choice_ids[0], self.user_1_id, self.choice_question_id)
+        # The question is deleted after the answer is accepted
+        Question.query.filter_by(id=self.free_question_id).delete()
+        db.session.commit()
+
+        # The rejected answer is kept in the journal and does not block the others
+        assert self.flusher.flush() == 2
+        assert Answer.query.count() == 1
+        assert self.journal.count() == 0
+        assert self.journal.count(failed=True) == 1
+        assert self.flusher.flush() == 0
+        assert [a.question_id for a in answer_operations.get_answers_by_user(self.user_1_id)] == [
+                self.choice_question_id]
+
+    def test_question_cache(self):
+        answer_operations.journal_free_text_answer("t1", self.user_1_id, self.free_question_id)
+        # The cached question is removed with the question
+        question_operations.remove_question_list([self.free_question_id])
+        with self.assertRaises(ValidationError):
+            answer_operations.journal_free_text_answer("t2", self.user_1_id, self.free_question_id)
+        # The cache belongs to the app
+        assert self.free_question_id not in self.app.extensions["question_cache"]
+        assert self.choice_question_id not in self.app.extensions["question_cache"]
+        answer_operations.journal_choice_answer(self.choice_ids[0], self.user_1_id, self.choice_question_id)
+        assert self.choice_question_id in self.app.extensions["question_cache"]
+
+    def test_answer_endpoint(self):
+        token = encode_jwt({"user_id": self.user_1_id, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        r = self.client.post("/answer/", json={"user_token": token, "question_id": self.free_question_id,
+            "text": "t1"})
+        assert r.status_code == 202
+        assert r.json["data"]["id"] is None
+        assert r.json["data"]["text"] == "t1"
+        r = self.client.post("/answer/", json={"user_token": token, "question_id": self.choice_question_id,
+            "choices": [self.choice_ids[0]]})
+        assert r.status_code == 202
+        assert r.json["data"]["choices"][0]["text"] == "a"
+        r = self.client.post("/answer/", json={"user_token": token, "question_id": self.choice_question_id,
+            "text": "t"})
+        assert r.status_code == 400
+        r = self.client.get("/answer/?user_id=%d" % self.user_1_id)
+        assert [a["text"] for a in r.json["data"]] == ["t1", None]
+
+        # The first request starts the flusher thread of this process
+        deadline = time.monotonic() + 10
+        while self.journal.count() > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert self.journal.count() == 0
+        db.session.remove()
+        assert Answer.query.count() == 2
+
+
+if __name__ == "__main__":
+    unittest.main()
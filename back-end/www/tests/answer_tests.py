@@ -5,6 +5,8 @@ from models.model_operations import question_operations
 from models.model_operations import answer_operations
 from models.model_operations import user_operations
 from models.model import db
+from models.schema import answer_admin_schema
+import json
 import unittest
 
 
@@ -199,6 +201,76 @@ class AnswerTest(BasicTest):
         assert len(answers) == 1
         assert answers[0].text == answer_2.text and answers[0].user_id == answer_2.user_id
 
+    def test_get_choice_stats(self):
+        choices = self.choice_question.choices
+        answer_operations.create_choice_answer(
+            choices=[choices[0].id, choices[1].id], user_id=self.user_1.id, question_id=self.choice_question.id)
+        answer_operations.create_choice_answer(
+            choices=[choices[0].id], user_id=self.user_2.id, question_id=self.choice_question.id)
+        answer_operations.create_choice_answer(
+            choices=[self.single_choice_question.choices[1].id], user_id=self.user_1.id,
+            question_id=self.single_choice_question.id)
+
+        stats = answer_operations.get_choice_stats(question_id=self.choice_question.id)
+
+        assert len(stats) == 1
+        assert stats[0]["question_id"] == self.choice_question.id
+        assert stats[0]["total"] == 2
+        assert [c["count"] for c in stats[0]["choices"]] == [2, 1, 0]
+        assert [c["value"] for c in stats[0]["choices"]] == [1, 2, 3]
+
+        stats = answer_operations.get_choice_stats(scenario_id=self.scenario_2.id)
+
+        assert len(stats) == 1
+        assert stats[0]["total"] == 1
+        assert [c["count"] for c in stats[0]["choices"]] == [0, 1]
+
+        stats = answer_operations.get_choice_stats(topic_id=self.topic.id)
+
+        assert len(stats) == 0
+
+        with self.assertRaises(Exception):
+            answer_operations.get_choice_stats(question_id=self.choice_question.id, topic_id=self.topic.id)
+
+    def test_get_answers_by_platform_id(self):
+        secret = json.dumps({"user_platform_id": "abc", "scenario_id": self.scenario_1.id})
+
+        answer_1 = answer_operations.create_free_text_answer(
+            "text", user_id=self.user_1.id, question_id=self.free_question.id, secret=secret)
+        answer_operations.create_free_text_answer(
+            "text", user_id=self.user_2.id, question_id=self.free_question.id, secret="not json")
+        answer_operations.create_free_text_answer(
+            "text", user_id=self.user_2.id, question_id=self.free_question.id)
+
+        assert answer_1.secret["user_platform_id"] == "abc"
+        assert json.loads(answer_admin_schema.dump(answer_1)["secret"]) == json.loads(secret)
+
+        # Strings that are not JSON objects or arrays are kept as strings (as in the migration)
+        for text in ["null", "123", "true", " \"quoted\" "]:
+            answer = answer_operations.create_free_text_answer(
+                "text", user_id=self.user_2.id, question_id=self.free_question.id, secret=text)
+            db.session.expire(answer)
+            assert answer.secret == text
+            assert answer_admin_schema.dump(answer)["secret"] == text
+
+        answers = answer_operations.get_answers_by_platform_id("abc")
+
+        assert len(answers) == 1
+        assert answers[0].id == answer_1.id
+
+        answers = answer_operations.get_answers_by_platform_id("abc", topic_id=self.topic.id)
+
+        assert len(answers) == 1
+
+        answers = answer_operations.get_answers_by_platform_id("xyz")
+
+        assert len(answers) == 0
+
+        # The query uses the expression index that the model declares (the same as the migration)
+        plan = db.session.execute(db.text("EXPLAIN QUERY PLAN SELECT id FROM answer "
+            "WHERE json_extract(secret, '$.user_platform_id') = 'abc'")).fetchall()
+        assert "ix_answer_secret_user_platform_id" in str(plan)
+
     def test_remove_answer(self):
         question_id = self.choice_question.id
         user_id = self.user_1.id
@@ -0,0 +1,147 @@
+from basic_tests import BasicTest
+from models.model import db
+from models.model_operations.user_operations import get_user_by_client_id
+from util.util import decode_jwt
+from config.config import config
+from starlette.testclient import TestClient
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import application_async
+import datetime
+import httpx
+import time
+import unittest
+
+
+def create_google_key():
+    """Create a private key and its self-signed certificate (in the PEM format) for signing ID tokens."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.datetime.utcnow()
+    cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+        .serial_number(1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1)) \
+        .sign(key, hashes.SHA256())
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+    return key_pem, cert_pem
+
+
+class AsyncTest(BasicTest):
+    """Test case for the async app."""
+    def setUp(self):
+        db.create_all()
+        self.key_pem, self.cert_pem = create_google_key()
+        self.upstream_requests = []
+        self.upstream_down = False
+        transport = httpx.MockTransport(self.handle_upstream)
+        self.client = TestClient(application_async.create_app(self.app, transport=transport))
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        super().tearDown()
+
+    def handle_upstream(self, request):
+        self.upstream_requests.append(request)
+        if self.upstream_down:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/oauth2/v1/certs":
+            return httpx.Response(200, json={"kid1": self.cert_pem}, headers={"Cache-Control": "max-age=100"})
+        if request.url.path == "/photos/random/":
+            if request.url.params.get("count") == "0":
+                return httpx.Response(400, text="bad count")
+            return httpx.Response(200, json=[{"id": "photo"}])
+        return httpx.Response(404)
+
+    def sign_google_token(self, **kwargs):
+        t = int(time.time()) - 10
+        payload = {"iss": "https://accounts.google.com", "sub": "123",
+            "aud": config.GOOGLE_SIGNIN_CLIENT_ID, "iat": t, "exp": t + 3600}
+        payload.update(kwargs)
+        signer = crypt.RSASigner.from_string(self.key_pem, "kid1")
+        return google_jwt.encode(signer, payload).decode("utf-8")
+
+    def test_get_random_photos(self):
+        r = self.client.get("/photos/random?count=1&query=cat")
+        assert r.status_code == 200
+        assert r.json() == [{"id": "photo"}]
+        params = self.upstream_requests[0].url.params
+        assert params["client_id"] == config.UNSPLASH_ACCESS_KEY
+        assert params["count"] == "1"
+        assert params["query"] == "cat"
+
+        r = self.client.get("/photos/random?count=0")
+        assert r.status_code == 400
+        assert r.json()["message"] == "bad count"
+
+    def test_upstream_error(self):
+        self.upstream_down = True
+        # The error is logged with an ID, and the client only gets the ID
+        with self.assertLogs(self.app.logger, level="ERROR") as logs:
+            r = self.client.get("/photos/random?count=1")
+        assert r.status_code == 400
+        error_id = r.json()["message"].split("error ID: ")[1].rstrip(").")
+        assert "connection refused" not in r.json()["message"]
+        assert error_id in logs.output[0]
+        assert "Traceback" in logs.output[0]
+
+        with self.assertLogs(self.app.logger, level="ERROR") as logs:
+            r = self.client.post("/login/", json={"google_id_token": self.sign_google_token()})
+        assert r.status_code == 401
+        assert r.json()["message"].startswith("Cannot verify the Google ID token (error ID: ")
+        assert "verify_google_id_token" in logs.output[0]
+
+    def test_rate_limit(self):
+        self.app.config["RATE_LIMITS"] = {"login_controller": {"POST": (0.01, 2)}}
+        for _ in range(2):
+            r = self.client.post("/login/", json={"client_id": "ga.1"})
+            assert r.status_code == 200
+        r = self.client.post("/login/", json={"client_id": "ga.1"})
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) > 0
+        # The other endpoints have no limits (the same as the sync app)
+        for _ in range(3):
+            assert self.client.get("/photos/random?count=1").status_code == 200
+
+        # The clients behind the reverse proxy have their own buckets if the proxy is trusted
+        self.app.config["RATE_LIMIT_TRUST_PROXY"] = True
+        r = self.client.post("/login/", json={"client_id": "ga.1"}, headers={"X-Forwarded-For": "1.2.3.4"})
+        assert r.status_code == 200
+        self.app.config["RATE_LIMIT_TRUST_PROXY"] = False
+        r = self.client.post("/login/", json={"client_id": "ga.1"}, headers={"X-Forwarded-For": "5.6.7.8"})
+        assert r.status_code == 429
+
+    def test_login_with_client_id(self):
+        r = self.client.post("/login/", json={"client_id": "ga.1"})
+        assert r.status_code == 200
+        user = get_user_by_client_id("ga.1")
+        assert user is not None
+        assert decode_jwt(r.json()["user_token"], config.JWT_PRIVATE_KEY)["user_id"] == user.id
+
+        r = self.client.post("/login/", json={})
+        assert r.status_code == 400
+
+    def test_login_with_google_id_token(self):
+        for _ in range(2):
+            r = self.client.post("/login/", json={"google_id_token": self.sign_google_token()})
+            assert r.status_code == 200
+        assert get_user_by_client_id("google.123") is not None
+        # The certificates are cached
+        assert len(self.upstream_requests) == 1
+
+        r = self.client.post("/login/", json={"google_id_token": self.sign_google_token(aud="other")})
+        assert r.status_code == 401
+        r = self.client.post("/login/", json={"google_id_token": self.sign_google_token(iss="other")})
+        assert r.status_code == 401
+        r = self.client.post("/login/", json={"google_id_token": "not a token"})
+        assert r.status_code == 401
+
+
+if __name__ == "__main__":
+    unittest.main()
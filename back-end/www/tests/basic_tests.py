@@ -5,8 +5,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from controllers import root
 from models.model import db
+from util.query_counter import count_queries
 from flask import Flask
 from flask_testing import TestCase
+from contextlib import contextmanager
 
 
 class BasicTest(TestCase):
@@ -20,6 +22,15 @@ class BasicTest(TestCase):
         # pass in test configuration
         return app
 
+    @contextmanager
+    def assertMaxQueries(self, max_count):
+        """Assert that the code in this block sends at most max_count SQL queries (e.g., for an endpoint)."""
+        with count_queries() as stats:
+            yield stats
+        shapes = "\n".join("%d x %s" % (n, s) for s, n in stats.shapes.most_common())
+        self.assertLessEqual(stats.count, max_count,
+                "%d SQL queries (the budget is %d):\n%s" % (stats.count, max_count, shapes))
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()
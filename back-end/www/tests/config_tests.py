@@ -0,0 +1,67 @@
+from basic_tests import BasicTest
+from config import config as config_module
+from config.config import Config
+from config.config import TestingConfig
+from config.config import env
+from config.config import get_config
+from config.config import read_secret
+from config.config import secret
+from config.config import setting
+from unittest import mock
+import unittest
+
+
+class ConfigTest(BasicTest):
+    """Test case for loading the config."""
+    def test_lazy_secret(self):
+        # Defining a config with a missing secret file does not fail until the secret is used
+        class MissingSecretConfig(Config):
+            SOME_KEY = secret("no_such_secret_file")
+            OPTIONAL_KEY = secret("no_such_secret_file", optional=True)
+        assert MissingSecretConfig.OPTIONAL_KEY is None
+        with self.assertRaises(Exception):
+            MissingSecretConfig.SOME_KEY
+
+    def test_read_secret_once(self):
+        # Clear both the file cache and the cached value of the setting
+        read_secret.cache_clear()
+        TestingConfig.__dict__["SQLALCHEMY_DATABASE_URI"].values.clear()
+        with mock.patch.object(config_module, "Path", wraps=config_module.Path) as path:
+            for _ in range(3):
+                assert TestingConfig().SQLALCHEMY_DATABASE_URI == self.app.config["SQLALCHEMY_DATABASE_URI"]
+                # Use the same arguments as the secret setting (which share the cache entry)
+                read_secret("db_url_testing", optional=False)
+        assert path.call_count == 1
+
+    def test_setting(self):
+        calls = []
+        class A(Config):
+            X = 1
+            @setting
+            def Y(cls):
+                calls.append(cls)
+                return cls.X + 1
+        class B(A):
+            X = 10
+        assert A.Y == 2
+        assert A().Y == 2
+        assert B.Y == 11
+        assert calls == [A, B]
+
+    def test_env(self):
+        with mock.patch.dict("os.environ", {"COCTEAU_A": "7", "COCTEAU_B": "false", "COCTEAU_C": "0.5"}):
+            assert env("A", 1) == 7
+            assert env("B", True) is False
+            assert env("C", 1.0) == 0.5
+            assert env("D", 3) == 3
+
+    def test_get_config(self):
+        with mock.patch.dict("os.environ", {"COCTEAU_ENV": "testing"}):
+            assert isinstance(get_config(), TestingConfig)
+        assert type(get_config("production")).__name__ == "ProductionConfig"
+        with self.assertRaises(Exception):
+            get_config("unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
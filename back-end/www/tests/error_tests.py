@@ -0,0 +1,117 @@
+from basic_tests import BasicTest
+from controllers import topic_controller
+from models.model import db
+from models.model_operations import topic_operations
+from util.util import ValidationError
+from util.util import try_wrap_response
+from util.metrics import init_metrics
+from util.error_log import BackgroundQueueHandler
+from util.error_log import init_error_log
+from prometheus_client import REGISTRY
+import logging
+import unittest
+
+
+def get_error_count(endpoint, status, kind):
+    value = REGISTRY.get_sample_value("http_errors_total",
+            {"endpoint": endpoint, "status": status, "kind": kind})
+    return value or 0
+
+
+class RecordHandler(logging.Handler):
+    """A handler that keeps the formatted records."""
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+class ErrorTest(BasicTest):
+    """Test case for the error responses and the background logging."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(topic_controller.bp, url_prefix="/topic")
+
+        @try_wrap_response
+        def validation():
+            raise ValidationError("Bad input.", status_code=422)
+
+        @try_wrap_response
+        def exception():
+            raise KeyError("secret")
+
+        app.add_url_rule("/validation", "validation", validation)
+        app.add_url_rule("/exception", "exception", exception)
+        self.records = RecordHandler()
+        app.logger.handlers = [self.records]
+        self.log_handler = init_error_log(app)
+        init_metrics(app)
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def tearDown(self):
+        super().tearDown()
+        self.log_handler.stop()
+
+    def test_validation_error(self):
+        before = get_error_count("validation", "422", "validation")
+        r = self.client.get("/validation")
+        assert r.status_code == 422
+        assert r.json["message"] == "Bad input."
+        self.log_handler.stop()
+        assert self.records.messages == []
+        assert get_error_count("validation", "422", "validation") == before + 1
+
+    def test_unexpected_error(self):
+        before = get_error_count("exception", "400", "exception")
+        r = self.client.get("/exception")
+        assert r.status_code == 400
+        assert "Traceback" not in r.json["message"]
+        assert "secret" not in r.json["message"]
+        assert r.json["message"].startswith("Unexpected error (error ID: ")
+        error_id = r.json["message"].split(": ")[1][:-2]
+        # The traceback is written by the background thread
+        self.log_handler.stop()
+        assert len(self.records.messages) == 1
+        assert error_id in self.records.messages[0]
+        assert "Traceback" in self.records.messages[0]
+        assert "KeyError: 'secret'" in self.records.messages[0]
+        assert get_error_count("exception", "400", "exception") == before + 1
+
+    def test_model_validation_error(self):
+        with self.assertRaises(ValidationError):
+            topic_operations.update_topic(999, title="t")
+        before = get_error_count("topic_controller.topic", "400", "response")
+        r = self.client.patch("/topic/", json={})
+        assert r.status_code == 400
+        assert get_error_count("topic_controller.topic", "400", "response") == before + 1
+
+    def test_queue_handler(self):
+        records = RecordHandler()
+        handler = BackgroundQueueHandler([records], max_size=1)
+        logger = logging.getLogger("error_tests")
+        logger.propagate = False
+        logger.addHandler(handler)
+        logger.error("first %d", 1)
+        handler.stop()
+        assert records.messages == ["first 1"]
+        # A new listener thread is started after the handler is stopped (or the process is forked)
+        logger.error("second")
+        handler.stop()
+        assert records.messages == ["first 1", "second"]
+        # The records are dropped when the queue is full
+        before = REGISTRY.get_sample_value("log_records_dropped_total")
+        handler.start()
+        handler.listener.stop()
+        logger.error("third")
+        logger.error("fourth")
+        assert REGISTRY.get_sample_value("log_records_dropped_total") == before + 1
+        logger.removeHandler(handler)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+from basic_tests import BasicTest
+from controllers import experiment_controller
+from config.config import config
+from models.model_operations import experiment_operations
+from models.model import db
+from models.model import Topic
+from models.model import Scenario
+from models.model import Question
+from models.model import Choice
+from util.util import ValidationError
+from util.util import encode_jwt
+from import_experiment import experiment_dir
+from import_experiment import load_bundle
+import time
+import unittest
+
+
+def create_bundle(scenario_questions):
+    topic_questions = [{"text": "consent", "choices": [{"text": "yes", "value": 1}]}]
+    scenario = {"title": "s", "description": "d", "image": "i", "mode": 1, "view": 2, "questions": scenario_questions}
+    return {"topics": [{"title": "t", "description": "d", "questions": topic_questions, "scenarios": [scenario]}]}
+
+
+class ExperimentTest(BasicTest):
+    """Test case for importing the experiment bundles."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(experiment_controller.bp, url_prefix="/experiment")
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def test_import_experiment_files(self):
+        bundle = load_bundle(experiment_dir, 4)
+        assert len(bundle["topics"]) == 15
+        t = time.perf_counter()
+        result = experiment_operations.import_experiment(bundle)
+        assert time.perf_counter() - t < 10
+        num_questions = sum(len(t["questions"]) + len(t["scenarios"][0]["questions"]) for t in bundle["topics"])
+        assert result["question_count"] == num_questions
+        assert Topic.query.count() == 15
+        assert Question.query.count() == num_questions
+        # The questions refer to the topics and scenarios that are created from the same files
+        topic_id = result["topics"][-1]["id"]
+        scenario_id = result["topics"][-1]["scenario_ids"][0]
+        scenario = Scenario.query.filter_by(id=scenario_id).first()
+        assert (scenario.topic_id, scenario.mode, scenario.view) == (topic_id, 3, 5)
+        assert Question.query.filter_by(topic_id=topic_id).count() == len(bundle["topics"][-1]["questions"])
+        assert Question.query.filter_by(scenario_id=scenario_id).count() == len(
+                bundle["topics"][-1]["scenarios"][0]["questions"])
+
+    def test_atomic_import(self):
+        bundle = create_bundle([{"text": "q"}, {"text": "q", "choices": [{"text": "a"}]}])
+        with self.assertRaises(ValidationError):
+            experiment_operations.import_experiment(bundle)
+        assert Topic.query.count() == 0
+        assert Scenario.query.count() == 0
+        assert Question.query.count() == 0
+        for bundle in [{}, {"topics": {}}, {"topics": [{"title": "t"}]}, {"topics": [[]]}]:
+            with self.assertRaises(ValidationError):
+                experiment_operations.import_experiment(bundle)
+        assert Topic.query.count() == 0
+
+    def test_import_topic_without_scenarios(self):
+        bundle = {"topics": [{"title": "t", "description": "d", "questions": [{"text": "consent"}]}]}
+        result = experiment_operations.import_experiment(bundle)
+        assert result["topics"][0]["scenario_ids"] == []
+        assert result["question_count"] == 1
+        assert Scenario.query.count() == 0
+        assert Question.query.filter_by(topic_id=result["topics"][0]["id"]).count() == 1
+
+    def test_import_endpoint(self):
+        admin_token = encode_jwt({"user_id": 1, "client_type": 0}, config.JWT_PRIVATE_KEY)
+        user_token = encode_jwt({"user_id": 2, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        bundle = create_bundle([{"text": "q", "choices": [{"text": "a", "value": 1}, {"text": "b", "value": 2}]}])
+        r = self.client.post("/experiment/", json={"user_token": user_token, "data": bundle})
+        assert r.status_code == 403
+        r = self.client.post("/experiment/", json={"user_token": admin_token})
+        assert r.status_code == 400
+        r = self.client.post("/experiment/", json={"user_token": admin_token, "data": bundle})
+        assert r.status_code == 200
+        assert r.json["data"]["question_count"] == 2
+        assert len(r.json["data"]["topics"]) == 1
+        assert Choice.query.count() == 3
+
+
+if __name__ == "__main__":
+    unittest.main()
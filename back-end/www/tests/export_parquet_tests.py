@@ -0,0 +1,183 @@
+from basic_tests import BasicTest
+from models.model_operations import scenario_operations
+from models.model_operations import topic_operations
+from models.model_operations import question_operations
+from models.model_operations import answer_operations
+from models.model_operations import user_operations
+from models.model_operations import vision_operations
+from models.model_operations import game_operations
+from models.model import db
+import export_parquet
+import pyarrow as pa
+import pyarrow.dataset as ds
+import tempfile
+import shutil
+import datetime
+import unittest
+
+
+class ExportParquetTest(BasicTest):
+    """Test case for exporting the research tables to Parquet files."""
+    def setUp(self):
+        db.create_all()
+
+        self.output_dir = tempfile.mkdtemp()
+
+        topic = topic_operations.create_topic("test", "test")
+        scenario = scenario_operations.create_scenario("t1", "d1", "i1", topic.id)
+        self.question = question_operations.create_multi_choice_question("text",
+                choices=[{"text": "a", "value": 1}, {"text": "b", "value": 2}], scenario_id=scenario.id)
+        self.free_question = question_operations.create_free_text_question("text", scenario_id=scenario.id)
+        self.user_1 = user_operations.create_user("user1")
+        self.user_2 = user_operations.create_user("user2")
+        mood = vision_operations.create_mood("happy")
+
+        self.mood_id = mood.id
+
+        # The times are set explicitly (the server time of SQLite has a resolution of one second)
+        for i in range(5):
+            a = answer_operations.create_choice_answer([c.id for c in self.question.choices],
+                    self.user_1.id, self.question.id)
+            a.created_at = a.updated_at = datetime.datetime(2022, 1 + i % 2, 1)
+        a = answer_operations.create_free_text_answer("text", self.user_1.id, self.free_question.id, secret="s")
+        a.updated_at = datetime.datetime(2022, 2, 1)
+        db.session.commit()
+
+        medias = [{"description": "d", "url": "http://u", "type": "GIF"}, {"description": "d"}]
+        vision = vision_operations.create_vision(mood.id, medias, self.user_1.id, scenario.id)
+        vision.updated_at = datetime.datetime(2022, 2, 1)
+        game = game_operations.create_game(self.user_2.id, vision.id, start_time=datetime.datetime(2022, 3, 1))
+        game_operations.submit_game(game.id, self.user_2.id, "feedback", [mood.id])
+        game.updated_at = datetime.datetime(2022, 3, 1)
+        db.session.commit()
+        self.vision_id = vision.id
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def read_table(self, table_name):
+        path = self.output_dir + "/" + table_name
+        return ds.dataset(path, format="parquet", partitioning="hive").to_table()
+
+    def test_export_table(self):
+        for table_name in export_parquet.TABLES:
+            export_parquet.export_table(table_name, self.output_dir, chunk_size=2)
+
+        answers = self.read_table("answer")
+        assert answers.num_rows == 6
+        assert answers.schema.field("created_at").type == pa.timestamp("us")
+        assert answers.schema.field("question_id").type == pa.int64()
+        assert sorted(set(answers.column("month").to_pylist()))[:2] == ["2022-01", "2022-02"]
+
+        assert self.read_table("answers_choice_table").num_rows == 10
+        assert self.read_table("choice").num_rows == 2
+        assert self.read_table("media").num_rows == 2
+        assert self.read_table("guess").num_rows == 1
+
+        questions = self.read_table("question").to_pydict()
+        assert pa.types.is_dictionary(self.read_table("question").schema.field("question_type").type)
+        assert sorted(questions["question_type"]) == ["FREE_TEXT", "MULTI_CHOICE"]
+
+        games = self.read_table("game").to_pydict()
+        assert games["status"] == ["COMPLETED"]
+        assert games["month"] == ["2022-03"]
+
+    def test_export_table_twice(self):
+        num_rows = export_parquet.export_table("answer", self.output_dir)
+        num_rows = export_parquet.export_table("answer", self.output_dir)
+
+        assert num_rows == 6
+        assert self.read_table("answer").num_rows == 6
+
+    def test_export_incremental(self):
+        counts = export_parquet.export_incremental(self.output_dir, overlap=0)
+        assert counts["answer"] == 6
+        assert counts["answers_choice_table"] == 10
+        assert counts["game"] == 1
+
+        # Nothing new
+        counts = export_parquet.export_incremental(self.output_dir, overlap=0)
+        assert counts["answer"] == 0
+        assert counts["answers_choice_table"] == 0
+        assert counts["game"] == 0
+        assert counts["guess"] == 0
+        assert counts["question"] == 2
+
+        # New answers, a new game, and a deleted answer
+        a = answer_operations.create_choice_answer([self.question.choices[0].id], self.user_2.id, self.question.id)
+        a.created_at = datetime.datetime(2030, 1, 1)
+        db.session.commit()
+        vision_id = vision_operations.get_all_visions(paginate=False)[0].id
+        game = game_operations.create_game(self.user_2.id, vision_id, start_time=datetime.datetime(2030, 1, 1))
+        deleted_answer_id = answer_operations.get_all_answers()[0].id
+        answer_operations.remove_answer(deleted_answer_id)
+
+        counts = export_parquet.export_incremental(self.output_dir, overlap=0)
+        assert counts["answer"] == 1
+        assert counts["answers_choice_table"] == 1
+        assert counts["game"] == 1
+        assert counts["vision"] == 0
+        assert counts["tombstone"] == 1
+
+        # Submitting the game changes its end time
+        game_operations.submit_game(game.id, self.user_2.id, "feedback", [])
+        game.end_time = game.updated_at = datetime.datetime(2030, 1, 2)
+        db.session.commit()
+
+        counts = export_parquet.export_incremental(self.output_dir, overlap=0)
+        assert counts["answer"] == 0
+        assert counts["game"] == 1
+
+        assert self.read_table("answer").num_rows == 7
+        assert self.read_table("answers_choice_table").num_rows == 11
+        assert self.read_table("question").num_rows == 2
+        assert self.read_table("game").num_rows == 3
+        tombstones = self.read_table("tombstone").to_pydict()
+        assert tombstones["table_name"] == ["answer"]
+        assert tombstones["row_id"] == [deleted_answer_id]
+
+    def test_export_incremental_changes(self):
+        old_game = game_operations.create_game(self.user_2.id, self.vision_id, start_time=datetime.datetime(2022, 4, 1))
+        old_game.updated_at = datetime.datetime(2022, 4, 1)
+        db.session.commit()
+        old_game_id = old_game.id
+        export_parquet.export_incremental(self.output_dir, overlap=0)
+
+        # The medias of a vision are changed (and one is removed), and an abandoned game is set to the Error state
+        vision = vision_operations.get_vision_by_id(self.vision_id)
+        removed_media_id = vision.medias[1].id
+        vision_operations.update_vision(self.vision_id, medias=[{"description": "changed"}])
+        assert game_operations.set_expired_games_as_error(3600) == 1
+
+        counts = export_parquet.export_incremental(self.output_dir, overlap=0)
+        assert counts["answer"] == 0
+        assert counts["vision"] == 1
+        assert counts["media"] == 1
+        assert counts["game"] == 1
+        assert counts["tombstone"] == 1
+        tombstones = self.read_table("tombstone").to_pydict()
+        assert tombstones["table_name"] == ["media"]
+        assert tombstones["row_id"] == [removed_media_id]
+        games = self.read_table("game").to_pydict()
+        assert sorted(s for i, s in zip(games["id"], games["status"]) if i == old_game_id) == ["ERROR", "IN_PROGRESS"]
+        medias = self.read_table("media").to_pydict()
+        assert sorted(medias["description"]) == ["changed", "d", "d"]
+
+        # An answer that commits late has a time before the last mark
+        a = answer_operations.create_free_text_answer("late", self.user_2.id, self.free_question.id)
+        a.updated_at = datetime.datetime(2022, 1, 31, 23, 59, 50)
+        db.session.commit()
+        late_answer_id = a.id
+        counts = export_parquet.export_incremental(self.output_dir, overlap=0)
+        assert counts["answer"] == 0
+        # The rows within the overlap window are exported again
+        counts = export_parquet.export_incremental(self.output_dir, overlap=60)
+        answers = self.read_table("answer").to_pydict()
+        assert late_answer_id in answers["id"]
+        # (the late answer and the three answers at the last mark)
+        assert counts["answer"] == 4
+
+
+if __name__ == "__main__":
+    unittest.main()
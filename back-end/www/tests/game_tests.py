@@ -161,6 +161,37 @@ class GameTest(BasicTest):
 
         assert game.status == GameStatusEnum.ERROR
 
+    def test_set_expired_games_as_error(self):
+        user_id = self.user_2.id
+        vision_id = self.vision.id
+
+        old_time = datetime.datetime.now() - datetime.timedelta(hours=2)
+        new_time = datetime.datetime.now()
+
+        old_games = [game_operations.create_game(user_id=user_id,
+            vision_id=vision_id, start_time=old_time) for i in range(5)]
+        new_game = game_operations.create_game(
+            user_id=user_id, vision_id=vision_id, start_time=new_time)
+        submitted_game = game_operations.create_game(
+            user_id=user_id, vision_id=vision_id, start_time=old_time)
+        game_operations.submit_game(game_id=submitted_game.id, user_id=user_id,
+                moods=[self.mood_1.id], feedback="")
+
+        count = game_operations.set_expired_games_as_error(3600, batch_size=2, max_batches=1)
+        assert count == 2
+
+        count = game_operations.set_expired_games_as_error(3600, batch_size=2)
+        assert count == 3
+
+        db.session.expire_all()
+        for g in old_games:
+            assert g.status == GameStatusEnum.ERROR
+        assert new_game.status == GameStatusEnum.IN_PROGRESS
+        assert submitted_game.status == GameStatusEnum.COMPLETED
+
+        count = game_operations.set_expired_games_as_error(3600)
+        assert count == 0
+
     def test_get_game_by_id(self):
         user_id = self.user_2.id
         vision_id = self.vision.id
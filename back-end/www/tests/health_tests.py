@@ -0,0 +1,67 @@
+from basic_tests import BasicTest
+from controllers import root
+from models.model import db
+from models.pool import engine_options
+from models.pool import check_database
+from util.query_counter import count_queries
+from sqlalchemy import create_engine
+import unittest
+
+
+class HealthTest(BasicTest):
+    """Test case for the liveness and readiness endpoints."""
+    def create_app(self):
+        app = super().create_app()
+        app.config["READYZ_CACHE_TTL"] = 60
+        return app
+
+    def setUp(self):
+        db.create_all()
+        root._readiness.clear()
+
+    def test_healthz(self):
+        with self.assertMaxQueries(0):
+            r = self.client.get("/healthz")
+            assert r.status_code == 200
+            assert r.data == b"ok"
+            r = self.client.get("/")
+            assert r.status_code == 200
+
+    def test_readyz(self):
+        with self.assertMaxQueries(1):
+            r = self.client.get("/readyz")
+        assert r.status_code == 200
+        assert r.json["ready"] is True
+        assert r.json["database"]["ok"] is True
+        assert "pool" not in r.json
+        # The result is cached
+        with self.assertMaxQueries(0):
+            r = self.client.get("/readyz")
+        assert r.status_code == 200
+        # The database is checked again after the cache expires
+        self.app.config["READYZ_CACHE_TTL"] = 0
+        with count_queries() as stats:
+            self.client.get("/readyz")
+        assert stats.count == 1
+
+    def test_exhausted_pool(self):
+        url = "sqlite:////tmp/cocteau_testing_health.db"
+        options = engine_options(url, pool_size=1, max_overflow=0, pool_timeout=30)
+        engine = create_engine(url, **options)
+        conn = engine.connect()
+        result = check_database(engine, 1)
+        assert result["ok"] is False
+        assert "exhausted" in result["error"]
+        conn.close()
+        assert check_database(engine, 1)["ok"] is True
+        engine.dispose()
+
+    def test_database_down(self):
+        engine = create_engine("sqlite:////nonexistent/cocteau.db")
+        result = check_database(engine, 1)
+        assert result["ok"] is False
+        assert result["error"] == "OperationalError"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+from basic_tests import BasicTest
+import os
+import sys
+import subprocess
+import unittest
+
+
+# The back-end folder where the application.py file is
+www_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def get_import_times(module):
+    """
+    Import a module in a new Python process and get the import time of each module.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module to import.
+
+    Returns
+    -------
+    dict
+        The cumulative import time (in microseconds) of each imported module, from the "-X importtime" report.
+    """
+    env = dict(os.environ)
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module],
+            cwd=www_dir, env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in p.stderr.splitlines():
+        parts = line.replace("import time:", "").split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+class ImportTimeTest(BasicTest):
+    """Test case for the modules that the uwsgi workers import."""
+    def test_application_import_time(self):
+        times = get_import_times("application")
+
+        # Print the report of the slowest top-level imports
+        print("\nImport time of application.py: %.1f ms" % (times["application"] / 1000))
+        top_level = [m for m in times if "." not in m and m != "application"]
+        for m in sorted(top_level, key=lambda m: -times[m])[:10]:
+            print("%10.1f ms  %s" % (times[m] / 1000, m))
+
+        # These modules are only needed by some requests or commands, so they must be imported lazily
+        for m in ["google.oauth2.id_token", "google.auth.transport.requests", "alembic", "flask_migrate", "pandas"]:
+            assert m not in times, "%s is imported by application.py" % m
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+from basic_tests import BasicTest
+from controllers import mood_controller
+from controllers import metrics_controller
+from models.model import db
+from util.metrics import init_metrics
+from prometheus_client import REGISTRY
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+
+
+# The back-end folder where the application.py file is
+www_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Send requests from two forked processes and print the aggregated metrics
+MULTIPROCESS_SCRIPT = """
+import os
+from application import app
+from models.model import db
+with app.app_context():
+    db.create_all()
+for i in range(2):
+    if os.fork() == 0:
+        app.test_client().get("/mood/")
+        os._exit(0)
+    os.wait()
+print(app.test_client().get("/metrics").data.decode("utf-8"))
+"""
+
+
+def get_count(blueprint, method, status):
+    value = REGISTRY.get_sample_value("http_requests_total",
+            {"blueprint": blueprint, "method": method, "status": status})
+    return value or 0
+
+
+class MetricsTest(BasicTest):
+    """Test case for the request metrics."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(mood_controller.bp, url_prefix="/mood")
+        app.register_blueprint(metrics_controller.bp)
+        init_metrics(app)
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def test_request_metrics(self):
+        ok = get_count("mood_controller", "GET", "200")
+        bad = get_count("mood_controller", "POST", "400")
+        not_found = get_count("none", "GET", "404")
+        latency = REGISTRY.get_sample_value("http_request_duration_seconds_count",
+                {"blueprint": "mood_controller", "method": "GET"}) or 0
+
+        assert self.client.get("/mood/").status_code == 200
+        assert self.client.post("/mood/").status_code == 400
+        assert self.client.get("/no_such_path").status_code == 404
+
+        assert get_count("mood_controller", "GET", "200") == ok + 1
+        assert get_count("mood_controller", "POST", "400") == bad + 1
+        assert get_count("none", "GET", "404") == not_found + 1
+        assert REGISTRY.get_sample_value("http_request_duration_seconds_count",
+                {"blueprint": "mood_controller", "method": "GET"}) == latency + 1
+
+        r = self.client.get("/metrics")
+        assert r.status_code == 200
+        assert r.content_type.startswith("text/plain")
+        text = r.data.decode("utf-8")
+        assert 'http_requests_total{blueprint="mood_controller",method="GET",status="200"}' in text
+        assert "http_response_size_bytes_bucket" in text
+
+    def test_multiprocess_metrics(self):
+        with tempfile.TemporaryDirectory() as d:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=d, COCTEAU_ENV="testing")
+            p = subprocess.run([sys.executable, "-c", MULTIPROCESS_SCRIPT],
+                    cwd=www_dir, env=env, capture_output=True, text=True, check=True)
+        line = 'http_requests_total{blueprint="mood_controller",method="GET",status="200"} 2.0'
+        assert line in p.stdout
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+from basic_tests import BasicTest
+from controllers import status_controller
+from models.model import db
+from models.model_operations import user_operations
+from config.config import config
+from util.util import encode_jwt
+from models.pool import MeteredQueuePool
+from models.pool import engine_options
+from models.pool import get_pool_stats
+from sqlalchemy import create_engine
+from sqlalchemy import exc
+import unittest
+
+
+class PoolTest(BasicTest):
+    """Test case for the connection pool settings and metrics."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(status_controller.bp, url_prefix="/status")
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def test_engine_options(self):
+        options = engine_options("postgresql://u:p@localhost/db", pool_size=3, statement_timeout=1000)
+        assert options["poolclass"] == MeteredQueuePool
+        assert options["pool_size"] == 3
+        assert options["connect_args"] == {"options": "-c statement_timeout=1000"}
+
+        # PgBouncer does not accept the session settings in the startup packet
+        options = engine_options("postgresql://u:p@localhost/db", statement_timeout=1000, pgbouncer=True)
+        assert "connect_args" not in options
+
+        options = engine_options("sqlite:////tmp/test.db", statement_timeout=1000)
+        assert options["connect_args"] == {"check_same_thread": False}
+
+    def test_pool_stats(self):
+        url = self.app.config["SQLALCHEMY_DATABASE_URI"]
+        engine = create_engine(url, **engine_options(url, pool_size=1, max_overflow=1, pool_timeout=0.1))
+        c1 = engine.connect()
+        c2 = engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+        c1.close()
+        c2.close()
+        stats = get_pool_stats(engine)
+        assert stats["pool"] == "MeteredQueuePool"
+        assert stats["checkouts"] == 2
+        assert stats["timeouts"] == 1
+        assert stats["overflow_max"] == 1
+        assert stats["checked_out"] == 0
+        assert stats["wait_time_max"] >= 0
+
+        # The statistics are kept after disposing the engine
+        engine.dispose()
+        assert get_pool_stats(engine)["checkouts"] == 2
+
+    def test_pool_endpoint(self):
+        user_operations.create_user("user")
+        admin_token = encode_jwt({"user_id": 1, "client_type": 0}, config.JWT_PRIVATE_KEY)
+        user_token = encode_jwt({"user_id": 1, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        assert self.client.get("/status/pool").status_code == 400
+        assert self.client.get("/status/pool?user_token=" + user_token).status_code == 403
+        r = self.client.get("/status/pool?user_token=" + admin_token)
+        assert r.status_code == 200
+        assert r.json["primary"]["pool"] == "MeteredQueuePool"
+        assert r.json["primary"]["checkouts"] > 0
+        assert "replica" not in r.json
+
+
+if __name__ == "__main__":
+    unittest.main()
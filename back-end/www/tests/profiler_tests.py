@@ -0,0 +1,95 @@
+from basic_tests import BasicTest
+from models.model import db
+from controllers import mood_controller
+from config.config import config
+from util.util import encode_jwt
+from util.profiler import PROFILE_HEADER
+from util.profiler import init_profiler
+from util.profiler import save_profile
+from merge_profiles import get_profile_files
+from merge_profiles import merge_profiles
+from merge_profiles import get_collapsed_stacks
+from merge_profiles import write_collapsed_stacks
+import io
+import os
+import glob
+import shutil
+import cProfile
+import tempfile
+import unittest
+
+
+class ProfilerTest(BasicTest):
+    """Test case for the request profiler."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(mood_controller.bp, url_prefix="/mood")
+        self.profile_dir = tempfile.mkdtemp()
+        app.config["PROFILER_DIR"] = self.profile_dir
+        app.config["PROFILER_SAMPLE_RATE"] = 0
+        app.config["PROFILER_MAX_FILES"] = 3
+        init_profiler(app)
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def get_files(self, endpoint="mood_controller.mood"):
+        return glob.glob(os.path.join(self.profile_dir, endpoint, "*.pstats"))
+
+    def test_disabled(self):
+        self.client.get("/mood/")
+        assert self.get_files() == []
+
+    def test_sample_rate(self):
+        self.app.config["PROFILER_SAMPLE_RATE"] = 2
+        for i in range(4):
+            self.client.get("/mood/")
+        assert len(self.get_files()) == 2
+
+    def test_admin_header(self):
+        admin_token = encode_jwt({"user_id": 1, "client_type": 0}, config.JWT_PRIVATE_KEY)
+        user_token = encode_jwt({"user_id": 2, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        fake_token = encode_jwt({"user_id": 1, "client_type": 0}, "wrong key")
+        self.client.get("/mood/", headers={PROFILE_HEADER: user_token})
+        self.client.get("/mood/", headers={PROFILE_HEADER: fake_token})
+        assert self.get_files() == []
+        self.client.get("/mood/", headers={PROFILE_HEADER: admin_token})
+        assert len(self.get_files()) == 1
+
+    def test_rotation(self):
+        for i in range(5):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            sum(range(100))
+            profiler.disable()
+            path = save_profile(profiler, "e", self.profile_dir, 3)
+        files = self.get_files("e")
+        assert len(files) == 3
+        assert path in files
+
+    def test_merge(self):
+        self.app.config["PROFILER_SAMPLE_RATE"] = 1
+        for i in range(3):
+            self.client.get("/mood/")
+        files = get_profile_files(self.profile_dir, ["mood_controller.mood"])
+        assert len(files) == 3
+        stacks = get_collapsed_stacks(merge_profiles(files))
+        f = io.StringIO()
+        write_collapsed_stacks(stacks, f)
+        lines = f.getvalue().splitlines()
+        assert len(lines) > 0
+        for line in lines:
+            stack, weight = line.rsplit(" ", 1)
+            assert int(weight) >= 1
+        # The view function is in the stacks below its callers
+        assert any("mood (mood_controller.py" in line.rsplit(" ", 1)[0] for line in lines)
+        assert merge_profiles([]) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+from basic_tests import BasicTest
+from models.model_operations import scenario_operations
+from models.model_operations import topic_operations
+from models.model_operations import question_operations
+from models.model_operations import answer_operations
+from models.model_operations import user_operations
+from models.model_operations import vision_operations
+from models.model_operations.question_operations import get_question_by_id
+from models.model_operations.answer_operations import get_answers_by_topic
+from models.model_operations.answer_operations import get_answers_by_scenario
+from models.model_operations.vision_operations import get_visions_by_user
+from models.model import db
+from models.model import QuestionTypeEnum
+import get_prolific_data
+import pandas as pd
+import datetime
+import json
+import unittest
+
+
+def legacy_experiment_data():
+    """The original per-answer implementation of get_prolific_data.py (for regression testing)."""
+    df_list = []
+    for t in topic_operations.get_all_topics():
+        if "Crowdsourcing Experiment" not in t.title: continue
+        scenarios = scenario_operations.get_scenarios_by_topic(t.id)
+        if len(scenarios) != 1: continue
+        s = scenarios[0]
+        sq_list = question_operations.get_questions_by_scenario(s.id)
+        want_q_types = [QuestionTypeEnum.FREE_TEXT, QuestionTypeEnum.SINGLE_CHOICE, QuestionTypeEnum.MULTI_CHOICE]
+        sq_list = [q for q in sq_list if q.question_type in want_q_types]
+        sq_list = sorted(sq_list, key=lambda x: (x.page, x.order))
+        columns = ["user_id", "prolific_id", "mode", "view"] + [sq.text for sq in sq_list]
+        df = pd.Series(index=columns, dtype=object)
+        num_of_q = len(sq_list)
+        has_data = False
+        for ta in get_answers_by_topic(t.id):
+            if ta.secret is None: continue
+            secret = ta.secret
+            prolific_id = secret["user_platform_id"]
+            scenario_id = int(secret["scenario_id"])
+            if scenario_id != s.id: continue
+            user_answers = get_answers_by_scenario(scenario_id, user_id=ta.user_id)
+            user_answers_array = [[u.question_id, u.created_at, u] for u in user_answers]
+            df_user_answers = pd.DataFrame(user_answers_array, columns=["qid", "t", "a"])
+            idx = df_user_answers.groupby(["qid"])["t"].transform(max) == df_user_answers["t"]
+            user_answers = list(df_user_answers[idx]["a"])
+            if len(user_answers) > num_of_q: continue
+            user_visions = get_visions_by_user(ta.user_id, paginate=False, scenario_id=scenario_id)
+            user_motivations = [m for v in user_visions for m in v.medias]
+            row = {"user_id": ta.user_id, "prolific_id": prolific_id, "mode": s.mode, "view": s.view}
+            for a in user_answers:
+                q = get_question_by_id(a.question_id)
+                if q.question_type == QuestionTypeEnum.FREE_TEXT:
+                    row[q.text] = a.text
+                elif q.question_type == QuestionTypeEnum.SINGLE_CHOICE:
+                    row[q.text] = a.choices[0].value
+                elif q.question_type == QuestionTypeEnum.MULTI_CHOICE:
+                    row[q.text] = [c.value for c in a.choices]
+            for i in range(len(user_motivations)):
+                m = user_motivations[i]
+                row["motivation_url_%d"%i] = m.url
+                row["motivation_description_%d"%i] = m.description
+            df = pd.concat([df, pd.Series(row)], axis=1, ignore_index=True)
+            has_data = True
+        if has_data:
+            df_list.append(df.drop(columns=[0]))
+    return pd.concat(df_list, axis=1, ignore_index=True).T
+
+
+class ProlificDataTest(BasicTest):
+    """Test case for exporting the Prolific data."""
+    def setUp(self):
+        db.create_all()
+
+        likert = [{"text": "agree", "value": 1}, {"text": "disagree", "value": 2}]
+        multi = [{"text": "a", "value": 1}, {"text": "b", "value": 2}, {"text": "c", "value": 3}]
+
+        self.users = [user_operations.create_user("user%d" % i) for i in range(6)]
+        self.mood = vision_operations.create_mood("happy")
+        self.topics = []
+        self.scenarios = []
+
+        # Another topic that should be ignored
+        other_topic = topic_operations.create_topic("Other", "other")
+        other_question = question_operations.create_free_text_question("consent", topic_id=other_topic.id)
+        answer_operations.create_free_text_answer("yes", self.users[0].id, other_question.id,
+                secret=json.dumps({"user_platform_id": "p0", "scenario_id": 1}))
+
+        for k, (mode, view) in enumerate([(1, 1), (1, 2)]):
+            topic = topic_operations.create_topic("Crowdsourcing Experiment", "mode %d view %d" % (mode, view))
+            scenario = scenario_operations.create_scenario("s", "d", "i", topic.id, mode=mode, view=view)
+            consent = question_operations.create_free_text_question("consent", topic_id=topic.id)
+            questions = question_operations.create_question_list([
+                {"text": "description", "scenario_id": scenario.id, "is_just_description": True, "page": 0},
+                {"text": "q_free", "scenario_id": scenario.id, "order": 2, "page": 1},
+                {"text": "q_single", "scenario_id": scenario.id, "choices": likert, "order": 1, "page": 1},
+                {"text": "q_multi", "scenario_id": scenario.id, "choices": multi,
+                    "is_mulitple_choice": True, "order": 0, "page": 2},
+                {"text": "vision", "scenario_id": scenario.id, "is_create_vision": True, "page": 2}])
+            _, q_free, q_single, q_multi, _ = questions
+            self.topics.append(topic)
+            self.scenarios.append(scenario)
+
+            for j, user in enumerate(self.users[3*k:3*k+3]):
+                secret = json.dumps({"user_platform_id": "p%d" % user.id, "scenario_id": str(scenario.id)})
+                answer_operations.create_free_text_answer("yes", user.id, consent.id, secret=secret)
+                # Answers without the secret are not from Prolific users
+                answer_operations.create_free_text_answer("yes", user.id, consent.id)
+                t0 = datetime.datetime(2022, 1, 1, 10, j)
+                a = answer_operations.create_free_text_answer("old text %d" % j, user.id, q_free.id)
+                a.created_at = t0
+                a = answer_operations.create_free_text_answer("text %d" % j, user.id, q_free.id)
+                a.created_at = t0 + datetime.timedelta(seconds=30)
+                a = answer_operations.create_choice_answer(q_single.choices[j % 2].id, user.id, q_single.id)
+                a.created_at = t0
+                if j != 2:
+                    choices = [c.id for c in q_multi.choices[j:]]
+                    a = answer_operations.create_choice_answer(choices, user.id, q_multi.id)
+                    a.created_at = t0
+                for v in range(j):
+                    medias = [{"description": "m%d_%d_%d" % (user.id, v, i), "url": "http://u/%d" % i,
+                        "type": "GIF"} for i in range(v + 1)]
+                    vision = vision_operations.create_vision(self.mood.id, medias, user.id, scenario.id)
+                    vision.created_at = t0 + datetime.timedelta(minutes=v)
+                db.session.commit()
+
+        # A Prolific user that reports a wrong scenario
+        secret = json.dumps({"user_platform_id": "wrong", "scenario_id": self.scenarios[1].id})
+        answer_operations.create_free_text_answer("yes", self.users[4].id,
+                self.topics[0].questions[0].id, secret=secret)
+
+    def test_get_experiment_data(self):
+        df = get_prolific_data.get_experiment_data()
+        df_legacy = legacy_experiment_data()
+
+        assert len(df) == 6
+        assert list(df.columns) == list(df_legacy.columns)
+        assert df.to_csv(index=False) == df_legacy.to_csv(index=False)
+
+        row = df[df["prolific_id"] == "p%d" % self.users[1].id].iloc[0]
+        assert row["q_free"] == "text 1"
+        assert row["q_single"] == 2
+        assert row["q_multi"] == [2, 3]
+        assert row["motivation_description_0"] == "m%d_0_0" % self.users[1].id
+
+    def test_get_experiment_data_with_workers(self):
+        df = get_prolific_data.get_experiment_data()
+        df_parallel = get_prolific_data.get_experiment_data(workers=2)
+
+        assert list(df_parallel.columns) == list(df.columns)
+        assert df_parallel.to_csv(index=False) == df.to_csv(index=False)
+
+    def test_no_experiment_data(self):
+        for t in self.topics:
+            t.title = "Finished"
+        db.session.commit()
+
+        assert get_prolific_data.get_experiment_data() is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+from basic_tests import BasicTest
+from controllers import purge_controller
+from config.config import config
+from models.model_operations import answer_operations
+from models.model_operations import game_operations
+from models.model_operations import purge_operations
+from models.model_operations import question_operations
+from models.model_operations import scenario_operations
+from models.model_operations import tombstone_operations
+from models.model_operations import topic_operations
+from models.model_operations import user_operations
+from models.model_operations import vision_operations
+from models.model import db
+from models.model import Answer
+from models.model import Choice
+from models.model import Game
+from models.model import Guess
+from models.model import Media
+from models.model import Question
+from models.model import Scenario
+from models.model import Topic
+from models.model import Vision
+from models.model import answer_choice_table
+from util.util import ValidationError
+from util.util import encode_jwt
+from util.query_counter import count_queries
+import unittest
+
+
+class PurgeTest(BasicTest):
+    """Test case for the bulk deletes and the purge of scenarios and topics."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(purge_controller.bp, url_prefix="/purge")
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+        self.topic = topic_operations.create_topic("test", "test")
+        self.scenario_1 = scenario_operations.create_scenario("t1", "d1", "i1", self.topic.id)
+        self.scenario_2 = scenario_operations.create_scenario("t2", "d2", "i2", self.topic.id)
+        self.mood = vision_operations.create_mood("happy")
+        self.user = user_operations.create_user("user")
+        self.topic_question = question_operations.create_free_text_question("q", topic_id=self.topic.id)
+        for scenario in [self.scenario_1, self.scenario_2]:
+            self.create_scenario_data(scenario.id)
+
+    def create_scenario_data(self, scenario_id):
+        choices = [{"text": "a", "value": 0}, {"text": "b", "value": 1}]
+        question = question_operations.create_single_choice_question("q", choices, scenario_id=scenario_id)
+        answer_operations.create_choice_answer([question.choices[0].id], self.user.id, question.id)
+        medias = [{"description": "d1", "type": "TEXT"}, {"description": "d2", "type": "TEXT"}]
+        vision = vision_operations.create_vision(self.mood.id, medias, self.user.id, scenario_id)
+        game = game_operations.create_game(self.user.id, vision.id)
+        game_operations.submit_game(game.id, self.user.id, "", [self.mood.id])
+
+    def count_rows(self):
+        models = [Topic, Scenario, Question, Choice, Answer, Vision, Media, Game, Guess]
+        counts = {m.__tablename__: m.query.count() for m in models}
+        counts["answers_choice_table"] = db.session.query(answer_choice_table).count()
+        return counts
+
+    def test_remove_question_list(self):
+        # The scenario questions of setUp have answers
+        question_ids = [q.id for q in Question.query.filter(Question.scenario_id.isnot(None)).all()]
+        answer_ids = [a.id for a in Answer.query.order_by(Answer.id).all()]
+        with count_queries() as stats:
+            n = question_operations.remove_question_list(question_ids + [999])
+        assert n == 2
+        # One update of the answers and one delete (and the selects of the IDs in SQLite) no matter how many questions
+        assert stats.count <= 4
+        assert Question.query.count() == 1
+        # The choices and the links of the answers are deleted by the database, and the answers are kept
+        assert Choice.query.count() == 0
+        assert db.session.query(answer_choice_table).count() == 0
+        assert [(a.id, a.question_id) for a in Answer.query.order_by(Answer.id).all()] == [
+                (answer_id, None) for answer_id in answer_ids]
+        assert question_operations.remove_question_list([]) == 0
+        with self.assertRaises(ValidationError):
+            question_operations.remove_question_list(1)
+
+    def test_remove_vision_and_game_list(self):
+        game_ids = [g.id for g in Game.query.all()]
+        assert game_operations.remove_game_list(game_ids) == 2
+        assert Guess.query.count() == 0
+        vision_ids = [v.id for v in Vision.query.all()]
+        assert vision_operations.remove_vision_list(vision_ids) == 2
+        assert Media.query.count() == 0
+        assert [t.row_id for t in tombstone_operations.get_tombstones_by_table("game")] == game_ids
+        assert [t.row_id for t in tombstone_operations.get_tombstones_by_table("vision")] == vision_ids
+        with self.assertRaises(ValidationError):
+            vision_operations.remove_vision(vision_ids[0])
+        with self.assertRaises(ValidationError):
+            game_operations.remove_game(game_ids[0])
+
+    def test_purge_scenario(self):
+        scenario_id = self.scenario_1.id
+        counts = purge_operations.purge_scenario(scenario_id)
+        assert counts == {"answer": 1, "question": 1, "game": 1, "vision": 1, "scenario": 1}
+        # The other scenario is not touched
+        assert self.count_rows() == {"topic": 1, "scenario": 1, "question": 2, "choice": 2, "answer": 1,
+                "vision": 1, "media": 2, "game": 1, "guess": 1, "answers_choice_table": 1}
+        assert len(tombstone_operations.get_tombstones_by_table("answer")) == 1
+        with self.assertRaises(ValidationError):
+            purge_operations.purge_scenario(scenario_id)
+
+    def test_purge_topic(self):
+        counts = purge_operations.purge_topic(self.topic.id)
+        assert counts["question"] == 3
+        assert counts["scenario"] == 2
+        assert counts["topic"] == 1
+        assert set(self.count_rows().values()) == {0}
+        assert len(tombstone_operations.get_tombstones_by_table("vision")) == 2
+
+    def test_purge_endpoint(self):
+        admin_token = encode_jwt({"user_id": self.user.id, "client_type": 0}, config.JWT_PRIVATE_KEY)
+        user_token = encode_jwt({"user_id": self.user.id, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        r = self.client.delete("/purge/", json={"user_token": user_token, "topic_id": self.topic.id})
+        assert r.status_code == 403
+        r = self.client.delete("/purge/", json={"user_token": admin_token})
+        assert r.status_code == 400
+        r = self.client.delete("/purge/", json={"user_token": admin_token, "scenario_id": 999})
+        assert r.status_code == 400
+        r = self.client.delete("/purge/", json={"user_token": admin_token, "topic_id": self.topic.id})
+        assert r.status_code == 200
+        assert r.json["data"]["topic"] == 1
+        assert Topic.query.count() == 0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+from basic_tests import BasicTest
+from controllers import vision_controller
+from controllers import scenario_controller
+from controllers import mood_controller
+from models.model_operations import scenario_operations
+from models.model_operations import topic_operations
+from models.model_operations import user_operations
+from models.model_operations import vision_operations
+from models.model import db
+from models.model import Mood
+from util.query_counter import count_queries
+from flask_sqlalchemy import get_debug_queries
+from util.query_counter import get_statement_shape
+from util.query_counter import init_query_counter
+import unittest
+
+
+class QueryCounterTest(BasicTest):
+    """Test case for counting the SQL queries."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(vision_controller.bp, url_prefix="/vision")
+        app.register_blueprint(scenario_controller.bp, url_prefix="/scenario")
+        app.register_blueprint(mood_controller.bp, url_prefix="/mood")
+        app.config["SQL_DEBUG_HEADERS"] = True
+        app.config["SQL_REPEAT_WARN_COUNT"] = 5
+        # Flask-SQLAlchemy also times the queries when recording them (as in DEBUG and TESTING)
+        app.config["SQLALCHEMY_RECORD_QUERIES"] = True
+        init_query_counter(app)
+        return app
+
+    def setUp(self):
+        db.create_all()
+        topic = topic_operations.create_topic("t", "d")
+        self.scenario_id = scenario_operations.create_scenario("s", "d", "i", topic.id).id
+        self.mood = vision_operations.create_mood("happy")
+        self.user = user_operations.create_user("user")
+        for i in range(10):
+            medias = [{"description": "m%d" % i, "type": "TEXT"}]
+            vision_operations.create_vision(self.mood.id, medias, self.user.id, self.scenario_id)
+        db.session.remove()
+
+    def test_count_queries(self):
+        with count_queries() as stats:
+            Mood.query.all()
+            Mood.query.filter(Mood.id.in_([1, 2, 3])).all()
+            Mood.query.filter(Mood.id.in_([1, 2])).all()
+        assert stats.count == 3
+        assert stats.duration > 0
+        # Queries that only differ in the length of the parameter lists have the same shape
+        assert len(stats.shapes) == 2
+
+    def test_duration_with_recorded_queries(self):
+        with count_queries() as stats:
+            Mood.query.all()
+        # The queries are also recorded by Flask-SQLAlchemy, which must not change the measured duration
+        assert len(get_debug_queries()) >= 1
+        assert 0 < stats.duration < 60
+
+    def test_statement_shape(self):
+        a = get_statement_shape("SELECT * FROM mood WHERE id IN (?, ?, ?)")
+        b = get_statement_shape("SELECT *\n  FROM mood WHERE id IN (%(id_1_1)s, %(id_1_2)s)")
+        assert a == b == "SELECT * FROM mood WHERE id IN (...)"
+
+    def test_debug_headers(self):
+        r = self.client.get("/mood/")
+        assert r.status_code == 200
+        assert int(r.headers["X-DB-Query-Count"]) >= 1
+        assert 0 <= float(r.headers["X-DB-Time-Ms"]) < 60000
+
+    def test_repeated_statement_warning(self):
+        with self.assertLogs(self.app.logger, level="WARNING") as logs:
+            self.client.get("/vision/?paginate=0")
+        assert any("possible N+1 queries" in line for line in logs.output)
+
+    def test_query_budgets(self):
+        # The query budgets of the endpoints (lower them when the endpoints send fewer queries)
+        with self.assertMaxQueries(1):
+            self.client.get("/mood/")
+        with self.assertMaxQueries(1):
+            self.client.get("/scenario/?scenario_id=%d" % self.scenario_id)
+        # The medias are lazy loaded for each vision on the page (one count, one page, and 10 media queries)
+        with self.assertMaxQueries(12):
+            self.client.get("/vision/?paginate=1&pageSize=10")
+
+
+if __name__ == "__main__":
+    unittest.main()
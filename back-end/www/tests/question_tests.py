@@ -2,7 +2,15 @@ from basic_tests import BasicTest
 from models.model_operations import scenario_operations
 from models.model_operations import topic_operations
 from models.model_operations import question_operations
+from models.model_operations import answer_operations
+from models.model_operations import user_operations
 from models.model import db
+from models.model import Answer
+from models.model import answer_choice_table
+from models.model import QuestionTypeEnum
+from util.util import ValidationError
+from urllib.parse import unquote
+import json
 import unittest
 
 
@@ -94,6 +102,56 @@ class QuestionTest(BasicTest):
             question_operations.create_multi_choice_question(
                 text=text, choices=choices, topic_id=topic_id, scenario_id=scenario_id)
 
+    def test_create_question_list_bulk(self):
+        choices = [{"text": "a", "value": 1}, {"text": "b", "value": 2}, {"text": "c", "value": 3}]
+        questions = [
+            {"text": "description", "is_just_description": True, "order": 0, "page": 0},
+            {"text": "free text", "order": 1},
+            {"text": "single", "choices": choices, "order": 2, "shuffle_choices": True},
+            {"text": "multi", "choices": choices, "order": 3, "is_mulitple_choice": True},
+            {"text": "vision", "is_create_vision": True, "order": 4}]
+        for q in questions:
+            q["scenario_id"] = self.scenario.id
+
+        with self.assertMaxQueries(2 + len(questions) + 2) as stats:
+            created = question_operations.create_question_list_bulk(questions)
+
+        # On PostgreSQL, the IDs are allocated from the sequence and the questions are inserted together
+        if db.session.get_bind().dialect.name == "postgresql":
+            assert any("nextval" in shape for shape in stats.shapes)
+            assert sum(n for shape, n in stats.shapes.items() if shape.startswith("INSERT INTO question ")) == 1
+
+        # The questions are the same as the ones created by the ORM path
+        expected = question_operations.create_question_list(questions)
+        assert len(created) == len(expected)
+        for c, e in zip(created, expected):
+            assert c.id != e.id
+            assert (c.text, c.question_type, c.order, c.page, c.shuffle_choices, c.scenario_id) == (
+                    e.text, e.question_type, e.order, e.page, e.shuffle_choices, e.scenario_id)
+            assert [(x.text, x.value) for x in c.choices] == [(x.text, x.value) for x in e.choices]
+        assert created[0].question_type is None
+        assert created[3].question_type == QuestionTypeEnum.MULTI_CHOICE
+        assert question_operations.create_question_list_bulk([]) == []
+
+        # Each question gets its own choices (they are matched by the allocated IDs, not by the order of the rows)
+        many = [{"text": "q%d" % i, "choices": [{"text": "c%d" % i, "value": i}], "scenario_id": self.scenario.id}
+            for i in range(50)]
+        for q in question_operations.create_question_list_bulk(many):
+            assert [c.text for c in q.choices] == ["c" + q.text[1:]]
+
+        # The image choices are encoded like the front-end does
+        image = {"url": "http://url_to_image.com/a b", "description": "café"}
+        q = {"text": "image", "choices": [{"text": image, "value": 1}], "scenario_id": self.scenario.id}
+        text = question_operations.create_question_list_bulk([q])[0].choices[0].text
+        assert text == "%7B%22url%22%3A%22http%3A%2F%2Furl_to_image.com%2Fa%20b%22%2C%22description%22%3A%22caf%C3%A9%22%7D"
+        assert json.loads(unquote(text)) == image
+
+        # Nothing is created if a question is invalid
+        with self.assertRaises(ValidationError):
+            question_operations.create_question_list_bulk([{"text": "t", "scenario_id": self.scenario.id},
+                {"text": "t", "scenario_id": self.scenario.id, "choices": [{"text": "a"}]}])
+        assert len(question_operations.get_questions_by_scenario(self.scenario.id)) == 2 * len(questions) + 51
+
     def test_get_question_by_id(self):
         text = "question"
         scenario_id = self.scenario.id
@@ -183,6 +241,23 @@ class QuestionTest(BasicTest):
 
         assert question not in db.session
 
+    def test_remove_question_with_answers(self):
+        choices = [{"text": "a", "value": 1}, {"text": "b", "value": 2}]
+        question = question_operations.create_single_choice_question(
+            "text", choices=choices, scenario_id=self.scenario.id)
+        user = user_operations.create_user("user")
+        answer = answer_operations.create_choice_answer([question.choices[0].id], user.id, question.id)
+        answer_id = answer.id
+
+        question_operations.remove_question(question.id)
+
+        # The answer is kept without the question and the choices
+        answer = Answer.query.filter_by(id=answer_id).first()
+        assert answer is not None
+        assert answer.question_id is None
+        assert answer.choices == []
+        assert db.session.query(answer_choice_table).count() == 0
+
     def test_update_question(self):
         text = "text"
         scenario_id = self.scenario.id
@@ -0,0 +1,88 @@
+from basic_tests import BasicTest
+from controllers import mood_controller
+from config.config import config
+from models.model import db
+from util.util import encode_jwt
+from util.rate_limit import LocalStore
+from util.rate_limit import init_rate_limit
+from util.rate_limit import refill
+import unittest
+
+
+class RateLimitTest(BasicTest):
+    """Test case for the rate limiting and load shedding."""
+    def create_app(self):
+        app = super().create_app()
+        app.register_blueprint(mood_controller.bp, url_prefix="/mood")
+        app.config["RATE_LIMIT_ENABLED"] = True
+        app.config["RATE_LIMIT_TRUST_PROXY"] = True
+        app.config["RATE_LIMITS"] = {"mood_controller": {"GET": (0.001, 2)}}
+        app.config["MAX_CONCURRENCY"] = {"mood_controller": {"GET": 1}}
+        self.store = LocalStore()
+        init_rate_limit(app, store=self.store)
+        return app
+
+    def setUp(self):
+        db.create_all()
+
+    def test_refill(self):
+        assert refill(None, 0, 1.0, 2, 0) == (1, 0)
+        assert refill(1, 0, 1.0, 2, 0) == (0, 0)
+        tokens, retry_after = refill(0, 0, 1.0, 2, 0.25)
+        assert tokens == 0.25
+        assert retry_after == 0.75
+        # The bucket does not grow over the burst size
+        assert refill(0, 0, 1.0, 2, 100) == (1, 0)
+
+    def test_rate_limit_by_ip(self):
+        headers = {"X-Forwarded-For": "10.0.0.1"}
+        assert self.client.get("/mood/", headers=headers).status_code == 200
+        assert self.client.get("/mood/", headers=headers).status_code == 200
+        r = self.client.get("/mood/", headers=headers)
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+        assert r.json["message"] == "Too many requests."
+        # Only the address that is added by the reverse proxy counts
+        assert self.client.get("/mood/", headers={"X-Forwarded-For": "10.0.0.1, 10.0.0.2"}).status_code == 200
+        # Other methods are not limited
+        assert self.client.post("/mood/", headers=headers).status_code != 429
+
+    def test_untrusted_proxy_header(self):
+        # Without a reverse proxy, the X-Forwarded-For header is set by the client and ignored
+        self.app.config["RATE_LIMIT_TRUST_PROXY"] = False
+        for i in range(2):
+            assert self.client.get("/mood/", headers={"X-Forwarded-For": "10.0.0.%d" % i}).status_code == 200
+        assert self.client.get("/mood/", headers={"X-Forwarded-For": "10.0.0.3"}).status_code == 429
+
+    def test_rate_limit_by_user(self):
+        token_1 = encode_jwt({"user_id": 1, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        token_2 = encode_jwt({"user_id": 2, "client_type": 1}, config.JWT_PRIVATE_KEY)
+        for i in range(2):
+            assert self.client.get("/mood/?user_token=" + token_1).status_code == 200
+        assert self.client.get("/mood/?user_token=" + token_1).status_code == 429
+        # Each user has a bucket
+        assert self.client.get("/mood/?user_token=" + token_2).status_code == 200
+
+    def test_load_shedding(self):
+        self.app.config["RATE_LIMITS"] = {}
+        # Another request of the blueprint is running
+        assert self.store.acquire("concurrency:mood_controller:GET", 1)
+        r = self.client.get("/mood/")
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == "1"
+        # The other methods of the blueprint are not limited
+        assert self.client.post("/mood/").status_code != 503
+        self.store.release("concurrency:mood_controller:GET")
+        assert self.client.get("/mood/").status_code == 200
+        assert self.client.get("/mood/").status_code == 200
+        # The finished requests are not counted
+        assert self.store.counters["concurrency:mood_controller:GET"] == 0
+
+    def test_disabled(self):
+        self.app.config["RATE_LIMIT_ENABLED"] = False
+        for i in range(3):
+            assert self.client.get("/mood/").status_code == 200
+
+
+if __name__ == "__main__":
+    unittest.main()
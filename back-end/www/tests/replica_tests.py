@@ -0,0 +1,98 @@
+from basic_tests import BasicTest
+from models.model_operations import topic_operations
+from models.model_operations import question_operations
+from models.model_operations import answer_operations
+from models.model_operations import user_operations
+from models.model_operations import game_operations
+from models.model import db
+from models.model import Answer
+from models.model import Question
+from models.model import Topic
+from models.model import User
+from models import replica
+from models.replica import use_replica
+from unittest import mock
+import os
+import unittest
+
+
+REPLICA_PATH = "/tmp/cocteau_testing_replica.db"
+
+
+class ReplicaTest(BasicTest):
+    """Test case for routing the read-only queries to the read replica."""
+    def create_app(self):
+        app = super().create_app()
+        app.config["SQLALCHEMY_BINDS"] = {"replica": "sqlite:///" + REPLICA_PATH}
+        app.config["REPLICA_CHECK_INTERVAL"] = 0
+        return app
+
+    def setUp(self):
+        db.create_all()
+        replica.reset_replica_status()
+        self.replica_engine = db.get_engine(self.app, bind="replica")
+        db.Model.metadata.create_all(bind=self.replica_engine)
+
+        topic = topic_operations.create_topic("t", "d")
+        self.question = question_operations.create_free_text_question("q", topic_id=topic.id)
+        self.user = user_operations.create_user("user")
+        answer_operations.create_free_text_answer("on primary", self.user.id, self.question.id)
+
+        # The replica has different data, so that we can see where the queries go
+        with self.replica_engine.begin() as conn:
+            conn.execute(Topic.__table__.insert(), [{"id": topic.id, "title": "t", "description": "d"}])
+            conn.execute(Question.__table__.insert(), [{"id": self.question.id, "text": "q", "topic_id": topic.id}])
+            conn.execute(User.__table__.insert(), [{"id": self.user.id, "client_id": "user"}])
+            conn.execute(Answer.__table__.insert(), [
+                {"id": 101, "text": "on replica", "user_id": self.user.id, "question_id": self.question.id},
+                {"id": 102, "text": "on replica", "user_id": self.user.id, "question_id": self.question.id}])
+
+    def tearDown(self):
+        super().tearDown()
+        db.Model.metadata.drop_all(bind=self.replica_engine)
+        self.replica_engine.dispose()
+        if os.path.exists(REPLICA_PATH):
+            os.remove(REPLICA_PATH)
+
+    def test_read_only_on_replica(self):
+        answers = answer_operations.get_all_answers()
+        assert len(answers) == 2
+        assert all(a.text == "on replica" for a in answers)
+        assert game_operations.get_all_games() == []
+
+        # Other operation functions still use the primary
+        answers = answer_operations.get_answers_by_user(self.user.id)
+        assert len(answers) == 1
+
+    def test_write_on_primary(self):
+        with use_replica():
+            db.session.add(Answer(text="new", user_id=self.user.id, question_id=self.question.id))
+            db.session.commit()
+            assert len(Answer.query.all()) == 2
+        texts = sorted(a.text for a in Answer.query.all())
+        assert texts == ["new", "on primary"]
+
+    def test_fallback_when_lagging(self):
+        with mock.patch.object(replica, "get_replica_lag", return_value=60.0):
+            answers = answer_operations.get_all_answers()
+        assert len(answers) == 1
+        assert answers[0].text == "on primary"
+
+        # The replica is used again after it catches up
+        assert len(answer_operations.get_all_answers()) == 2
+
+    def test_fallback_when_unreachable(self):
+        with mock.patch.object(replica, "get_replica_lag", side_effect=Exception("connection refused")):
+            answers = answer_operations.get_all_answers()
+        assert len(answers) == 1
+        assert answers[0].text == "on primary"
+
+    def test_no_replica(self):
+        self.app.config["SQLALCHEMY_BINDS"] = {}
+        answers = answer_operations.get_all_answers()
+        assert len(answers) == 1
+        assert answers[0].text == "on primary"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,23 @@
 import unittest
+from answer_journal_tests import AnswerJournalTest
 from answer_tests import AnswerTest
+from async_tests import AsyncTest
+from config_tests import ConfigTest
+from error_tests import ErrorTest
+from experiment_tests import ExperimentTest
+from export_parquet_tests import ExportParquetTest
 from game_tests import GameTest
+from health_tests import HealthTest
+from import_time_tests import ImportTimeTest
+from metrics_tests import MetricsTest
+from pool_tests import PoolTest
+from profiler_tests import ProfilerTest
+from prolific_data_tests import ProlificDataTest
+from purge_tests import PurgeTest
+from query_counter_tests import QueryCounterTest
 from question_tests import QuestionTest
+from rate_limit_tests import RateLimitTest
+from replica_tests import ReplicaTest
 from scenario_tests import ScenarioTest
 from topic_tests import TopicTest
 from user_tests import UserTest
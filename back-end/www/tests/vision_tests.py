@@ -3,7 +3,12 @@ from models.model_operations import scenario_operations
 from models.model_operations import topic_operations
 from models.model_operations import user_operations
 from models.model_operations import vision_operations
+from models.model_operations import tombstone_operations
 from models.model import db
+from models.model import Vision
+from models.model import Media
+from util.query_counter import count_queries
+from sqlalchemy.exc import IntegrityError
 import unittest
 
 
@@ -11,6 +16,7 @@ class VisionTest(BasicTest):
     """Test case for visions."""
     def setUp(self):
         db.create_all()
+        vision_operations._recent_visions.clear()
 
         self.topic = topic_operations.create_topic("test", "test")
         self.scenario_1 = scenario_operations.create_scenario(
@@ -66,6 +72,47 @@ class VisionTest(BasicTest):
         for m in vision.medias:
             assert m in db.session
 
+    def test_create_vision_bulk_insert(self):
+        medias = [{"description": "m%d" % i, "type": "TEXT"} for i in range(20)]
+        mood_id, user_id, scenario_id = self.mood.id, self.user_1.id, self.scenario_1.id
+        with count_queries() as stats:
+            vision = vision_operations.create_vision(
+                mood_id=mood_id, medias=medias, user_id=user_id, scenario_id=scenario_id)
+        # One statement for the vision and one for all the medias
+        inserts = [s for s in stats.shapes if s.startswith("INSERT")]
+        assert len(inserts) == 2
+        assert stats.count == 2
+        assert [m.description for m in sorted(vision.medias, key=lambda m: m.order)] == [m["description"] for m in medias]
+
+    def test_create_vision_idempotency_key(self):
+        medias = [{"description": "description", "type": "TEXT"}]
+        vision_1 = vision_operations.create_vision(mood_id=self.mood.id, medias=medias,
+                user_id=self.user_1.id, scenario_id=self.scenario_1.id, idempotency_key="key")
+        vision_1_id = vision_1.id
+        # A retry returns the same vision without writing anything
+        with count_queries() as stats:
+            vision_2 = vision_operations.create_vision(mood_id=self.mood.id, medias=medias,
+                    user_id=self.user_1.id, scenario_id=self.scenario_1.id, idempotency_key="key")
+        assert vision_2.id == vision_1_id
+        assert not any(s.startswith("INSERT") for s in stats.shapes)
+        # The key is also found in the database when it is not in the cache (e.g., another worker)
+        vision_operations._recent_visions.clear()
+        vision_3 = vision_operations.create_vision(mood_id=self.mood.id, medias=medias,
+                user_id=self.user_1.id, scenario_id=self.scenario_1.id, idempotency_key="key")
+        assert vision_3.id == vision_1_id
+        # The keys of different users do not conflict
+        vision_4 = vision_operations.create_vision(mood_id=self.mood.id, medias=medias,
+                user_id=self.user_2.id, scenario_id=self.scenario_1.id, idempotency_key="key")
+        assert vision_4.id != vision_1_id
+        assert Vision.query.count() == 2
+        assert Media.query.count() == 2
+        # The database rejects a duplicated key
+        db.session.add(Vision(mood_id=self.mood.id, user_id=self.user_1.id,
+                scenario_id=self.scenario_2.id, idempotency_key="key"))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
     def test_get_vision_by_id(self):
         medias = [
             {
@@ -253,6 +300,7 @@ class VisionTest(BasicTest):
         assert retrieved_vision.mood_id == new_mood.id
 
         old_medias = vision.medias
+        old_media_ids = [m.id for m in old_medias]
 
         new_medias = [
             {
@@ -272,8 +320,63 @@ class VisionTest(BasicTest):
         assert retrieved_vision.medias[0].description == new_medias[0]["description"]
         assert retrieved_vision.medias[0].media_type.name == new_medias[0]["type"]
 
-        for m in old_medias:
+        # The first media is updated in place, and the others are deleted
+        assert retrieved_vision.medias[0].id == old_media_ids[0]
+        for m in old_medias[1:]:
             assert m not in db.session
+        assert Media.query.count() == 1
+
+    def test_update_vision_diff(self):
+        medias = [{"description": "m%d" % i, "type": "TEXT"} for i in range(5)]
+        vision = vision_operations.create_vision(mood_id=self.mood.id, medias=medias,
+                user_id=self.user_1.id, scenario_id=self.scenario_1.id)
+        vision_id = vision.id
+        media_ids = [m.id for m in vision.medias]
+
+        def count_writes(stats):
+            return {w: sum(n for s, n in stats.shapes.items() if s.startswith(w)) for w in ["UPDATE", "INSERT", "DELETE"]}
+
+        # Move the first media to the end and change a caption (matched by the IDs),
+        # and replace the last media (matched by the position)
+        new_medias = [{"id": media_ids[i], "description": "m%d" % i, "type": "TEXT"} for i in [1, 2, 3, 0]]
+        new_medias[1]["description"] = "changed"
+        new_medias.append({"url": "http://url", "description": "new", "type": "GIF"})
+        # (the other UPDATE sets the updated_at time of the vision)
+        with count_queries() as stats:
+            vision_operations.update_vision(vision_id, medias=new_medias)
+        assert count_writes(stats) == {"UPDATE": 2, "INSERT": 0, "DELETE": 0}
+        retrieved_vision = vision_operations.get_vision_by_id(vision_id)
+        assert [m.description for m in retrieved_vision.medias] == ["m1", "changed", "m3", "m0", "new"]
+        assert [m.order for m in retrieved_vision.medias] == [0, 1, 2, 3, 4]
+        assert [m.id for m in retrieved_vision.medias] == [media_ids[i] for i in [1, 2, 3, 0, 4]]
+        assert retrieved_vision.medias[4].url == "http://url"
+
+        # Nothing is written when nothing changes
+        with count_queries() as stats:
+            vision_operations.update_vision(vision_id, medias=new_medias)
+        assert count_writes(stats) == {"UPDATE": 0, "INSERT": 0, "DELETE": 0}
+
+        # Change a caption and add a media (without the IDs)
+        new_medias = [{"description": m.description, "type": "TEXT"} for m in retrieved_vision.medias[:4]]
+        new_medias[2]["description"] = "changed again"
+        new_medias.append({"url": "http://url", "description": "new", "type": "GIF"})
+        new_medias.append({"description": "added", "type": "TEXT"})
+        with count_queries() as stats:
+            vision_operations.update_vision(vision_id, medias=new_medias)
+        assert count_writes(stats) == {"UPDATE": 2, "INSERT": 1, "DELETE": 0}
+        retrieved_vision = vision_operations.get_vision_by_id(vision_id)
+        assert [m.description for m in retrieved_vision.medias] == ["m1", "changed", "changed again", "m0", "new", "added"]
+        assert [m.id for m in retrieved_vision.medias[:5]] == [media_ids[i] for i in [1, 2, 3, 0, 4]]
+
+        # Remove medias (the INSERT adds the tombstones)
+        removed_ids = sorted(m.id for m in retrieved_vision.medias[2:])
+        with count_queries() as stats:
+            vision_operations.update_vision(vision_id, medias=new_medias[:2])
+        assert count_writes(stats) == {"UPDATE": 1, "INSERT": 1, "DELETE": 1}
+        retrieved_vision = vision_operations.get_vision_by_id(vision_id)
+        assert [m.id for m in retrieved_vision.medias] == [media_ids[1], media_ids[2]]
+        assert Media.query.count() == 2
+        assert sorted(t.row_id for t in tombstone_operations.get_tombstones_by_table("media")) == removed_ids
 
     def test_remove_vision(self):
         medias = [
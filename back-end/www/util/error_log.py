@@ -0,0 +1,107 @@
+"""
+Non-blocking logging for the Flask app.
+
+The log records of the app are put in a queue, and a background thread formats them
+(including the tracebacks) and writes them to the original handlers (e.g., the uwsgi log).
+So a request that logs an error does not wait for the traceback formatting and the disk.
+When the queue is full (e.g., during a flood of errors), the new records are dropped and counted.
+
+The uwsgi workers are forked from the master (lazy-apps = false in uwsgi.ini) and threads do not survive a fork,
+so the background thread is started by the first record that is logged in each process.
+"""
+
+import os
+import copy
+import queue
+import atexit
+import threading
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from prometheus_client import Counter
+
+
+LOG_DROPPED = Counter("log_records_dropped_total",
+        "Number of log records that were dropped because the log queue was full.")
+
+
+class BlockingStopQueueListener(QueueListener):
+    """A QueueListener that waits for space in a full queue to put its stop signal (instead of failing)."""
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    A QueueHandler that starts its own listener thread in each process.
+
+    Parameters
+    ----------
+    handlers : list of logging.Handler
+        The handlers that write the records (in the listener thread).
+    max_size : int
+        Max number of records in the queue.
+    """
+    def __init__(self, handlers, max_size=10000):
+        QueueHandler.__init__(self, queue.Queue(max_size))
+        self.target_handlers = handlers
+        self.max_size = max_size
+        self.listener = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        """Start the listener thread of this process (with a new queue, since a forked queue may be locked)."""
+        self.queue = queue.Queue(self.max_size)
+        self.listener = BlockingStopQueueListener(self.queue, *self.target_handlers, respect_handler_level=True)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        """Write the records in the queue and stop the listener thread."""
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.pid = None
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, the message and the traceback are formatted later in the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+def init_error_log(app, max_size=10000):
+    """
+    Send the log records of a Flask app to the original handlers through a queue.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    max_size : int
+        Max number of records in the queue.
+
+    Returns
+    -------
+    BackgroundQueueHandler
+        The handler that is added to the app logger.
+    """
+    logger = app.logger
+    handlers = list(logger.handlers)
+    for h in handlers:
+        logger.removeHandler(h)
+    handler = BackgroundQueueHandler(handlers, max_size=max_size)
+    logger.addHandler(handler)
+    atexit.register(handler.stop)
+    return handler
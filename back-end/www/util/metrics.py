@@ -0,0 +1,90 @@
+"""
+Request metrics in the Prometheus format.
+
+The latency, status code, and response size of each request are recorded per blueprint and method,
+and the error responses (status code 400 or higher) are counted per endpoint and kind of error.
+When the PROMETHEUS_MULTIPROC_DIR environment variable is set (see uwsgi.ini),
+each uwsgi worker writes its metrics to files in that directory,
+and the /metrics endpoint aggregates the metrics of all workers.
+The directory must be emptied before the server starts.
+"""
+
+import os
+import time
+from flask import g
+from flask import request
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+
+
+REQUEST_COUNT = Counter("http_requests_total",
+        "Number of HTTP requests.", ["blueprint", "method", "status"])
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds",
+        "Time to handle the HTTP requests.", ["blueprint", "method"],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+RESPONSE_SIZE = Histogram("http_response_size_bytes",
+        "Size of the HTTP response bodies.", ["blueprint", "method"],
+        buckets=(100, 1000, 10000, 100000, 1000000, 10000000))
+
+ERROR_COUNT = Counter("http_errors_total",
+        "Number of HTTP error responses (kind: validation, exception, rate_limit, load_shed, or response).", ["endpoint", "status", "kind"])
+
+
+def init_metrics(app):
+    """
+    Record the metrics of all the requests of a Flask app.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    """
+    app.before_request(start_timer)
+    app.after_request(record_request)
+
+
+def start_timer():
+    g.metrics_start_time = time.perf_counter()
+
+
+def record_request(response):
+    start_time = g.pop("metrics_start_time", None)
+    blueprint = request.blueprint or "none"
+    method = request.method
+    status = str(response.status_code)
+    REQUEST_COUNT.labels(blueprint, method, status).inc()
+    if response.status_code >= 400:
+        # The kind is set by try_wrap_response (other error responses are returned by the controllers directly)
+        ERROR_COUNT.labels(request.endpoint or "none", status, g.pop("error_kind", "response")).inc()
+    if start_time is not None:
+        REQUEST_LATENCY.labels(blueprint, method).observe(time.perf_counter() - start_time)
+    size = response.calculate_content_length()
+    if size is not None:
+        RESPONSE_SIZE.labels(blueprint, method).observe(size)
+    return response
+
+
+def get_metrics():
+    """
+    Get the metrics in the Prometheus text format.
+
+    Returns
+    -------
+    data : bytes
+        The metrics (of all the uwsgi workers in the multiprocess mode).
+    content_type : str
+        The content type of the Prometheus text format.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
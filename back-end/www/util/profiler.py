@@ -0,0 +1,111 @@
+"""
+Opt-in profiling of the requests with cProfile.
+
+A request is profiled when:
+    - PROFILER_SAMPLE_RATE is N > 0 in the config (one in every N requests of each process is profiled)
+    - or the request has the X-Profile-Token header with the user token of an administrator
+The profile of each request is saved as a pstats file in [PROFILER_DIR]/[ENDPOINT]/,
+and only the newest PROFILER_MAX_FILES files are kept for each endpoint.
+Use merge_profiles.py to merge the files into collapsed stacks for flame graphs.
+When no request is profiled, the only overhead is a counter and a header lookup in before_request.
+"""
+
+import os
+import time
+import glob
+import cProfile
+import itertools
+from flask import g
+from flask import request
+from flask import current_app
+from util.util import decode_jwt
+
+
+# The header for asking to profile a request (the value is the user token of an administrator)
+PROFILE_HEADER = "X-Profile-Token"
+
+# Number of requests that this process has handled (for the sampling)
+_request_counter = itertools.count(1)
+
+
+def init_profiler(app):
+    """
+    Profile the sampled requests of a Flask app.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    """
+    app.before_request(start_profiler)
+    app.teardown_request(stop_profiler)
+
+
+def should_profile():
+    """Check if the current request should be profiled."""
+    rate = current_app.config.get("PROFILER_SAMPLE_RATE", 0)
+    if rate > 0 and next(_request_counter) % rate == 0:
+        return True
+    token = request.headers.get(PROFILE_HEADER)
+    if token is None:
+        return False
+    try:
+        user_json = decode_jwt(token, current_app.config["JWT_PRIVATE_KEY"])
+    except Exception:
+        return False
+    return user_json.get("client_type") == 0
+
+
+def start_profiler():
+    if should_profile():
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            g.pop("profiler")
+
+
+def stop_profiler(exception=None):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    try:
+        save_profile(profiler, request.endpoint or "none", current_app.config.get("PROFILER_DIR", "profiles"),
+                current_app.config.get("PROFILER_MAX_FILES", 100))
+    except Exception as ex:
+        current_app.logger.warning("Cannot save the profile: %r", ex)
+
+
+def save_profile(profiler, endpoint, profile_dir, max_files):
+    """
+    Save a profile to [profile_dir]/[endpoint]/ and remove the oldest files.
+
+    Parameters
+    ----------
+    profiler : cProfile.Profile
+        The profiler that has stopped.
+    endpoint : str
+        Name of the endpoint (e.g., "vision_controller.vision").
+    profile_dir : str
+        The root directory of the profiles.
+    max_files : int
+        Number of the newest files to keep for the endpoint.
+
+    Returns
+    -------
+    str
+        Path to the saved file.
+    """
+    endpoint_dir = os.path.join(profile_dir, endpoint)
+    os.makedirs(endpoint_dir, exist_ok=True)
+    path = os.path.join(endpoint_dir, "%d-%d.pstats" % (time.time() * 1000000, os.getpid()))
+    profiler.dump_stats(path)
+    files = sorted(glob.glob(os.path.join(endpoint_dir, "*.pstats")), key=os.path.getmtime)
+    for f in files[:max(len(files) - max_files, 0)]:
+        try:
+            os.remove(f)
+        except OSError:
+            pass # removed by another process
+    return path
@@ -0,0 +1,158 @@
+"""
+Counting the SQL queries of each request (for finding slow endpoints and N+1 query patterns).
+
+Each query that is sent to the database (by any engine) is counted with its execution time
+and its statement shape (the SQL text with the parameter lists collapsed).
+After a request, a warning is logged if the request sent too many queries,
+or if the same statement shape was repeated many times (which often means lazy loading in a loop).
+"""
+
+import re
+import time
+import threading
+import collections
+from contextlib import contextmanager
+from flask import g
+from flask import request
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# The collectors that are active in each thread
+_local = threading.local()
+
+# Parameter lists (e.g., "IN (?, ?, ?)") that should count as the same statement shape
+PARAMS_PATTERN = re.compile(r"\((\s*(\?|%\(\w+\)s|:\w+)\s*,?)+\)")
+
+
+class QueryStats(object):
+    """
+    The statistics of the queries that are sent in a block of code.
+
+    Attributes
+    ----------
+    count : int
+        Number of queries.
+    duration : float
+        Total execution time of the queries in seconds.
+    shapes : collections.Counter
+        Number of queries for each statement shape.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = collections.Counter()
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[get_statement_shape(statement)] += 1
+
+    def get_repeated_shapes(self, threshold):
+        """Get the statement shapes that are repeated at least the threshold times, as (shape, count)."""
+        return [(s, n) for s, n in self.shapes.most_common() if n >= threshold]
+
+
+def get_statement_shape(statement):
+    """Collapse the parameter lists in a SQL statement (so that the same query with different lists matches)."""
+    return PARAMS_PATTERN.sub("(...)", " ".join(statement.split()))
+
+
+def get_collectors():
+    if not hasattr(_local, "collectors"):
+        _local.collectors = []
+    return _local.collectors
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries that are sent in this block (in the current thread).
+
+    Examples
+    --------
+    with count_queries() as stats:
+        get_all_visions()
+    print(stats.count, stats.duration)
+    """
+    listen_engines()
+    stats = QueryStats()
+    collectors = get_collectors()
+    collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        collectors.remove(stats)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Keep the start time on the execution context (not the connection),
+    # so that nothing is left behind when the statement raises an error
+    # (the context is None for the statements that SQLAlchemy runs directly, e.g., sequence defaults).
+    # The attribute name must not be "_query_start_time", which Flask-SQLAlchemy sets when recording queries.
+    if context is not None:
+        context._cocteau_query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_time = getattr(context, "_cocteau_query_start", None)
+    duration = 0.0 if start_time is None else time.perf_counter() - start_time
+    for stats in get_collectors():
+        stats.add(statement, duration)
+
+
+def listen_engines():
+    """Count the queries of all engines (only once)."""
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+def init_query_counter(app):
+    """
+    Count the queries of all the requests of a Flask app.
+
+    The following settings are read from the app config:
+    SQL_DEBUG_HEADERS (add the X-DB-Query-Count and X-DB-Time-Ms response headers),
+    SQL_QUERY_WARN_COUNT (warn when a request sends more queries than this),
+    and SQL_REPEAT_WARN_COUNT (warn when a statement shape is repeated this many times in a request).
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    """
+    listen_engines()
+    app.before_request(start_request_stats)
+    app.after_request(check_request_stats)
+    app.teardown_request(stop_request_stats)
+
+
+def start_request_stats():
+    g.query_stats = QueryStats()
+    get_collectors().append(g.query_stats)
+
+
+def stop_request_stats(exception=None):
+    stats = g.pop("query_stats", None)
+    if stats in get_collectors():
+        get_collectors().remove(stats)
+
+
+def check_request_stats(response):
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+    config = current_app.config
+    if config.get("SQL_DEBUG_HEADERS", False):
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = "%.1f" % (stats.duration * 1000)
+    max_count = config.get("SQL_QUERY_WARN_COUNT", 30)
+    if stats.count > max_count:
+        current_app.logger.warning("%s %s sent %d SQL queries (%.1f ms)",
+                request.method, request.full_path, stats.count, stats.duration * 1000)
+    for shape, n in stats.get_repeated_shapes(config.get("SQL_REPEAT_WARN_COUNT", 5)):
+        current_app.logger.warning("%s %s repeated a SQL statement %d times (possible N+1 queries): %s",
+                request.method, request.full_path, n, shape[:300])
+    return response
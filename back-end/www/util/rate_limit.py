@@ -0,0 +1,281 @@
+"""
+Rate limiting and load shedding of the requests, before any database work.
+
+Rate limiting: each user (the user_id in the user token, or the client IP address if there is no valid token)
+has a token bucket for each blueprint and method in the RATE_LIMITS config.
+A request takes a token, and the tokens are refilled at a fixed rate up to the burst size.
+A request without a token gets the status code 429 and a Retry-After header.
+
+Load shedding: the blueprints and methods in the MAX_CONCURRENCY config can only handle a limited number of requests
+at the same time (across all workers), so that the write endpoints cannot take all the uwsgi workers
+and database connections (the read-only methods are not limited unless they are in the config).
+The extra requests get the status code 503 and a Retry-After header.
+
+The client IP address is the address of the TCP connection, or the address that is added to the
+X-Forwarded-For header by the reverse proxy if RATE_LIMIT_TRUST_PROXY is on
+(only turn it on behind a proxy, since the clients can send any X-Forwarded-For header).
+
+Under uwsgi, the buckets and the counters are shared by all workers through the uwsgi cache
+(the "cache2" option in uwsgi.ini) and protected by the uwsgi lock.
+Otherwise (e.g., the flask development server or the tests), they are kept in the memory of the process.
+"""
+
+import os
+import math
+import time
+import threading
+from flask import g
+from flask import request
+from flask import current_app
+from util.util import InvalidUsage
+from util.util import handle_invalid_usage
+from util.util import decode_jwt
+
+
+def refill(tokens, last, rate, burst, now):
+    """
+    Take a token from a bucket.
+
+    Parameters
+    ----------
+    tokens : float
+        Number of tokens in the bucket at the last update (None means a new full bucket).
+    last : float
+        Time of the last update in seconds.
+    rate : float
+        Number of tokens that are added per second.
+    burst : int
+        Max number of tokens in the bucket.
+    now : float
+        The current time in seconds.
+
+    Returns
+    -------
+    tokens : float
+        Number of tokens left in the bucket.
+    retry_after : float
+        Seconds to wait for the next token (zero if a token was taken).
+    """
+    if tokens is None:
+        tokens = burst
+    else:
+        tokens = min(burst, tokens + max(now - last, 0) * rate)
+    if tokens >= 1:
+        return (tokens - 1, 0.0)
+    return (tokens, (1 - tokens) / rate)
+
+
+class LocalStore(object):
+    """
+    The buckets and the concurrency counters in the memory of this process.
+
+    Parameters
+    ----------
+    max_keys : int
+        Max number of buckets (the full ones are removed when there are more).
+    """
+    def __init__(self, max_keys=100000):
+        self.lock = threading.Lock()
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.counters = {}
+
+    def take(self, key, rate, burst):
+        """Take a token from a bucket, and return (allowed, retry_after) (see the refill function)."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (None, now))
+            tokens, retry_after = refill(tokens, last, rate, burst, now)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.prune(now)
+        return (retry_after == 0, retry_after)
+
+    def prune(self, now):
+        # The buckets that were not used for a while are full again (the same as new buckets),
+        # so they can be removed (approximately, since the buckets can have different rates)
+        for key, (tokens, last) in list(self.buckets.items()):
+            if now - last > 60:
+                del self.buckets[key]
+
+    def acquire(self, key, limit):
+        """Count a running request if there are less than limit, and return if it is counted."""
+        with self.lock:
+            n = self.counters.get(key, 0)
+            if n >= limit:
+                return False
+            self.counters[key] = n + 1
+            return True
+
+    def release(self, key):
+        """Stop counting a running request."""
+        with self.lock:
+            self.counters[key] = max(self.counters.get(key, 0) - 1, 0)
+
+
+class UwsgiStore(object):
+    """
+    The buckets and the concurrency counters in the uwsgi cache (shared by all workers).
+
+    The running requests are counted per worker (a worker handles one request at a time),
+    and a worker resets its counters when it starts (e.g., after it is killed in the middle of a request).
+
+    Parameters
+    ----------
+    cache_name : str
+        Name of the uwsgi cache.
+    """
+    def __init__(self, cache_name):
+        import uwsgi
+        self.uwsgi = uwsgi
+        self.cache_name = cache_name
+        self.pid = None
+
+    def get(self, key):
+        value = self.uwsgi.cache_get(key, self.cache_name)
+        return None if value is None else value.decode("utf-8")
+
+    def set(self, key, value, expires=0):
+        self.uwsgi.cache_update(key, value, expires, self.cache_name)
+
+    def take(self, key, rate, burst):
+        """Take a token from a bucket, and return (allowed, retry_after) (see the refill function)."""
+        now = time.time()
+        self.uwsgi.lock()
+        try:
+            value = self.get(key)
+            tokens, last = (None, now) if value is None else map(float, value.split(":"))
+            tokens, retry_after = refill(tokens, last, rate, burst, now)
+            # The bucket is full again (the same as a new bucket) after it expires
+            self.set(key, "%f:%f" % (tokens, now), expires=math.ceil(burst / rate) + 1)
+        finally:
+            self.uwsgi.unlock()
+        return (retry_after == 0, retry_after)
+
+    def worker_key(self, key, worker_id):
+        return "%s:%d" % (key, worker_id)
+
+    def acquire(self, key, limit):
+        """Count a running request if there are less than limit, and return if it is counted."""
+        self.uwsgi.lock()
+        try:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.reset_worker()
+            n = 0
+            for w in range(1, self.uwsgi.numproc + 1):
+                n += int(self.get(self.worker_key(key, w)) or 0)
+            if n >= limit:
+                return False
+            k = self.worker_key(key, self.uwsgi.worker_id())
+            self.set(k, str(int(self.get(k) or 0) + 1))
+            return True
+        finally:
+            self.uwsgi.unlock()
+
+    def release(self, key):
+        """Stop counting a running request."""
+        self.uwsgi.lock()
+        try:
+            k = self.worker_key(key, self.uwsgi.worker_id())
+            self.set(k, str(max(int(self.get(k) or 0) - 1, 0)))
+        finally:
+            self.uwsgi.unlock()
+
+    def reset_worker(self):
+        for blueprint, limits in current_app.config.get("MAX_CONCURRENCY", {}).items():
+            for method in limits:
+                self.set(self.worker_key(concurrency_key(blueprint, method), self.uwsgi.worker_id()), "0")
+
+
+def create_store(app):
+    """Create the uwsgi store if the app runs in uwsgi with the cache, or the local store otherwise."""
+    cache_name = app.config.get("RATE_LIMIT_UWSGI_CACHE", "ratelimit")
+    try:
+        import uwsgi
+    except ImportError:
+        return LocalStore()
+    if "cache2" not in uwsgi.opt:
+        return LocalStore()
+    return UwsgiStore(cache_name)
+
+
+def init_rate_limit(app, store=None):
+    """
+    Limit the requests of a Flask app.
+
+    The following settings are read from the app config:
+    RATE_LIMIT_ENABLED, RATE_LIMITS (the token buckets for each blueprint and method),
+    MAX_CONCURRENCY (max number of running requests for each blueprint and method),
+    and RATE_LIMIT_TRUST_PROXY (use the client IP address that is added by the reverse proxy).
+    This function should be called before adding the other request hooks,
+    so that the rejected requests skip them.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        The Flask application.
+    store : LocalStore or UwsgiStore
+        The store of the buckets and counters (None means choosing one by the create_store function).
+    """
+    app.extensions["rate_limit_store"] = create_store(app) if store is None else store
+    app.before_request(limit_request)
+    app.teardown_request(release_request)
+
+
+def get_client_key():
+    """Get the user ID in the user token (in the JSON body or the URL query), or the client IP address."""
+    rj = request.get_json(silent=True)
+    token = rj.get("user_token") if isinstance(rj, dict) else request.args.get("user_token")
+    if token is not None:
+        try:
+            return "user:%s" % decode_jwt(token, current_app.config["JWT_PRIVATE_KEY"])["user_id"]
+        except Exception:
+            pass # the view function rejects the invalid token
+    if current_app.config.get("RATE_LIMIT_TRUST_PROXY", False):
+        # The last address is added by our reverse proxy (the others can be faked by the client)
+        return "ip:%s" % request.access_route[-1]
+    return "ip:%s" % request.remote_addr
+
+
+def concurrency_key(blueprint, method):
+    """Get the key of the running requests of a blueprint and method (the method "*" means all the other methods)."""
+    return "concurrency:%s:%s" % (blueprint, method)
+
+
+def reject(message, status_code, retry_after, kind):
+    g.error_kind = kind
+    response = handle_invalid_usage(InvalidUsage(message, status_code=status_code))
+    response.headers["Retry-After"] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+def limit_request():
+    config = current_app.config
+    blueprint = request.blueprint
+    if not config.get("RATE_LIMIT_ENABLED", True) or blueprint is None:
+        return None
+    store = current_app.extensions["rate_limit_store"]
+    limits = config.get("RATE_LIMITS", {}).get(blueprint, {})
+    limit = limits.get(request.method, limits.get("*"))
+    if limit is not None:
+        rate, burst = limit
+        key = "bucket:%s:%s:%s" % (blueprint, request.method, get_client_key())
+        allowed, retry_after = store.take(key, rate, burst)
+        if not allowed:
+            return reject("Too many requests.", 429, retry_after, "rate_limit")
+    limits = config.get("MAX_CONCURRENCY", {}).get(blueprint, {})
+    method = request.method if request.method in limits else "*"
+    max_concurrency = limits.get(method)
+    if max_concurrency is not None:
+        key = concurrency_key(blueprint, method)
+        if not store.acquire(key, max_concurrency):
+            return reject("The server is busy.", 503, 1, "load_shed")
+        g.concurrency_key = key
+    return None
+
+
+def release_request(exception=None):
+    key = g.pop("concurrency_key", None)
+    if key is not None:
+        current_app.extensions["rate_limit_store"].release(key)
@@ -1,8 +1,11 @@
 """Utility functions"""
 
+from flask import g
 from flask import jsonify
+from flask import current_app
+from flask import has_request_context
 import jwt
-import traceback
+import uuid
 
 
 class InvalidUsage(Exception):
@@ -20,6 +23,19 @@ class InvalidUsage(Exception):
         return rv
 
 
+class ValidationError(Exception):
+    """
+    An expected error caused by the input (e.g., a missing ID or a wrong field).
+
+    The message is sent to the client, and try_wrap_response does not log the traceback of this error,
+    so that a flood of bad requests stays cheap.
+    """
+    def __init__(self, message, status_code=None):
+        Exception.__init__(self, message)
+        self.message = message
+        self.status_code = status_code
+
+
 def handle_invalid_usage(error):
     """
     Handle the error message of the InvalidUsage class.
@@ -129,15 +145,74 @@ def decode_user_token(request_json, private_key, check_if_admin=True):
 
 
 def try_wrap_response(func, status_code=400):
-    """A decorator that wraps the try-except logic to handle errors."""
+    """
+    A decorator that wraps the try-except logic to handle errors.
+
+    A ValidationError (or InvalidUsage) is returned to the client with its message and without logging.
+    Other exceptions are logged with the traceback (see util/error_log.py),
+    and the client only gets an error ID for finding the traceback in the log.
+    """
     def inner_function(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except Exception as ex:
-            traceback.print_exc()
-            if len(list(ex.args)) > 1:
-                e = InvalidUsage(ex.args[0], status_code=status_code)
-            else:
-                e = InvalidUsage(traceback.format_exc(), status_code=status_code)
+        except (ValidationError, InvalidUsage) as ex:
+            set_error_kind("validation")
+            e = InvalidUsage(ex.message, status_code=getattr(ex, "status_code", None) or status_code)
             return handle_invalid_usage(e)
+        except Exception as ex:
+            return handle_unexpected_error(ex, func.__name__, status_code=status_code)
     return inner_function
+
+
+def handle_unexpected_error(ex, where, status_code=400):
+    """
+    Log an unexpected exception with its traceback and return an error response without the traceback.
+
+    Parameters
+    ----------
+    ex : Exception
+        The exception that is being handled (in an except block).
+    where : str
+        Name of the function that raised the exception (for the log).
+    status_code : int
+        The status code of the response.
+
+    Returns
+    -------
+    flask.Response
+        A response with an error ID for finding the traceback in the log.
+    """
+    set_error_kind("exception")
+    error_id = log_unexpected_error(ex, where)
+    e = InvalidUsage("Unexpected error (error ID: %s)." % error_id, status_code=status_code)
+    return handle_invalid_usage(e)
+
+
+def log_unexpected_error(ex, where, logger=None):
+    """
+    Log an unexpected exception with its traceback (see util/error_log.py).
+
+    Parameters
+    ----------
+    ex : Exception
+        The exception that is being handled (in an except block).
+    where : str
+        Name of the function that raised the exception (for the log).
+    logger : logging.Logger
+        The logger (None means the logger of the current Flask app).
+
+    Returns
+    -------
+    str
+        The error ID for finding the traceback in the log (to be sent to the client).
+    """
+    error_id = uuid.uuid4().hex[:12]
+    logger = current_app.logger if logger is None else logger
+    logger.error("Error %s in %s: %r", error_id, where, ex, exc_info=True)
+    return error_id
+
+
+def set_error_kind(kind):
+    """Record the kind of the error of the current request (a label of the error counter in util/metrics.py)."""
+    if has_request_context():
+        g.error_kind = kind